@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+import sys,os
+import numpy as np
+
+#--from tools
+from tools.config    import load_config, conf
+
+#--from qcdlib
+from qcdlib.mellin   import gen_contour
+
+#--from fitlib
+from fitlib.resman   import RESMAN
+
+class CONTOUR:
+    """
+    inversion errors of the current Mellin contour (conf['mellin contour'] or
+    the default) at the x and z values of the data sets of an input file, and
+    the contour with the fewest nodes within tol, or not worse than the
+    default where it is not within tol (qcdlib.mellin.gen_contour)
+    """
+
+    def __init__(self,inputfile,tol=1e-4,deriv=True):
+        self.inputfile=inputfile
+        self.tol=tol
+        self.deriv=deriv
+
+    def gen_report(self,sites,contours):
+        L=[]
+        L.append('sites: %d  min=%.3e  max=%.6f'%(sites.size,sites.min(),sites.max()))
+        L.append('%10s %6s %6s %8s %12s %12s'%('contour','npts','nodes','zmax','error','deriv error'))
+        for name,mell in contours:
+            error=mell.get_error(sites)
+            derror=mell.get_error(sites,True)
+            L.append('%10s %6d %6d %8.1f %12.3e %12.3e'%(name,mell.npts,mell.N.size,mell.znodes[-1],error,derror))
+        return L
+
+    def run(self):
+        load_config(self.inputfile)
+        resman=RESMAN(parallel=False)
+        sites=resman.get_sites()
+        sites=sites[sites<1]
+        current=conf['mellin']
+        print()
+        if sites.size==0:
+            print('no inversion sites: keeping the current contour')
+            return current
+        proposed=gen_contour(sites,self.tol,self.deriv,current.c)
+        for l in self.gen_report(sites,[('current',current),('proposed',proposed)]): print(l)
+        print("conf['mellin contour']={'npts':%d,'znodes':%s}"%(proposed.npts,proposed.znodes))
+        return proposed
+
+if __name__=='__main__':
+
+    CONTOUR('input_dglap.py').run()
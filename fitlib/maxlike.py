@@ -3,6 +3,11 @@ import sys,os
 import numpy as np
 import time
 import copy
+import multiprocessing
+import threading
+import traceback
+from collections import deque
+from multiprocessing.connection import wait
 
 #--from scipy
 from scipy.optimize  import minimize,leastsq
@@ -20,7 +25,12 @@ from fitlib.resman import RESMAN
 
 class MAXLIKE:
 
-    def __init__(self,inputfile,nworkers=2,verbose=False,msrhook=None,prior=None,seed=None):
+    def __init__(self,inputfile,nworkers=2,verbose=False,msrhook=None,prior=None,seed=None,checkpoint=None):
+        """
+        checkpoint: .msr file updated after every finished step. If it
+                    exists, it is loaded as prior and the chain resumes
+                    after its last finished step.
+        """
 
         self.nworkers=nworkers
         self.inputfile=inputfile
@@ -28,12 +38,15 @@ class MAXLIKE:
         self.msrhook=msrhook
         self.prior=prior
         self.seed=seed
+        self.checkpoint=checkpoint
+        self.reporter=None
 
     def set_counters(self):
         self.chi2tot=1e1000
         self.dchi2=0
         self.t0 = time.time()
         self.cnt=0
+        self.tlast=None
 
     def print_status(self,res,rres,nres):
 
@@ -95,15 +108,117 @@ class MAXLIKE:
             print('%-120s  | %s'%tuple(data))
         return status,parstatus
 
+    def add_optimizer_timeline(self):
+        """
+        time spent by least_squares since the last residuals/jacobian
+        """
+        if self.resman.timeline==None: return
+        if self.tlast!=None: self.resman.timeline.span('optimizer','least_squares',self.tlast)
+
+    #--asynchronous status
+
+    def start_status(self):
+        """
+        conf['status']='async': get_residuals only stores (count,time,res,rres,nres,par)
+                                in a ring buffer; a background thread shows the
+                                latest one every conf['status rate'] seconds
+        conf['status buffer'] : length of the ring buffer
+        """
+        self.reporter=None
+        if 'status' not in conf or conf['status']!='async': return
+        if 'status buffer' in conf: self.snapshots=deque(maxlen=conf['status buffer'])
+        else: self.snapshots=deque(maxlen=100)
+        if 'status rate' in conf: rate=conf['status rate']
+        else: rate=1.0
+        self.segments=self.resman.get_segments()
+        self.status_stop=threading.Event()
+        self.reporter=threading.Thread(target=self.run_status,args=(rate,),daemon=True)
+        self.reporter.start()
+
+    def stop_status(self):
+        if self.reporter==None: return
+        self.status_stop.set()
+        self.reporter.join()
+        self.reporter=None
+
+    def run_status(self,rate):
+        last=None
+        while not self.status_stop.wait(rate):
+            if len(self.snapshots)==0: continue
+            snapshot=self.snapshots[-1]
+            if snapshot[0]==last: continue
+            last=snapshot[0]
+            L=self.gen_status(*snapshot)
+            sys.stdout.write('\033[2J\033[H'+'\n'.join(L)+'\n')
+            sys.stdout.flush()
+
+    def gen_status(self,cnt,t,res,rres,nres,par):
+        """
+        status from a snapshot only: it does not touch the tables
+        """
+        chi2=np.sum(res**2)
+        rchi2=np.sum(rres**2)
+        nchi2=np.sum(nres**2)
+        chi2tot=chi2+rchi2+nchi2
+        chi2min=min([np.sum(_[2]**2)+np.sum(_[3]**2)+np.sum(_[4]**2) for _ in list(self.snapshots)])
+
+        status=[]
+        status.append('JAM FITTER')
+        status.append('count = %d'%cnt)
+        status.append('elapsed time(mins)=%f'%((t-self.t0)/60))
+        status.append('npts    = %d'%res.size)
+        status.append('chi2    = %f'%chi2)
+        status.append('rchi2   = %f'%rchi2)
+        status.append('nchi2   = %f'%nchi2)
+        status.append('chi2tot = %f'%chi2tot)
+        status.append('chi2tot(min in buffer) = %f'%chi2min)
+        status.append('')
+        status.append('%10s %7s %5s %10s %10s %10s %10s'%('reaction','idx','npts','chi2','chi2/npts','rchi2','nchi2'))
+        i=j=0
+        for l in range(len(self.segments)):
+            reaction,k,npts,nr=self.segments[l]
+            _chi2=np.sum(res[i:i+npts]**2)
+            _rchi2=np.sum(rres[j:j+nr]**2)
+            _nchi2=nres[l]**2
+            status.append('%10s %7d %5d %10.2f %10.2f %10.2f %10.2f'%(reaction,k,npts,_chi2,_chi2/max(npts,1),_rchi2,_nchi2))
+            i+=npts
+            j+=nr
+
+        parstatus=[]
+        order=self.parman.order
+        for i in range(len(order)):
+            if order[i][0]==1: parstatus.append('%d %10s  %10s  %10.5e'%(i+1,order[i][1],order[i][2],par[i]))
+            else:              parstatus.append('%d %10s %10s %10d  %10.5e'%(i+1,'norm',order[i][1],order[i][2],par[i]))
+
+        L=[]
+        for i in range(max(len(status),len(parstatus))):
+            data=[]
+            if i<len(status): data.append(status[i])
+            else: data.append('')
+            if i<len(parstatus): data.append(parstatus[i])
+            else: data.append('')
+            L.append('%-120s  | %s'%tuple(data))
+        return L
+
     def get_residuals(self,par):
+        self.add_optimizer_timeline()
         res,rres,nres=self.resman.get_residuals(par)
         self.cnt+=1
-        if  self.cnt%conf['verbose']==0:
+        if  self.reporter!=None:
+            self.snapshots.append((self.cnt,time.time(),res,rres,nres,np.copy(par)))
+        elif  self.cnt%conf['verbose']==0:
             self.print_status(res,rres,nres)
         if len(rres)!=0: res=np.append(res,rres)
         if len(nres)!=0: res=np.append(res,nres)
+        self.tlast=time.time()
         return res
 
+    def get_jacobian(self,par):
+        self.add_optimizer_timeline()
+        jac=self.resman.get_jacobian(par)
+        self.tlast=time.time()
+        return jac
+
     def checklimits(self):
 
         for k in conf['params']:
@@ -252,6 +367,10 @@ class MAXLIKE:
         res,rres,nres    = self.resman.get_residuals(par)
         status,parstatus = self.print_status(res,rres,nres)
         status.extend(parstatus)
+        if self.resman.timeline!=None:
+            status.append('')
+            status.extend(self.resman.timeline.gen_report())
+            self.resman.timeline.save('step-%d.trace.json'%step)
         status=[l+'\n' for l in status]
         fname='step-%d.summary'%step
         F=open(fname,'w')
@@ -274,7 +393,13 @@ class MAXLIKE:
         self.parman.set_new_params(guess,initial=True)
 
         #--run fit
-        fit = least_squares(self.get_residuals, guess,bounds=bounds,method='trf',ftol=conf['ftol'])
+        if 'jacobian' in conf and conf['jacobian']: jac=self.get_jacobian
+        else: jac='2-point'
+        self.start_status()
+        try:
+            fit = least_squares(self.get_residuals, guess,jac=jac,bounds=bounds,method='trf',ftol=conf['ftol'])
+        finally:
+            self.stop_status()
 
         #--generate summary. It will update system with the final results
         self.gen_summary(step,fit.x)
@@ -304,6 +429,92 @@ class MAXLIKE:
         fname='output-%d.py'%istep
         inputmod.gen_input(fname)
 
+    #--multi steps
+
+    def run_step(self,i,conf_bkp,output):
+
+        step=conf['steps'][i]
+        conf.update(copy.deepcopy(conf_bkp))
+        conf.update(self.get_conf(conf_bkp,step))
+
+        print()
+        msg='--step %d: '%i
+        msg+='npQCD objects ='
+        for _ in conf['params'].keys():   msg+=_+' '
+        msg+='datasets ='
+        for _ in conf['datasets'].keys(): msg+=_+' '
+        print(msg)
+
+        par=self.get_par(i,step['dep'])
+        if output: self.gen_output(i)
+        return self.parman.order[:],par[:],self.resman.get_chi2()
+
+    def run_step_process(self,i,nworkers,conf_bkp,output,pipe):
+        self.nworkers=nworkers
+        try:
+            pipe.send(self.run_step(i,conf_bkp,output))
+        except:
+            #--the workers would otherwise keep the failed step alive
+            traceback.print_exc()
+            if 'resman' in self.__dict__: self.resman.shutdown()
+        pipe.close()
+
+    def save_steps(self,chi2,fname):
+        data={'order':self.order,'params':self.params,'chi2':chi2}
+        save(data,fname)
+
+    def run_steps(self,isteps,conf_bkp,output,chi2,fname):
+        """
+        steps in sorted order, each one persisted as soon as it is finished
+        """
+        for i in isteps:
+            self.order[i],self.params[i],chi2[i]=self.run_step(i,conf_bkp,output)
+            self.save_steps(chi2,fname)
+
+    def run_steps_parallel(self,isteps,conf_bkp,output,chi2,fname):
+        """
+        steps whose dependencies are finished run at the same time in forked
+        processes, each one with its own RESMAN on a share of the nworkers
+        """
+        ctx=multiprocessing.get_context('fork')
+        pending=list(isteps)
+        running={}
+        failed=[]
+        while pending or running:
+
+            ready=[i for i in pending if all(_ in self.order for _ in conf['steps'][i]['dep'])]
+            free=self.nworkers-sum([running[_][2] for _ in running])
+            if  len(failed)==0 and len(ready)>0 and free>0:
+                nready=min(len(ready),free)
+                for i in ready[:nready]:
+                    recv,send=ctx.Pipe(duplex=False)
+                    process=ctx.Process(target=self.run_step_process,args=(i,free//nready,conf_bkp,output,send))
+                    process.start()
+                    send.close()
+                    running[i]=(process,recv,free//nready)
+                    pending.remove(i)
+
+            if len(running)==0:
+                if len(failed)==0:
+                    msg='ERR: steps %s depend on steps that are not available'%pending
+                    raise ValueError(msg)
+                break
+
+            #--collect the finished steps
+            for recv in wait([running[_][1] for _ in running]):
+                i=[_ for _ in running if running[_][1] is recv][0]
+                process,recv,n=running.pop(i)
+                try:
+                    self.order[i],self.params[i],chi2[i]=recv.recv()
+                    self.save_steps(chi2,fname)
+                except EOFError:
+                    failed.append(i)
+                process.join()
+
+        if len(failed)>0:
+            msg='ERR: steps %s failed. Finished steps are stored at %s'%(failed,fname)
+            raise RuntimeError(msg)
+
     def run(self):
 
         global conf
@@ -334,40 +545,28 @@ class MAXLIKE:
             self.params={}
             chi2={}
 
-            if self.prior!=None:
-                prior=load(self.prior)
+            prior=self.prior
+            if self.checkpoint!=None and os.path.exists(self.checkpoint): prior=self.checkpoint
+            if prior!=None:
+                prior=load(prior)
                 self.order=prior['order']
                 self.params=prior['params']
                 chi2=prior['chi2']
                 prior_steps=sorted(self.order.keys())
                 isteps=[i for i in isteps if i not in prior_steps]
 
-            for i in isteps:
-                step=conf['steps'][i]
-                conf.update(copy.deepcopy(conf_bkp))
-                conf.update(self.get_conf(conf_bkp,step))
-
-                print()
-                msg='--step %d: '%i
-                msg+='npQCD objects ='
-                for _ in conf['params'].keys():   msg+=_+' '
-                msg+='datasets ='
-                for _ in conf['datasets'].keys(): msg+=_+' '
-                print(msg)
-
-                par=self.get_par(i,step['dep'])
-                self.order[i]=self.parman.order[:]
-                self.params[i]=par[:]
-                chi2[i]=self.resman.get_chi2()
-                if output: self.gen_output(i)
+            #--results file: also updated after every finished step
+            if    self.checkpoint!=None: fname=self.checkpoint
+            elif  self.prior==None:      fname='%s.msr'%id_generator(size=12)
+            else:                        fname=self.prior.split('/')[-1]
 
-            #--store the results from steps
-            data={'order':self.order,'params':self.params,'chi2':chi2}
-            if  self.prior==None:
-                fname='%s.msr'%id_generator(size=12)
+            if 'parallel steps' in conf and conf['parallel steps']:
+                self.run_steps_parallel(isteps,conf_bkp,output,chi2,fname)
             else:
-                fname=self.prior.split('/')[-1]
-            save(data,fname)
+                self.run_steps(isteps,conf_bkp,output,chi2,fname)
+
+            #--store the results from steps
+            self.save_steps(chi2,fname)
 
             #--run hooks
             if 'msr' in conf['hooks']: #--ms==multi steps
@@ -118,8 +118,9 @@ class PARMAN:
 
         #--This is needed so the pion widths get updated
         #--when they are set equal to the proton widths
-        if semaphore['pdf']==1 and 'pdfpi-' in conf['params']: semaphore['pdfpi-']=1
+        if 'pdf' in semaphore and semaphore['pdf']==1 and 'pdfpi-' in conf['params']: semaphore['pdfpi-']=1
 
+        self.semaphore=semaphore
         self.propagate_params(semaphore)
 
     def gen_report(self):
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+import sys,os
+import numpy as np
+import time
+import copy
+import multiprocessing
+
+#--from scipy
+from scipy.optimize  import least_squares
+
+#--from tools
+from tools.tools     import append,truncate_records
+from tools.config    import load_config, conf
+from tools.randomstr import id_generator
+
+#--from fitlib
+from fitlib.resman   import RESMAN
+from fitlib.maxlike  import MAXLIKE
+
+class REPLICAS(MAXLIKE):
+    """
+    bootstrap (conf['bootstrap']) and flat prior (conf['flat par']) replicas
+    with one warm RESMAN: data, precomputed operators and workers are set
+    up once and each replica only resamples the data and/or draws a new
+    guess. The input is fitted as a single step (conf['steps'] is not used).
+
+    Every replica is appended to fname as soon as it is finished
+    (see tools.tools.load_records); replicas already in fname are skipped and
+    a record cut by a crash is dropped before appending.
+    """
+
+    def __init__(self,inputfile,nworkers=2,nreplicas=1,nlanes=1,fname=None,verbose=False,seed=None):
+        """
+        nlanes: number of replicas fitted at the same time, each lane with its
+                own RESMAN on a share of the nworkers
+        seed  : replica i uses np.random.seed(seed+i)
+        """
+        MAXLIKE.__init__(self,inputfile,nworkers,verbose,seed=seed)
+        self.nreplicas=nreplicas
+        self.nlanes=nlanes
+        if fname==None: fname='%s.rep'%id_generator(size=12)
+        self.fname=fname
+
+    def resample(self):
+        for reaction in conf['datasets']:
+            self.resman.get_resobj(reaction).resample()
+        #--the tables were replaced: every theory has to be recomputed
+        self.resman.par_thy=None
+
+    def fit_replica(self,irep):
+
+        if self.seed!=None: np.random.seed(self.seed+irep)
+        if 'bootstrap' in conf and conf['bootstrap']: self.resample()
+        if 'flat par'  in conf and conf['flat par']:  guess=self.parman.gen_flat(setup=False)
+        else:                                         guess=np.copy(self.par0)
+
+        self.set_counters()
+        self.parman.set_new_params(guess,initial=True)
+        if 'jacobian' in conf and conf['jacobian']: jac=self.get_jacobian
+        else: jac='2-point'
+        self.start_status()
+        try:
+            fit = least_squares(self.get_residuals,guess,jac=jac,bounds=self.bounds,method='trf',ftol=conf['ftol'])
+        finally:
+            self.stop_status()
+
+        #--leave the system at the result
+        self.resman.get_residuals(fit.x)
+
+        data={}
+        data['replica'] = irep
+        data['order']   = self.parman.order[:]
+        data['params']  = fit.x
+        data['chi2']    = self.resman.get_chi2()
+        data['nfev']    = fit.nfev
+        data['status']  = fit.status
+        return data
+
+    def run_lane(self,replicas,nworkers,counter=None):
+        """
+        replicas back-to-back on one RESMAN. With counter (shared by the
+        lanes) the next replica is the one at replicas[counter]
+        """
+        self.resman=RESMAN(nworkers)
+        self.parman=self.resman.parman
+        self.par0=np.copy(self.parman.par)
+        self.bounds=self.get_bounds()
+
+        i=-1
+        while 1:
+            if counter==None: i+=1
+            else:
+                with counter.get_lock():
+                    i=counter.value
+                    counter.value+=1
+            if i>=len(replicas): break
+            t=time.time()
+            data=self.fit_replica(replicas[i])
+            data['time']=time.time()-t
+            append(data,self.fname)
+
+        self.resman.shutdown()
+
+    def run(self):
+
+        load_config(self.inputfile)
+        if  self.verbose==False:
+            conf['verbose']=1
+        else:
+            conf['verbose']=self.verbose
+
+        self.checklimits()
+
+        done=[_['replica'] for _ in truncate_records(self.fname)]
+        replicas=[i for i in range(self.nreplicas) if i not in done]
+        nlanes=max(1,min(self.nlanes,len(replicas),self.nworkers))
+
+        if nlanes==1:
+            self.run_lane(replicas,self.nworkers)
+        else:
+            ctx=multiprocessing.get_context('fork')
+            counter=ctx.Value('i',0)
+            processes=[]
+            for ilane in range(nlanes):
+                process=ctx.Process(target=self.run_lane,args=(replicas,self.nworkers//nlanes,counter))
+                process.start()
+                processes.append(process)
+            for process in processes: process.join()
+
+        return self.fname
+
+if __name__=='__main__':
+
+    REPLICAS('input_dglap.py',2,nreplicas=4,nlanes=2,seed=12345).run()
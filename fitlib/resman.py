@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 import sys,os
 import time
+import copy
 import numpy as np
 
 #--from qcdlib
@@ -39,9 +40,20 @@ from fitlib.parman import PARMAN
 from tools.tools    import checkdir
 from tools.config   import conf,load_config
 from tools.parallel import PARALLEL
+from tools.timeline import TIMELINE
 
 class RESMAN:
 
+    #--reactions that provide widths derivatives and those without widths
+    widths_aware=['sidis','sidisEIC','sidisSoLID']
+    widths_free=['AN','ANgam','ANep','moments','SB']
+    #--reactions whose theory is affine in each Mellin-space (pdf2/ff2)
+    #--distribution separately (checked against finite differences; sia is
+    #--quadratic in collins, SB and ANep are not linear)
+    shape_linear=['sidis','AN','ANgam','dy','wz','moments']
+    #--order of the residuals (see collect_residuals)
+    reactions=['sidis','sidisEIC','sidisSoLID','sia','AN','ANgam','ANep','dy','wz','SB','moments']
+
     def __init__(self,nworkers=2,parallel=True,datasets=True):
 
         self.setup_core()
@@ -60,14 +72,20 @@ class RESMAN:
             if 'wz'      in conf['datasets']: self.setup_wz()
             if 'SB'      in conf['datasets']: self.setup_SB()
 
+        self.setup_timeline()
+        if datasets: self.setup_inversion()
+
         if  parallel:
             self.setup_parallel(nworkers)
             self.requests=self.get_requests()
+            self.setup_scheduler()
+            self.setup_dependencies()
 
     def setup_core(self):
 
         conf['aux'] = qcdlib.aux.AUX()
-        conf['mellin']= qcdlib.mellin.MELLIN(npts=16)
+        if 'mellin contour' in conf: conf['mellin']= qcdlib.mellin.MELLIN(**conf['mellin contour'])
+        else:                        conf['mellin']= qcdlib.mellin.MELLIN(npts=16)
         conf['alphaS']= qcdlib.alphaS.ALPHAS()
 
         if 'pdf parametrization' in conf:
@@ -171,6 +189,26 @@ class RESMAN:
         conf['moments tabs']   = obslib.moments.reader.READER().load_data_sets('moments')
         self.momentsres = obslib.moments.residuals.RESIDUALS()
 
+    def setup_inversion(self):
+        """
+        conf['inversion matrices']: tabulate the Mellin inversion matrices at
+        the x and z values of all data sets (MELLIN.set_sites) before the
+        workers are forked, so that the collinear parts of pdf2/ff2 are a
+        matmul of the evolved moments with stored rows
+        """
+        if 'inversion matrices' not in conf or conf['inversion matrices']==False: return
+        conf['mellin'].set_sites(self.get_sites())
+        if 'verbose' in conf and conf['verbose']:
+            print('inversion matrices: %d sites'%conf['mellin'].sites.size)
+
+    def get_sites(self):
+        """
+        x and z values where the data sets evaluate the collinear distributions
+        """
+        sites=[self.get_resobj(reaction).get_sites() for reaction in self.reactions if reaction in conf['datasets']]
+        sites=np.concatenate([np.ravel(_) for _ in sites]+[np.zeros(0)])
+        return sites[(sites>0)&(sites<=1)]
+
     def setup_parallel(self,nworkers):
         self.parallel=PARALLEL()
         self.parallel.task=self.task
@@ -247,8 +285,173 @@ class RESMAN:
         if 'moments' in conf['datasets']:  self.distribute_requests(container,self.momentsres.requests)
         return container
 
+    #--cost aware scheduling
+
+    def setup_scheduler(self):
+        """
+        conf['scheduler']       : 'roundrobin' (default), 'lpt' (one chunk per worker)
+                                  or 'dynamic' (several chunks per worker pulled on demand)
+        conf['scheduler warmup']: number of iterations used to measure the cost
+                                  of each request before the chunks are rebalanced
+        """
+        if 'scheduler' in conf: self.scheduler=conf['scheduler']
+        else: self.scheduler='roundrobin'
+        if 'scheduler warmup' in conf: self.warmup=conf['scheduler warmup']
+        else: self.warmup=2
+        self.costs={}
+        self.niter=0
+        self.idle=np.zeros(self.nworkers)
+
+    def get_request_key(self,request):
+        irow=request['irow']
+        if isinstance(irow,np.ndarray): irow=-1 #--batch requests
+        return (request['reaction'],request['dataset'],irow)
+
+    def update_costs(self,results):
+        for chunk in results:
+            for request in chunk:
+                if 'cost' not in request: continue
+                key=self.get_request_key(request)
+                if key in self.costs: self.costs[key]=0.5*(self.costs[key]+request['cost'])
+                else: self.costs[key]=request['cost']
+        self.idle+=self.parallel.stats['idle']
+        self.niter+=1
+        if self.niter==self.warmup and self.scheduler!='roundrobin': self.balance_requests()
+
+    def balance_requests(self):
+        """
+        longest-processing-time-first: requests sorted by measured cost are
+        assigned to the least loaded chunk. For 'dynamic' there are more chunks
+        than workers and the most expensive ones are sent first.
+        """
+        requests=[request for chunk in self.requests for request in chunk]
+        cost=np.array([self.costs.get(self.get_request_key(_),0) for _ in requests])
+        if self.scheduler=='dynamic': nchunks=min(4*self.nworkers,len(requests))
+        else: nchunks=self.nworkers
+        container=[[] for _ in range(nchunks)]
+        loads=np.zeros(nchunks)
+        for i in np.argsort(cost)[::-1]:
+            j=np.argmin(loads)
+            container[j].append(requests[i])
+            loads[j]+=cost[i]
+        order=np.argsort(loads)[::-1]
+        self.requests=[container[j] for j in order if len(container[j])>0]
+
+    def gen_schedule_report(self):
+        L=[]
+        L.append('scheduler: %s  (iterations=%d)'%(self.scheduler,self.niter))
+        requests={self.get_request_key(_):_ for chunk in self.requests for _ in chunk}
+        #--cost per (reaction,obs): requests, data points (rows) and total
+        cost={}
+        for (reaction,idx,irow),c in self.costs.items():
+            name,npts=reaction,1
+            if (reaction,idx,irow) in requests:
+                request=requests[(reaction,idx,irow)]
+                name,npts=self.get_request_name(request),np.size(request['irow'])
+            key=(reaction,name[len(reaction)+1:])
+            if key not in cost: cost[key]=[0,0,0.0]
+            cost[key][0]+=1
+            cost[key][1]+=npts
+            cost[key][2]+=c
+        L.append('%10s %24s %9s %7s %12s %12s'%('reaction','obs','requests','npts','cost/pt[ms]','total[ms]'))
+        for key in sorted(cost):
+            nreq,npts,c=cost[key]
+            L.append('%10s %24s %9d %7d %12.3f %12.3f'%(key[0],key[1],nreq,npts,c/npts*1e3,c*1e3))
+        L.append('%10s %12s %12s'%('worker','idle[s]','last idle[s]'))
+        for i in range(self.nworkers):
+            L.append('%10d %12.3f %12.3f'%(i,self.idle[i],self.parallel.stats['idle'][i]))
+        return L
+
+    #--timing instrumentation
+
+    def setup_timeline(self):
+        """
+        conf['timeline']           : record the wall time of every phase, task and
+                                     request (see tools.timeline.TIMELINE)
+        conf['timeline max events']: number of spans stored for the trace
+        """
+        self.timeline=None
+        self.names={}
+        if 'timeline' in conf and conf['timeline']:
+            if 'timeline max events' in conf: self.timeline=TIMELINE(conf['timeline max events'])
+            else: self.timeline=TIMELINE()
+
+    def get_request_name(self,request):
+        key=self.get_request_key(request)
+        if key not in self.names:
+            reaction,idx,irow=key
+            tab=self.get_resobj(reaction).tabs[idx]
+            if 'obs' in tab:
+                #--batch requests: all the observables of their rows
+                obs=sorted(set([str(_).strip() for _ in np.atleast_1d(np.asarray(tab['obs'])[request['irow']])]))
+                self.names[key]='%s:%s'%(reaction,'+'.join(obs))
+            else: self.names[key]=reaction
+        return self.names[key]
+
+    def add_tasks_timeline(self,results):
+        """
+        spans of the tasks of the last send_tasks and of their requests
+        """
+        for worker,t0,dt in self.parallel.stats['tasks']:
+            self.timeline.add('task','task',t0,dt,'worker %d'%worker)
+        for chunk in results:
+            if isinstance(chunk,dict): chunk=chunk['requests']
+            for request in chunk:
+                if 't0' not in request: continue
+                args={'dataset':str(request['dataset'])}
+                self.timeline.add('theory',self.get_request_name(request),request['t0'],request['cost'],'worker %d'%request['worker'],args)
+
+    #--incremental recomputation
+
+    def setup_dependencies(self):
+        """
+        conf['incremental']: only the requests that consume a distribution whose
+        parameters changed since the last evaluation are sent to the workers.
+        The others keep the theory stored in the tables.
+        """
+        self.incremental='incremental' in conf and conf['incremental']
+        self.par_thy=None
+        self.deps={}
+        for chunk in self.requests:
+            for request in chunk:
+                key=self.get_request_key(request)
+                self.deps[key]=self.get_resobj(request['reaction']).get_dependencies(request)
+
+    def get_token(self,dist,name):
+        if name.startswith('widths'): return dist+':widths'
+        else: return dist
+
+    def get_changed(self,par):
+        """
+        tokens (see _RESIDUALS.get_dependencies) of the parameters that differ
+        from those of the stored theory (None: everything has to be recomputed)
+        """
+        if self.par_thy is None or len(par)!=len(self.par_thy): return None
+        changed=set()
+        order=self.parman.order
+        for i in range(len(order)):
+            if order[i][0]==1 and par[i]!=self.par_thy[i]: changed.add(self.get_token(order[i][1],order[i][2]))
+        #--see PARMAN.set_new_params
+        if 'pdfpi-' in conf['params']:
+            if 'pdf' in changed: changed.add('pdfpi-')
+            if 'pdf:widths' in changed: changed.add('pdfpi-:widths')
+        return changed
+
+    def select_requests(self,requests,changed):
+        if changed is None: return requests
+        selected=[]
+        for chunk in requests:
+            _chunk=[]
+            for request in chunk:
+                deps=self.deps[self.get_request_key(request)]
+                if deps is None or len(deps&changed)>0: _chunk.append(request)
+            if len(_chunk)>0: selected.append(_chunk)
+        return selected
+
     def task(self,request):
+        if isinstance(request,dict): return self.jac_task(request)
         for i in range(len(request)):
+            t=time.time()
             if  request[i]['reaction']=='sidis' :  self.sidisres.process_request(request[i])
             if  request[i]['reaction']=='sidisEIC' :  self.sidisEICres.process_request(request[i])
             if  request[i]['reaction']=='sidisSoLID' :  self.sidisSoLIDres.process_request(request[i])
@@ -260,13 +463,33 @@ class RESMAN:
             if  request[i]['reaction']=='wz'    :  self.wzres.process_request(request[i])
             if  request[i]['reaction']=='SB'    :  self.SBres.process_request(request[i])
             if  request[i]['reaction']=='moments' :  self.momentsres.process_request(request[i])
+            request[i]['cost']=time.time()-t
+            if self.timeline!=None:
+                request[i]['t0']=t
+                request[i]['worker']=self.parallel.idx
         return request
 
     def get_residuals(self,par):
+        tl=self.timeline
+        t=time.time()
+        if self.incremental: requests=self.select_requests(self.requests,self.get_changed(par))
+        else: requests=self.requests
         self.parman.set_new_params(par)
+        self.par_thy=np.copy(par)
+        if len(requests)==0:
+            out=self.collect_residuals()
+            if tl!=None: tl.span('residuals','residuals',t)
+            return out
         state=self.get_state()
-        self.parallel.update_workers(state)
-        results=self.parallel.send_tasks(self.requests)
+        if 'shared state' in conf and conf['shared state']:
+            self.parallel.broadcast_state(state)
+        else:
+            self.parallel.update_workers(state)
+        if tl!=None: t=tl.span('state','state',t)
+        results=self.parallel.send_tasks(requests)
+        if tl!=None:
+            t=tl.span('dispatch','send_tasks',t)
+            self.add_tasks_timeline(results)
 
         #--update tables with the new theory values
         for chunk in results:
@@ -282,8 +505,15 @@ class RESMAN:
                 if request['reaction']=='wz'     : self.wzres.update_tabs_external(request)
                 if request['reaction']=='SB'     : self.SBres.update_tabs_external(request)
                 if request['reaction']=='moments' : self.momentsres.update_tabs_external(request)
-
-        #--compute residuals
+        self.update_costs(results)
+        out=self.collect_residuals()
+        if tl!=None: tl.span('residuals','residuals',t)
+        return out
+
+    def collect_residuals(self):
+        """
+        residuals from the theory currently stored in the tables
+        """
         res,rres,nres=[],[],[]
         if 'sidis' in conf['datasets']:
             out=self.sidisres.get_residuals(calc=False)
@@ -342,6 +572,240 @@ class RESMAN:
             nres=np.append(nres,out[2])
         return res,rres,nres
 
+    def get_segments(self):
+        """
+        (reaction,idx,npts,nrres) of every dataset in the order of the
+        residuals; each dataset has one entry in nres
+        """
+        segments=[]
+        for reaction in self.reactions:
+            if reaction not in conf['datasets']: continue
+            tabs=self.get_resobj(reaction).tabs
+            for k in tabs: segments.append((reaction,k,len(tabs[k]['value']),len(conf['rparams'][reaction][k])))
+        return segments
+
+    #--jacobian
+
+    def get_resobj(self,reaction):
+        return getattr(self,'%sres'%reaction)
+
+    def set_partial_state(self,state):
+        for k in state: conf[k].set_state(state[k])
+
+    def get_partial_state(self,dists):
+        state=self.get_state()
+        state={k:state[k] for k in state if k in dists or (k[0]=='d' and k[1:] in dists)}
+        return copy.deepcopy(state)
+
+    def jac_task(self,task):
+        """
+        worker side of get_jacobian: either the theory at the perturbed
+        state task['state'] or the derivatives along the widths directions task['dw']
+        """
+        if 'dw' in task:
+            for request in task['requests']:
+                if request['reaction'] in self.widths_free: request['dthy']=0
+                elif request['reaction'] in self.widths_aware:
+                    self.get_resobj(request['reaction']).process_request_jac(request,task['dw'])
+                else: request['dthy']=None
+        else:
+            state0={k:conf[k].get_state() for k in task['state']}
+            self.set_partial_state(task['state'])
+            self.task(task['requests'])
+            self.set_partial_state(state0)
+        return task
+
+    def get_theory_tabs(self):
+        thy={}
+        for reaction in conf['datasets']:
+            tabs=self.get_resobj(reaction).tabs
+            thy[reaction]={k:np.copy(tabs[k]['thy']) for k in tabs}
+        return thy
+
+    def set_theory_tabs(self,thy):
+        for reaction in thy:
+            tabs=self.get_resobj(reaction).tabs
+            for k in thy[reaction]: tabs[k]['thy'][:]=thy[reaction][k]
+
+    def get_residual_vector(self):
+        res,rres,nres=self.collect_residuals()
+        return np.concatenate([res,rres,nres])
+
+    def get_widths_direction(self,par,i,dists):
+        """
+        the widths are linear in the widths parameters: the direction of
+        parameter i is read off from a unit shift
+        """
+        w0={k:(np.copy(conf[k].widths1),np.copy(conf[k].widths2)) for k in dists}
+        _par=np.copy(par)
+        _par[i]+=1
+        self.parman.set_new_params(_par)
+        dw={}
+        for k in dists:
+            dw1=conf[k].widths1-w0[k][0]
+            dw2=conf[k].widths2-w0[k][1]
+            if np.any(dw1!=0) or np.any(dw2!=0): dw[k]=(dw1,dw2)
+        self.parman.set_new_params(par)
+        return dw
+
+    def get_shape_state(self,par,i):
+        """
+        the moments of pdf2/ff2 are linear in the normalizations M1 ('flav N 1'):
+        partial state after a unit shift of parameter i (ties included), whose
+        theory minus the stored one is the exact derivative. None if the
+        shift changes anything else than the M1
+        """
+        dist=self.parman.order[i][1]
+        params0={k:np.copy(conf[dist].params[k]) for k in conf[dist].params}
+        _par=np.copy(par)
+        _par[i]+=1
+        self.parman.set_new_params(_par)
+        state=self.get_partial_state([dist])
+        for k in params0:
+            if np.any(conf[dist].params[k][1:]!=params0[k][1:]): state=None
+        self.parman.set_new_params(par)
+        return state
+
+    def check_shape_jac(self,i):
+        """
+        requests depending on the pdf2/ff2 normalization parameter i, if all of
+        them are affine in its distribution (None otherwise)
+        """
+        _,dist,name=self.parman.order[i]
+        if not name.endswith(' N 1'): return None
+        if not isinstance(conf[dist],(pdf2.PDF,ff2.FF)): return None
+        requests=self.select_requests(self.requests,set([dist]))
+        for chunk in requests:
+            for request in chunk:
+                if request['reaction'] not in self.shape_linear: return None
+                if self.deps[self.get_request_key(request)] is None: return None
+        return requests
+
+    def get_jacobian(self,par):
+        """
+        jacobian of the residuals (res,rres,nres) with respect to par
+        conf['jacobian']='analytic': widths parameters from the derivatives of
+                                     the sidis array kernels when every active
+                                     reaction supports them, and the pdf2/ff2
+                                     normalizations M1 from a unit shift
+                                     (see get_shape_state)
+        conf['jacobian']='batch'   : finite differences only
+        conf['jac step']           : relative step of the finite differences
+        The finite differences of all the theory parameters are sent to the
+        workers as one batch. Normalizations and the widths columns only
+        need the residuals on the master.
+        """
+        par=np.array(par,dtype=float)
+        if not np.array_equal(par,self.parman.par): self.get_residuals(par)
+        t=time.time()
+        thy0=self.get_theory_tabs()
+        r0=self.get_residual_vector()
+
+        if 'jac step' in conf: step=conf['jac step']
+        else: step=np.sqrt(np.finfo(float).eps)
+        order=self.parman.order
+        npar=len(order)
+        h=step*np.maximum(1,np.abs(par))
+        h[par+h>self.parman.pmax]*=-1
+        jac=np.zeros((r0.size,npar))
+
+        #--widths parameters along their directions
+        widths=[]
+        if 'jacobian' in conf and conf['jacobian']=='analytic' and self.check_widths_jac():
+            widths=[i for i in range(npar) if order[i][0]==1 and order[i][2].startswith('widths')]
+        if len(widths)>0:
+            state=self.get_state()
+            dists=[k for k in state if hasattr(conf[k],'widths1')]
+            dw=[self.get_widths_direction(par,i,dists) for i in widths]
+            requests=[[_ for _ in chunk if _['reaction'] in self.widths_aware] for chunk in self.requests]
+            tasks=[{'dw':dw,'requests':chunk} for chunk in requests if len(chunk)>0]
+            results=self.parallel.send_tasks(tasks)
+            if self.timeline!=None: self.add_tasks_timeline(results)
+            results=[request for task in results for request in task['requests']]
+            if any([request['dthy'] is None for request in results]): widths=[]
+            for j in range(len(widths)):
+                i=widths[j]
+                for request in results:
+                    tabs=self.get_resobj(request['reaction']).tabs
+                    tabs[request['dataset']]['thy'][request['irow']]=request['thy']+h[i]*request['dthy'][j]
+                jac[:,i]=(self.get_residual_vector()-r0)/h[i]
+                self.set_theory_tabs(thy0)
+
+        #--normalizations M1 of the Mellin-space shapes: the theory is affine in
+        #--each distribution, so the unit shift gives the exact derivative
+        shapes=[]
+        if 'jacobian' in conf and conf['jacobian']=='analytic':
+            tasks=[]
+            for i in range(npar):
+                if order[i][0]!=1 or i in widths: continue
+                requests=self.check_shape_jac(i)
+                if requests is None: continue
+                state=self.get_shape_state(par,i)
+                if state is None: continue
+                shapes.append(i)
+                tasks.extend([{'jac':i,'state':state,'requests':chunk} for chunk in requests])
+        if len(shapes)>0:
+            results={i:[] for i in shapes}
+            tasks=self.parallel.send_tasks(tasks)
+            if self.timeline!=None: self.add_tasks_timeline(tasks)
+            for task in tasks: results[task['jac']].extend(task['requests'])
+            for i in shapes:
+                for request in results[i]:
+                    reaction,idx=request['reaction'],request['dataset']
+                    irow=request['irow']
+                    tab=self.get_resobj(reaction).tabs[idx]
+                    tab['thy'][irow]=thy0[reaction][idx][irow]+h[i]*(request['thy']-thy0[reaction][idx][irow])
+                jac[:,i]=(self.get_residual_vector()-r0)/h[i]
+                self.set_theory_tabs(thy0)
+
+        #--remaining theory parameters by finite differences in one batch
+        fd=[i for i in range(npar) if order[i][0]==1 and i not in widths+shapes]
+        tasks=[]
+        for i in fd:
+            _par=np.copy(par)
+            _par[i]+=h[i]
+            self.parman.set_new_params(_par)
+            dists=[k for k in self.parman.semaphore if self.parman.semaphore[k]==1]
+            state=self.get_partial_state(dists)
+            changed=set([self.get_token(order[i][1],order[i][2])])
+            if order[i][1]=='pdf' and 'pdfpi-' in conf['params']: changed.add(self.get_token('pdfpi-',order[i][2]))
+            if self.incremental: requests=self.select_requests(self.requests,changed)
+            else: requests=self.requests
+            tasks.extend([{'jac':i,'state':state,'requests':chunk} for chunk in requests])
+        self.parman.set_new_params(par)
+        if len(tasks)>0:
+            results={i:[] for i in fd}
+            tasks=self.parallel.send_tasks(tasks)
+            if self.timeline!=None: self.add_tasks_timeline(tasks)
+            for task in tasks: results[task['jac']].extend(task['requests'])
+            for i in fd:
+                for request in results[i]: self.get_resobj(request['reaction']).update_tabs_external(request)
+                jac[:,i]=(self.get_residual_vector()-r0)/h[i]
+                self.set_theory_tabs(thy0)
+
+        #--normalizations
+        for i in range(npar):
+            if order[i][0]!=2: continue
+            _,k,kk=order[i]
+            conf['datasets'][k]['norm'][kk]['value']=par[i]+h[i]
+            jac[:,i]=(self.get_residual_vector()-r0)/h[i]
+            conf['datasets'][k]['norm'][kk]['value']=par[i]
+
+        #--back to the residuals at par
+        self.collect_residuals()
+        if self.timeline!=None: self.timeline.span('jacobian','jacobian',t)
+        return jac
+
+    def check_widths_jac(self):
+        """
+        analytic widths derivatives are available in the sidis batch mode
+        provided no other reaction depends on the widths
+        """
+        if 'sidis batch' not in conf or conf['sidis batch']==False: return False
+        for reaction in conf['datasets']:
+            if reaction not in self.widths_aware+self.widths_free: return False
+        return True
+
     def get_data_info(self):
 
         #--compute residuals
@@ -424,6 +888,9 @@ class RESMAN:
         print('='*20)
         elapsed_time=time.time()-t
         print('elapsed time :%f'%elapsed_time)
+        for l in self.gen_schedule_report(): print(l)
+        if self.timeline!=None:
+            for l in self.timeline.gen_report(): print(l)
         return elapsed_time
 
     def shutdown(self):
@@ -106,6 +106,11 @@ class Class_Variables():    #Declaring all the class methods that are referenced
     @classmethod
     def uu_value(cls, z, rs, pT, xF): #u
         return CV.U_value(rs, pT, xF) / z
+    @classmethod
+    def kin_values(cls, z, rs, pT, xF): #x,s,t,u for an array of z
+        S, T, U = CV.S_value(rs), CV.T_value(rs, pT, xF), CV.U_value(rs, pT, xF)
+        x = (-1 * U / z) / (S + (T / z))
+        return x, x * S, (x * T) / z, U / z
 
 class Class_Variables_TMC():    #Declaring all the class methods that are referenced throughout
     @classmethod
@@ -138,6 +143,14 @@ class Class_Variables_TMC():    #Declaring all the class methods that are refere
     @classmethod
     def uu_value(cls, z, rs, pT, xF): #u
         return ((pT**2)*(CV.U_value(rs, pT, xF) - (conf['aux'].Mpi**2))) / (z * ((conf['aux'].Mpi**2) + (pT**2)))
+    @classmethod
+    def kin_values(cls, z, rs, pT, xF): #x,s,t,u for an array of z
+        M2, Mpi2 = conf['aux'].M**2, conf['aux'].Mpi**2
+        S, T, U = CV.S_value(rs), CV.T_value(rs, pT, xF), CV.U_value(rs, pT, xF)
+        x = (-1.0 * U / z) / (S + (T / z))
+        root = math.sqrt((M2**2) - ((2.0 * M2) * (Mpi2 + (2.0 * pT * pT) + T)) + ((Mpi2 - T)**2))
+        if T < 0: root = -root
+        return x, x * (S - M2), (x / (2.0 * z)) * (T - M2 - Mpi2 + root), ((pT**2) * (U - Mpi2)) / (z * (Mpi2 + (pT**2)))
 
 
 
@@ -270,17 +283,147 @@ def get_numQS(xF, pT, rs, tar, had):
 def get_numfrag(xF, pT, rs, tar, had):
     return quad(lambda z: get_frag(z, xF, pT, rs, tar, had), CV.zmin_value(rs, pT, xF), 1, limit = 150)[0]
 
+#Fixed-order z-integration
+#conf['ANep integration']: 'quad' (default, adaptive scalar quad), 'gauss' (vectorized
+#                          Gauss-Legendre) or 'validate' (both: returns quad and
+#                          warns where |gauss-quad|>tol*|quad|)
+#conf['ANep nodes']      : initial number of Gauss-Legendre nodes
+#conf['ANep tol']        : relative tolerance: the nodes are doubled until two orders agree
+#                          (and the tolerance of 'validate')
+#conf['ANep max nodes']  : upper limit of the nodes
+
+nodes = {}
+
+def get_nodes(n):
+    if n not in nodes: nodes[n] = np.polynomial.legendre.leggauss(n)
+    return nodes[n]
+
+def get_C_batch(dist, x, Q2):
+    return conf[dist].get_C_batch(x, Q2 * np.ones(x.size))
+
+def get_kin(z, xF, pT, rs): #x and the parameter independent factors of the integrands at an array of z
+    x, ss, tt, uu = CV.kin_values(z, rs, pT, xF)
+    S, T = CV.S_value(rs), CV.T_value(rs, pT, xF)
+    pol = (1/(z**3)) * (1/x) * ((-1 * 4 * pT) / (S + (T/z)))
+    kin = {'x': x}
+    kin['unp'] = (1/(z**2)) * (1/x) * (1/(S + (T/z))) * ((ss**2 + uu**2) / (tt**2))
+    kin['QS'] = pol * (conf['aux'].M / uu) * (0.5 * ss * (ss**2 + uu**2) / (tt**3))
+    kin['frag1'] = pol * (conf['aux'].Mpi / tt) * ((ss * uu) / (tt**2))
+    kin['frag2'] = pol * (conf['aux'].Mpi / tt) * (1/z) * ((ss / (tt**2)) * (uu - ss))
+    return kin
+
+def get_integrands(z, xF, pT, rs, tar, had, kin=None): #unp, pol, QS and frag integrands at an array of z
+    Q2 = CV.Q2_value(pT)
+    if kin == None: kin = get_kin(z, xF, pT, rs)
+    x = kin['x']
+
+    f = get_C_batch('pdf', x, Q2)
+    f1Tp = get_C_batch('sivers', x, Q2) - x * get_C_batch('dsivers', x, Q2)
+    h = get_C_batch('transversity', x, Q2)
+    if tar == 'n':
+        f, f1Tp, h = conf['aux'].p2n(f), conf['aux'].p2n(f1Tp), conf['aux'].p2n(h)
+
+    sign, had = had[-1], had[:-1]
+    if 'pi' in had: ff, col, dcol, Ht = 'ffpi', 'collinspi', 'dcollinspi', 'Htildepi'
+    elif 'k' in had: ff, col, dcol, Ht = 'ffk', 'collinsk', 'dcollinsk', 'Htildek'
+    d = get_C_batch(ff, z, Q2)
+    C = get_C_batch(col, z, Q2)
+    H1p = C - z * get_C_batch(dcol, z, Q2)
+    H = -2. * z * C - get_C_batch(Ht, z, Q2)
+    if sign == '-':
+        d, H1p, H = conf['aux'].charge_conj(d), conf['aux'].charge_conj(H1p), conf['aux'].charge_conj(H)
+    elif sign == '0':
+        d = 0.5 * (d + conf['aux'].charge_conj(d))
+        H1p = 0.5 * (H1p + conf['aux'].charge_conj(H1p))
+        H = 0.5 * (H + conf['aux'].charge_conj(H))
+
+    unp = kin['unp'] * np.einsum('i,ij->j', e2, f * d)
+    QS = kin['QS'] * np.einsum('i,ij->j', e2, d * f1Tp)
+    frag = kin['frag1'] * np.einsum('i,ij->j', e2, h * H1p) + kin['frag2'] * np.einsum('i,ij->j', e2, h * H)
+    return np.array([unp, QS + frag, QS, frag])
+
+#z nodes and get_kin of a data point for n nodes, tabulated once per point
+hard = {}
+
+def get_hard(xF, pT, rs, n):
+    key = (xF, pT, rs, n)
+    if key in hard: return hard[key]
+    zmin = CV.zmin_value(rs, pT, xF)
+    t, w = get_nodes(n)
+    z = 0.5 * (1 - zmin) * t + 0.5 * (1 + zmin)
+    hard[key] = (z, 0.5 * (1 - zmin) * w, get_kin(z, xF, pT, rs))
+    return hard[key]
+
+def setup_hard(xF, pT, rs): #tabulates get_hard for arrays of data points with the initial nodes
+    if 'ANep nodes' in conf: n = conf['ANep nodes']
+    else: n = 32
+    for i in range(len(xF)): get_hard(xF[i], pT[i], rs[i], n)
+
+def _get_integrals(xF, pT, rs, tar, had, n):
+    z, w, kin = get_hard(xF, pT, rs, n)
+    return np.einsum('j,ij->i', w, get_integrands(z, xF, pT, rs, tar, had, kin))
+
+def get_integrals(xF, pT, rs, tar, had): #z-integrals of unp, pol, QS and frag
+    if 'ANep nodes' in conf: n = conf['ANep nodes']
+    else: n = 32
+    tol = get_tol()
+    if 'ANep max nodes' in conf: nmax = conf['ANep max nodes']
+    else: nmax = 512
+    I = _get_integrals(xF, pT, rs, tar, had, n)
+    while 2 * n <= nmax:
+        n *= 2
+        I, I0 = _get_integrals(xF, pT, rs, tar, had, n), I
+        if np.all(np.abs(I - I0) <= tol * np.abs(I)): break
+    return I
+
+def get_mode():
+    if 'ANep integration' in conf: return conf['ANep integration']
+    else: return 'quad'
+
+def get_tol():
+    if 'ANep tol' in conf: return conf['ANep tol']
+    else: return 1e-4
+
+def validate(name, xF, pT, rs, tar, had, AN, _AN): #compares in place (in the process that computes the point)
+    if abs(_AN - AN) > get_tol() * abs(AN):
+        print('ANep %s: gauss=%.6e quad=%.6e at xF=%s pT=%s rs=%s tar=%s had=%s' % (name, _AN, AN, xF, pT, rs, tar, had))
+    return AN
+
 #Calculation of AN total
 def get_AN(xF, pT, rs, tar, had):
-    return get_num(xF, pT, rs, tar, had)/get_denom(xF, pT, rs, tar, had)
+    mode = get_mode()
+    if mode == 'gauss':
+        I = get_integrals(xF, pT, rs, tar, had)
+        return I[1]/I[0]
+    AN = get_num(xF, pT, rs, tar, had)/get_denom(xF, pT, rs, tar, had)
+    if mode == 'validate':
+        I = get_integrals(xF, pT, rs, tar, had)
+        return validate('AN', xF, pT, rs, tar, had, AN, I[1]/I[0])
+    return AN
 
 #Calculation of AN fragmentation
 def get_ANfrag(xF, pT, rs, tar, had):
-    return get_numfrag(xF, pT, rs, tar, had)/get_denom(xF, pT, rs, tar, had)
+    mode = get_mode()
+    if mode == 'gauss':
+        I = get_integrals(xF, pT, rs, tar, had)
+        return I[3]/I[0]
+    AN = get_numfrag(xF, pT, rs, tar, had)/get_denom(xF, pT, rs, tar, had)
+    if mode == 'validate':
+        I = get_integrals(xF, pT, rs, tar, had)
+        return validate('ANfrag', xF, pT, rs, tar, had, AN, I[3]/I[0])
+    return AN
 
 #Calculation of AN Qiu-Sterman
 def get_ANQS(xF, pT, rs, tar, had):
-    return get_numQS(xF, pT, rs, tar, had)/get_denom(xF, pT, rs, tar, had)
+    mode = get_mode()
+    if mode == 'gauss':
+        I = get_integrals(xF, pT, rs, tar, had)
+        return I[2]/I[0]
+    AN = get_numQS(xF, pT, rs, tar, had)/get_denom(xF, pT, rs, tar, had)
+    if mode == 'validate':
+        I = get_integrals(xF, pT, rs, tar, had)
+        return validate('ANQS', xF, pT, rs, tar, had, AN, I[2]/I[0])
+    return AN
 
 if __name__ == '__main__':
 
@@ -21,6 +21,37 @@ class RESIDUALS(_RESIDUALS):
         self.tabs = conf['ANep tabs']
         self.setup()
 
+    def setup(self):
+        _RESIDUALS.setup(self)
+        if ANep_theory.get_mode() != 'quad': self.setup_hard()
+
+    def get_xF(self, k):
+        tab = self.tabs[k]
+        xF = np.array(tab['xF'], dtype=float)
+        col = np.array([_.strip().upper() for _ in tab['col']])
+        xF[(col=='HERMES') | (col=='COMPASS') | (col=='JLAB12')] *= -1
+        return xF
+
+    def setup_hard(self):
+        """
+        z nodes and kinematic factors of every data point for the gauss
+        integration, tabulated once here
+        """
+        for k in self.tabs:
+            ANep_theory.setup_hard(self.get_xF(k), self.tabs[k]['pT'], self.tabs[k]['rs'])
+
+    def get_sites(self):
+        if ANep_theory.get_mode() == 'quad': return np.zeros(0)
+        if 'ANep nodes' in conf: n = conf['ANep nodes']
+        else: n = 32
+        sites = []
+        for k in self.tabs:
+            xF = self.get_xF(k)
+            for i in range(len(xF)):
+                z, w, kin = ANep_theory.get_hard(xF[i], self.tabs[k]['pT'][i], self.tabs[k]['rs'][i], n)
+                sites.extend([kin['x'], z])
+        return np.concatenate(sites)
+
     def _get_theory(self, entry):
         k, i = entry
         xF = self.tabs[k]['xF'][i]
@@ -10,6 +10,7 @@ from tools.tools import load_config
 from qcdlib.aux import AUX
 from tools.config import conf
 from scipy.integrate import quad, dblquad, fixed_quad
+from scipy.special import roots_legendre
 
 
 #AN_theory0.py - program to calculate A_N in pp -> hX
@@ -127,7 +128,7 @@ def get_Hupol(m):
 
 def get_HTffa(m, s, t, u):
   # Hard parts for the transversely polarized fragmentation term
-   HTffa[0] = 0
+   HTffa = np.zeros((13,) + np.shape(s))
    HTffa[1] = - c['r9'] * m['ot'] + c['r8'] * s * (u - s) * m['ot3'] - m['st2'] * m['ou']
    HTffa[2] = c['r27'] * s * (t - u) * m['ot2'] * m['ou'] + c['r9'] * s * (u - 2. * t) * m['ot3'] + s * m['ot2']
    HTffa[3] = c['r27'] * s * m['ot2'] + c['r9'] * s * (t - s) * m['ot3'] - c['r3'] * m['ot']
@@ -144,7 +145,7 @@ def get_HTffa(m, s, t, u):
 
 def get_HTffb(m, s, t, u):
   # Hard parts for the transversely polarized fragmentation term
-   HTffb[0] = 0
+   HTffb = np.zeros((13,) + np.shape(s))
    HTffb[1] = c['r8'] * s * (u - s) * m['ot3'] + 0.5 * c['r9'] * (s - u) * m['ot'] * m['ou'] + 0.5 * (s - u) * (m['t2'] - 2. * t * u - 2. * m['u2']) * m['ot3'] * m['ou']
    HTffb[2] = c['r27'] * 0.5 * s * (t - 3. * u) * m['ot2'] * m['ou'] - s * u * m['ot3'] + c['r9'] * s * (2. * u - t) * m['ot3'] - c['r3'] * 0.5 * m['s2'] * m['ot2'] * m['ou']
    HTffb[3] = c['r27'] * 0.5 * (3. * s - t) * m['ot2'] + m['s2'] * m['ot3'] + c['r9'] * s * (t - 2. * s) * m['ot3'] + c['r3'] * 0.5 * u * m['ot2']
@@ -159,9 +160,19 @@ def get_HTffb(m, s, t, u):
    HTffb[12] = HTffb[6]
    return HTffb
 
+def get_charge(p, had):
+  # Distributions of pi+ turned into the ones of the requested hadron
+  if had.endswith('-'):
+      p = conf['aux'].charge_conj(p)
+
+  elif had.endswith('0'):
+      pp=p
+      pm=conf['aux'].charge_conj(p)
+      p=0.5*(pp+pm)
+
+  return p
+
 def get_Hxxpz(z, Q2, had, m, s, t, u):
-  HTffa = get_HTffa(m, s, t, u)
-  HTffb = get_HTffb(m, s, t, u)
 
   if had=='jet':
       #These are dummy formulas so we don't get a runtime warning
@@ -172,24 +183,18 @@ def get_Hxxpz(z, Q2, had, m, s, t, u):
       H1p = get_H1p(z, Q2, 'pi+')
       H = get_H(z, Q2, 'pi+')
 
-  if had.endswith('-'):
-      H1p = conf['aux'].charge_conj(H1p)
-      H = conf['aux'].charge_conj(H)
-
-  elif had.endswith('0'):
-      H1pp=H1p
-      H1pm=conf['aux'].charge_conj(H1p)
-      Hp=H
-      Hm=conf['aux'].charge_conj(H)
+  H1p = get_charge(H1p, had)
+  H = get_charge(H, had)
 
-      H1p=0.5*(H1pp+H1pm)
-      #print z,2.0*z**2*0.135*H1pp,2.0*z**2*0.135*H1pm,2.0*z**2*0.135*H1p
-      #sys.exit()
-      H=0.5*(Hp+Hm)
+  return get_Hfrag(z, H1p, H, m, s, t, u)
 
-  #print had,z,H1p[1],H1p[3]
+def get_Hfrag(z, H1p, H, m, s, t, u):
+  # Hxxpz[i][j]: hard part i times flavor j of the collinear twist-3 FFs
+  # (also on a grid: H1p,H with shape (11,)+z.shape)
+  return contract_Hfrag(z, H1p, H, get_HTffa(m, s, t, u), get_HTffb(m, s, t, u))
 
-  Hxxpz = np.einsum('i,j->ij', HTffa, H1p) + np.einsum('i,j->ij', HTffb, H) / z
+def contract_Hfrag(z, H1p, H, HTffa, HTffb):
+  Hxxpz = HTffa[:, None] * H1p[None, :] + HTffb[:, None] * H[None, :] / z
   return Hxxpz
 
 def get_HQS(m): #Note there is a 1/u in each hard factor compared to KQVY 2006
@@ -217,49 +222,8 @@ def get_HQS(m): #Note there is a 1/u in each hard factor compared to KQVY 2006
 
     return HQS
 
-#  @profile
-# Calculation of the unpolarized cross section
-def get_dsig(x, z, xF, pT, rs, tar, had):
-
-  M = conf['aux'].M
-  Mh = {}
-  Mh['pi+'] = conf['aux'].Mpi
-  Mh['pi-'] = conf['aux'].Mpi
-  Mh['pi0'] = conf['aux'].Mpi
-  Mh['k+'] = conf['aux'].Mk
-  Mh['k-'] = conf['aux'].Mk
-  Mh['jet']=1 #This is a dummy formula so we don't get a runtime error
-
-  if pT > 1.:
-    Q = pT
-  else:
-    Q = 1.
-
-  Q2 = Q * Q
-
-  xT = 2. * pT / rs
-  xT2 = xT * xT
-  xF2 = xF * xF
-
-  # Mandelstam variables at the hadron level
-  ss = rs * rs
-  tt = -0.5 * ss * (np.sqrt(xF2 + xT2) - xF)
-  uu = -0.5 * ss * (np.sqrt(xF2 + xT2) + xF)
-
-  oz = 1. / z
-
-  xp = -x * tt / (z * x * ss + uu)
-
-  # Mandelstam variables at the parton level
-  s = x * xp * ss
-  t = x * tt * oz
-  u = xp * uu * oz
-
-  # Prefactor
-  denfac = 1. / ((z * z * x * ss + uu * z) * x * xp)
-
-  m=get_mandelstam(s, t, u)
-  Hupol=get_Hupol(m)
+# Flavor sums of the unpolarized cross section (scalars or arrays on a grid)
+def get_upol(f, ft, d, Hupol):
 
   Hupol1 = Hupol[1]
   Hupol2 = Hupol[2]
@@ -276,23 +240,6 @@ def get_dsig(x, z, xF, pT, rs, tar, had):
   Hupol13 = Hupol[13]
   Hupol14 = Hupol[14]
 
-  # Get arrays of the nonperturbative functions
-  #print x,xp
-  f = get_f(x, Q2)
-  ft = get_ft(xp, Q2)
-
-  if had=='jet': d=np.ones(11)
-  else: d = get_d(z, Q2, 'pi+')
-
-  if had.endswith('-'):
-      d = conf['aux'].charge_conj(d)
-
-  elif had.endswith('0'):
-      dp=d
-      dm=conf['aux'].charge_conj(d)
-      d=0.5*(dp+dm)
-      #print z,z*dp,z*dm,z*d
-
   fg = f[0]
   fu = f[1]
   fub = f[2]
@@ -369,70 +316,10 @@ def get_dsig(x, z, xF, pT, rs, tar, had):
 
   upol += fg * (ftub + ftdb + ftsb) * dg * Hupol11
 
-  return denfac * upol
-
-#  @profile
-# Calculation of the fragmentation term in the transversely polarized cross section
-def get_dsigST(x, z, xF, pT, rs, tar, had):
-
-  M = conf['aux'].M
-  Mh = {}
-  Mh['pi+'] = conf['aux'].Mpi
-  Mh['pi-'] = conf['aux'].Mpi
-  Mh['pi0'] = conf['aux'].Mpi
-  Mh['k+'] = conf['aux'].Mk
-  Mh['k-'] = conf['aux'].Mk
-  Mh['jet']= 1 #This is a dummy formula so we don't get a runtime error
-
-  Mh = Mh[had]
-
-  if pT > 1.:
-    Q = pT
-  else:
-    Q = 1.
-
-  Q2 = Q * Q
+  return upol
 
-  xT = 2. * pT / rs
-  xT2 = xT * xT
-  xF2 = xF * xF
-
-  # Mandelstam variables at the hadron level
-  ss = rs * rs
-  tt = -0.5 * ss * (np.sqrt(xF2 + xT2) - xF)
-  uu = -0.5 * ss * (np.sqrt(xF2 + xT2) + xF)
-
-  oz = 1. / z
-
-  xp = -x * tt / (z * x * ss + uu)
-
-  # Mandelstam variables at the parton level
-  s = x * xp * ss
-  t = x * tt * oz
-  u = xp * uu * oz
-
-  # Prefactor
-  numfac = oz * (1. / ((z * z * x * ss + uu * z) * x * xp))
-
-  m=get_mandelstam(s, t, u)
-
-  # Get arrays of the nonperturbative functions
-  f = get_f(x, Q2)
-  ft = get_ft(xp, Q2)
-  h = get_h(x, Q2)
-  f1Tp = get_f1Tp(x, Q2)
-  Hxxpz = get_Hxxpz(z, Q2, had, m, s, t, u)
-
-  if had=='jet': d=np.ones(11)
-  else: d = get_d(z, Q2, 'pi+')
-
-  if had.endswith('-'):
-      d = conf['aux'].charge_conj(d)
-
-  elif had.endswith('0'):
-      dp=d
-      dm=conf['aux'].charge_conj(d)
-      d=0.5*(dp+dm)
+# Flavor sums of the fragmentation and Qiu-Sterman terms (scalars or arrays on a grid)
+def get_pol(h, f1Tp, f, ft, d, Hxxpz, HQS):
 
   hg = h[0]
   hu = h[1]
@@ -539,14 +426,8 @@ def get_dsigST(x, z, xF, pT, rs, tar, had):
 
   ffcs += ftu * (hdb * Hxxpz12db + hsb * Hxxpz12sb) + ftd * (hub * Hxxpz12ub + hsb * Hxxpz12sb) + fts * (hub * Hxxpz12ub + hdb * Hxxpz12db)
 
-  ffcs = 2. * Mh * pT * numfac * ffcs
-
-  if had=='jet': ffcs=0.0
-
-
   #Qiu-Sterman term
 
-  HQS = get_HQS(m)
   sig1 = HQS[1]
   sig2 = HQS[2]
   sig3 = HQS[3]
@@ -586,6 +467,123 @@ def get_dsigST(x, z, xF, pT, rs, tar, had):
 
   QScs += (ubQS+dbQS+sbQS)*ftg*dg*sig12
 
+  return ffcs, QScs
+
+#  @profile
+# Calculation of the unpolarized cross section
+def get_dsig(x, z, xF, pT, rs, tar, had):
+
+  M = conf['aux'].M
+  Mh = {}
+  Mh['pi+'] = conf['aux'].Mpi
+  Mh['pi-'] = conf['aux'].Mpi
+  Mh['pi0'] = conf['aux'].Mpi
+  Mh['k+'] = conf['aux'].Mk
+  Mh['k-'] = conf['aux'].Mk
+  Mh['jet']=1 #This is a dummy formula so we don't get a runtime error
+
+  if pT > 1.:
+    Q = pT
+  else:
+    Q = 1.
+
+  Q2 = Q * Q
+
+  xT = 2. * pT / rs
+  xT2 = xT * xT
+  xF2 = xF * xF
+
+  # Mandelstam variables at the hadron level
+  ss = rs * rs
+  tt = -0.5 * ss * (np.sqrt(xF2 + xT2) - xF)
+  uu = -0.5 * ss * (np.sqrt(xF2 + xT2) + xF)
+
+  oz = 1. / z
+
+  xp = -x * tt / (z * x * ss + uu)
+
+  # Mandelstam variables at the parton level
+  s = x * xp * ss
+  t = x * tt * oz
+  u = xp * uu * oz
+
+  # Prefactor
+  denfac = 1. / ((z * z * x * ss + uu * z) * x * xp)
+
+  m=get_mandelstam(s, t, u)
+  Hupol=get_Hupol(m)
+
+  # Get arrays of the nonperturbative functions
+  #print x,xp
+  f = get_f(x, Q2)
+  ft = get_ft(xp, Q2)
+
+  if had=='jet': d=np.ones(11)
+  else: d = get_charge(get_d(z, Q2, 'pi+'), had)
+
+  return denfac * get_upol(f, ft, d, Hupol)
+
+#  @profile
+# Calculation of the fragmentation term in the transversely polarized cross section
+def get_dsigST(x, z, xF, pT, rs, tar, had):
+
+  M = conf['aux'].M
+  Mh = {}
+  Mh['pi+'] = conf['aux'].Mpi
+  Mh['pi-'] = conf['aux'].Mpi
+  Mh['pi0'] = conf['aux'].Mpi
+  Mh['k+'] = conf['aux'].Mk
+  Mh['k-'] = conf['aux'].Mk
+  Mh['jet']= 1 #This is a dummy formula so we don't get a runtime error
+
+  Mh = Mh[had]
+
+  if pT > 1.:
+    Q = pT
+  else:
+    Q = 1.
+
+  Q2 = Q * Q
+
+  xT = 2. * pT / rs
+  xT2 = xT * xT
+  xF2 = xF * xF
+
+  # Mandelstam variables at the hadron level
+  ss = rs * rs
+  tt = -0.5 * ss * (np.sqrt(xF2 + xT2) - xF)
+  uu = -0.5 * ss * (np.sqrt(xF2 + xT2) + xF)
+
+  oz = 1. / z
+
+  xp = -x * tt / (z * x * ss + uu)
+
+  # Mandelstam variables at the parton level
+  s = x * xp * ss
+  t = x * tt * oz
+  u = xp * uu * oz
+
+  # Prefactor
+  numfac = oz * (1. / ((z * z * x * ss + uu * z) * x * xp))
+
+  m=get_mandelstam(s, t, u)
+
+  # Get arrays of the nonperturbative functions
+  f = get_f(x, Q2)
+  ft = get_ft(xp, Q2)
+  h = get_h(x, Q2)
+  f1Tp = get_f1Tp(x, Q2)
+  Hxxpz = get_Hxxpz(z, Q2, had, m, s, t, u)
+
+  if had=='jet': d=np.ones(11)
+  else: d = get_charge(get_d(z, Q2, 'pi+'), had)
+
+  ffcs, QScs = get_pol(h, f1Tp, f, ft, d, Hxxpz, get_HQS(m))
+
+  ffcs = 2. * Mh * pT * numfac * ffcs
+
+  if had=='jet': ffcs=0.0
+
   QScs= 2. * pT * M * numfac * QScs #Note there is a 1/u in the hard factors
 
   return ffcs + QScs
@@ -653,6 +651,162 @@ def get_sigST(xF, pT, rs, tar, had, mode='gauss', nx=10, nz=10):
     return sig
 
 
+# Array engine: the (x,z) Gauss-Legendre grid of a data point is built once and
+# the hard parts and distributions are evaluated on it as arrays
+
+gauss = {}
+
+def get_gauss(n):
+    if n not in gauss: gauss[n] = roots_legendre(n)
+    return gauss[n]
+
+def get_C_grid(dist, x, Q2):
+    x = np.asarray(x)
+    C = conf[dist].get_C_batch(x.ravel(), np.full(x.size, Q2))
+    return C.reshape((11,) + x.shape)
+
+def get_grid(xF, pT, rs, had, nx, nz):
+    """
+    nodes and weights of the nested fixed_quad of get_sig/get_sigST:
+    x,w with shape (nz,nx) and z with shape (nz,1)
+    """
+    xT = 2. * pT / rs
+    ss = rs * rs
+    tt = -0.5 * ss * (np.sqrt(xF * xF + xT * xT) - xF)
+    uu = -0.5 * ss * (np.sqrt(xF * xF + xT * xT) + xF)
+
+    yx, wx = get_gauss(nx)
+    if had=='jet':
+        z = np.ones(1)
+        wz = np.ones(1)
+    else:
+        zmin = np.sqrt(xF * xF + xT * xT)
+        yz, wz = get_gauss(nz)
+        z = 0.5 * (1. - zmin) * (yz + 1.) + zmin
+        wz = 0.5 * (1. - zmin) * wz
+
+    xmin = (-uu / (z * ss + tt))[:, None]
+    x = 0.5 * (1. - xmin) * (yx + 1.) + xmin
+    w = wz[:, None] * 0.5 * (1. - xmin) * wx
+    return x, z[:, None], w
+
+# Kinematics-only part of get_sig_grid: nodes, prefactors and hard parts of a
+# data point do not depend on the parameters and are tabulated once per point
+
+hard = {}
+
+def get_hard(xF, pT, rs, had, nx=10, nz=10):
+    """
+    tabulated nodes, prefactors and hard parts of (xF,pT,rs) on the (x,z) grid:
+    Hupol with shape (15,nz,nx), HTffa,HTffb,HQS with shape (13,nz,nx)
+    """
+    key = (xF, pT, rs, had=='jet', nx, nz)
+    if key in hard: return hard[key]
+
+    if pT > 1.:
+      Q = pT
+    else:
+      Q = 1.
+
+    xT = 2. * pT / rs
+    xT2 = xT * xT
+    xF2 = xF * xF
+
+    # Mandelstam variables at the hadron level
+    ss = rs * rs
+    tt = -0.5 * ss * (np.sqrt(xF2 + xT2) - xF)
+    uu = -0.5 * ss * (np.sqrt(xF2 + xT2) + xF)
+
+    x, z, w = get_grid(xF, pT, rs, had, nx, nz)
+
+    oz = 1. / z
+
+    xp = -x * tt / (z * x * ss + uu)
+
+    # Mandelstam variables at the parton level
+    s = x * xp * ss
+    t = x * tt * oz
+    u = xp * uu * oz
+
+    # Prefactors
+    denfac = 1. / ((z * z * x * ss + uu * z) * x * xp)
+    numfac = oz * denfac
+
+    m = get_mandelstam(s, t, u)
+    one = np.ones(s.shape)
+    Hupol = get_Hupol(m)
+    HQS = get_HQS(m)
+
+    tab = {}
+    tab['Q2'] = Q * Q
+    tab['x'], tab['xp'], tab['z'], tab['w'] = x, xp, z, w
+    tab['denfac'], tab['numfac'] = denfac, numfac
+    tab['Hupol'] = np.array([0 * one] + [Hupol[i] for i in range(1, 15)])
+    tab['HTffa'] = get_HTffa(m, s, t, u)
+    tab['HTffb'] = get_HTffb(m, s, t, u)
+    tab['HQS'] = np.array([HQS[i] * one for i in range(13)])
+    hard[key] = tab
+    return tab
+
+def setup_hard(xF, pT, rs, had, nx=10, nz=10):
+    """
+    tabulates get_hard for arrays of data points (called at setup so that
+    the workers inherit the tables)
+    """
+    for i in range(len(xF)): get_hard(xF[i], pT[i], rs[i], had[i], nx, nz)
+
+def get_sig_grid(xF, pT, rs, tar, had, nx=10, nz=10):
+    """
+    returns (sigST, sig), i.e. get_sigST and get_sig with mode='gauss',
+    from a single pass over the (x,z) grid
+    """
+    M = conf['aux'].M
+    Mh = {}
+    Mh['pi+'] = conf['aux'].Mpi
+    Mh['pi-'] = conf['aux'].Mpi
+    Mh['pi0'] = conf['aux'].Mpi
+    Mh['k+'] = conf['aux'].Mk
+    Mh['k-'] = conf['aux'].Mk
+    Mh['jet']= 1 #This is a dummy formula so we don't get a runtime error
+
+    Mh = Mh[had]
+
+    tab = get_hard(xF, pT, rs, had, nx, nz)
+    Q2, x, xp, z, w = tab['Q2'], tab['x'], tab['xp'], tab['z'], tab['w']
+
+    # Nonperturbative functions on the grid (x and xp in one call)
+    fx = get_C_grid('pdf', np.array([x, xp]), Q2)
+    f = fx[:, 0]
+    ft = fx[:, 1]
+    h = get_C_grid('transversity', x, Q2)
+    f1Tp = get_C_grid('sivers', x, Q2) - x * get_C_grid('dsivers', x, Q2)
+
+    if had=='jet':
+        d = np.ones((11, 1, 1))
+        H1p = np.ones((11, 1, 1))
+        H = np.ones((11, 1, 1))
+    else:
+        d = get_charge(get_C_grid('ffpi', z, Q2), had)
+        collins = get_C_grid('collinspi', z, Q2)
+        H1p = get_charge(collins - z * get_C_grid('dcollinspi', z, Q2), had)
+        H = get_charge(-2. * z * collins + get_C_grid('Htildepi', z, Q2), had)
+
+    sig = np.sum(w * tab['denfac'] * get_upol(f, ft, d, tab['Hupol']))
+
+    Hxxpz = contract_Hfrag(z, H1p, H, tab['HTffa'], tab['HTffb'])
+    ffcs, QScs = get_pol(h, f1Tp, f, ft, d, Hxxpz, tab['HQS'])
+
+    ffcs = 2. * Mh * pT * tab['numfac'] * ffcs
+
+    if had=='jet': ffcs=0.0
+
+    QScs= 2. * pT * M * tab['numfac'] * QScs #Note there is a 1/u in the hard factors
+
+    sigST = np.sum(w * (ffcs + QScs))
+
+    return sigST, sig
+
+
 if __name__ == '__main__':
 
 
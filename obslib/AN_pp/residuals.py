@@ -21,6 +21,31 @@ class RESIDUALS(_RESIDUALS):
         self.tabs = conf['AN tabs']
         self.setup()
 
+    def setup(self):
+        _RESIDUALS.setup(self)
+        self.setup_hard()
+
+    def setup_hard(self):
+        """
+        nodes and hard parts of every data point, tabulated once here
+        and only contracted with the distributions in the fit loop
+        """
+        for k in self.tabs:
+            tab = self.tabs[k]
+            AN_theory.setup_hard(tab['xF'], tab['pT'], tab['rs'], tab['hadron'], nx=10, nz=10)
+
+    def get_sites(self):
+        sites = []
+        for k in self.tabs:
+            tab = self.tabs[k]
+            for i in range(len(tab['value'])):
+                hard = AN_theory.get_hard(tab['xF'][i], tab['pT'][i], tab['rs'][i], tab['hadron'][i], nx=10, nz=10)
+                sites.extend([hard['x'].ravel(), hard['xp'].ravel(), hard['z'].ravel()])
+        return np.concatenate(sites)
+
+    def get_dependencies(self, request):
+        return set(['pdf', 'ffpi', 'ffk', 'transversity', 'sivers', 'collinspi', 'collinsk', 'Htildepi', 'Htildek'])
+
     def _get_theory(self, entry):
         k, i = entry
         xF = self.tabs[k]['xF'][i]
@@ -32,10 +57,8 @@ class RESIDUALS(_RESIDUALS):
         col = self.tabs[k]['col'][i].strip().upper()
 
         if obs == 'AN':
-            sigST = AN_theory.get_sigST(
-                xF, pT, rs, target, hadron, mode='gauss', nx=10, nz=10)
-            sig = AN_theory.get_sig(
-                xF, pT, rs, target, hadron, mode='gauss', nx=10, nz=10)
+            sigST, sig = AN_theory.get_sig_grid(
+                xF, pT, rs, target, hadron, nx=10, nz=10)
             thy = sigST / sig
 
             #print hadron,xF,thy
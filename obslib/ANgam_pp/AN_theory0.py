@@ -10,6 +10,7 @@ from tools.tools import load_config
 from qcdlib.aux import AUX
 from tools.config import conf
 from scipy.integrate import quad, dblquad, fixed_quad
+from scipy.special import roots_legendre
 
 
 #This includes the SFP term to AN in pp -> gam X (see 1410.3448)
@@ -163,6 +164,24 @@ C_F = 4.0/3.0
 N_C = 3.0
 ################################################################################
 
+# Prefactors and hard parts at x (scalar or array over x): they depend only on
+# the kinematics and are shared by the denominator and the numerators
+def get_kin(x, xF, pT, rs):
+
+  M = conf['aux'].M
+
+  kin = {}
+  kin['denfac'] = (1. / (N_C * (x * CV.S_value(rs) + CV.U_value(rs, xF, pT)))) * (1. / (x * CV.xp_value(rs, xF, pT, x)))
+  kin['numfac'] = (2.0 * M * pT) * (1. / (x * CV.xp_value(rs, xF, pT, x))) / (x * CV.S_value(rs) + CV.U_value(rs, xF, pT))
+  kin['ouu'] = 1. / CV.uu_value(rs, xF, pT, x)
+
+  #calling mandelstam variables
+  m=get_mandelstam(rs, xF, pT, x)
+  #Calling Hard Factors
+  HPall=get_HPall(m)
+  kin['HPall'] = np.array([0 * x] + [HPall[i] for i in range(1, 9)])
+  return kin
+
 #  @profile
 # Calculation of the unpolarized cross section
 def get_upolden(x, xF, pT, rs):
@@ -174,22 +193,24 @@ def get_upolden(x, xF, pT, rs):
 
   Q2 = Q * Q
 
-  M = conf['aux'].M
   xp = -x * CV.T_value(rs, xF, pT) / (x * CV.S_value(rs) + CV.U_value(rs, xF, pT))
-  # Prefactor
-  denfac = (1. / (N_C * (x * CV.S_value(rs) + CV.U_value(rs, xF, pT)))) * (1. / (x * CV.xp_value(rs, xF, pT, x)))
 
-  #calling mandelstam variables
-  m=get_mandelstam(rs, xF, pT, x)
+  return _get_upolden(x, xF, pT, rs, get_f(x,Q2), get_ft(xp,Q2))
 
-  #Calling Hard Factors
-  HPall=get_HPall(m)
+# Unpolarized cross section from the sampled distributions (scalars or arrays over x)
+def _get_upolden(x, xF, pT, rs, f, ft, kin=None):
+
+  if kin==None: kin=get_kin(x, xF, pT, rs)
+  # Prefactor
+  denfac = kin['denfac']
+
+  #Hard Factors
+  HPall=kin['HPall']
   HPall1 = HPall[6]
   HPall2 = HPall[7]
   HPall3 = HPall[8]
 
-  # Get arrays of the nonperturbative functions
-  ft = get_ft(xp,Q2)
+  # Arrays of the nonperturbative functions
   ftg = ft[0]
   ftu = ft[1]
   ftub = ft[2]
@@ -198,7 +219,6 @@ def get_upolden(x, xF, pT, rs):
   fts = ft[5]
   ftsb = ft[6]
 
-  f = get_f(x,Q2)
   fg = f[0]
   fu = f[1]
   fub = f[2]
@@ -235,24 +255,26 @@ def get_polnum_SFP(x, xF, pT, rs):
 
   Q2 = Q * Q
 
-  M = conf['aux'].M
+  xp = -x * CV.T_value(rs, xF, pT) / (x * CV.S_value(rs) + CV.U_value(rs, xF, pT))
+
+  return _get_polnum_SFP(x, xF, pT, rs, get_f(x,Q2), get_ft(xp,Q2), get_G(x,Q2))
+
+# SFP numerator from the sampled distributions (scalars or arrays over x)
+def _get_polnum_SFP(x, xF, pT, rs, f, ft, G, kin=None):
 
+  if kin==None: kin=get_kin(x, xF, pT, rs)
   # Prefactor
-  numfac = (2.0 * M * pT) * (1. / (x * CV.xp_value(rs, xF, pT, x))) / (x * CV.S_value(rs) + CV.U_value(rs, xF, pT))
+  numfac = kin['numfac']
 
-  #calling mandelstam variables
-  m=get_mandelstam(rs, xF, pT, x)
-  xp = -x * CV.T_value(rs, xF, pT) / (x * CV.S_value(rs) + CV.U_value(rs, xF, pT))
-  #Calling Hard Factors
-  HPall=get_HPall(m)
+  #Hard Factors
+  HPall=kin['HPall']
   HPall1 = HPall[1]
   HPall2 = HPall[2]
   HPall3 = HPall[3]
   HPall4 = HPall[4]
   HPall5 = HPall[5]
 
-  # Get arrays of the nonperturbative functions
-  ft = get_ft(xp,Q2)
+  # Arrays of the nonperturbative functions
   ftg = ft[0]
   ftu = ft[1]
   ftub = ft[2]
@@ -261,7 +283,6 @@ def get_polnum_SFP(x, xF, pT, rs):
   fts = ft[5]
   ftsb = ft[6]
 
-  f = get_f(x,Q2)
   fg = f[0]
   fu = f[1]
   fub = f[2]
@@ -270,7 +291,6 @@ def get_polnum_SFP(x, xF, pT, rs):
   fs = f[5]
   fsb = f[6]
 
-  G = get_G(x,Q2)
   Gg = G[0]
   Gu = G[1]
   Gub = G[2]
@@ -305,22 +325,25 @@ def get_polnum_SGP(x, xF, pT, rs):
 
   Q2 = Q * Q
 
-  M = conf['aux'].M
+  xp = -x * CV.T_value(rs, xF, pT) / (x * CV.S_value(rs) + CV.U_value(rs, xF, pT))
+
+  return _get_polnum_SGP(x, xF, pT, rs, get_f(x,Q2), get_ft(xp,Q2), get_f1Tp(x,Q2))
+
+# SGP numerator from the sampled distributions (scalars or arrays over x)
+def _get_polnum_SGP(x, xF, pT, rs, f, ft, f1Tp, kin=None):
 
+  if kin==None: kin=get_kin(x, xF, pT, rs)
   # Prefactor
-  numfac = (-2.0 * M * pT) * (1. / (x * CV.xp_value(rs, xF, pT, x))) / (x * CV.S_value(rs) + CV.U_value(rs, xF, pT))
+  numfac = -kin['numfac']
 
-  #calling mandelstam variables
-  m=get_mandelstam(rs, xF, pT, x)
-  xp = -x * CV.T_value(rs, xF, pT) / (x * CV.S_value(rs) + CV.U_value(rs, xF, pT))
-  #Calling Hard Factors
-  HPall=get_HPall(m)
+  #Hard Factors
+  HPall=kin['HPall']
+  ouu = kin['ouu']
   HPall1 = HPall[6]
   HPall2 = HPall[7]
   HPall3 = HPall[8]
 
-  # Get arrays of the nonperturbative functions
-  ft = get_ft(xp,Q2)
+  # Arrays of the nonperturbative functions
   ftg = ft[0]
   ftu = ft[1]
   ftub = ft[2]
@@ -329,7 +352,6 @@ def get_polnum_SGP(x, xF, pT, rs):
   fts = ft[5]
   ftsb = ft[6]
 
-  f = get_f(x,Q2)
   fg = f[0]
   fu = f[1]
   fub = f[2]
@@ -338,27 +360,27 @@ def get_polnum_SGP(x, xF, pT, rs):
   fs = f[5]
   fsb = f[6]
 
-  uQS = get_f1Tp(x,Q2)[1]
-  ubQS = get_f1Tp(x,Q2)[2]
-  dQS = get_f1Tp(x,Q2)[3]
-  dbQS = get_f1Tp(x,Q2)[4]
-  sQS = get_f1Tp(x,Q2)[5]
-  sbQS = get_f1Tp(x,Q2)[6]
+  uQS = f1Tp[1]
+  ubQS = f1Tp[2]
+  dQS = f1Tp[3]
+  dbQS = f1Tp[4]
+  sQS = f1Tp[5]
+  sbQS = f1Tp[6]
 ############################################################################
 
   SGPcs = 0
 
-  SGPcs += (((-1 / (N_C**2)) * ftub * HPall1) + ((1 / (2. * C_F)) * ftg *HPall2)) * (1. / CV.uu_value(rs, xF, pT, x)) * uQS * e2[1]
+  SGPcs += (((-1 / (N_C**2)) * ftub * HPall1) + ((1 / (2. * C_F)) * ftg *HPall2)) * ouu * uQS * e2[1]
 
-  SGPcs += (((-1 / (N_C**2)) * ftu * HPall1) + ((1 / (2.* C_F)) * ftg *HPall2)) * (1. / CV.uu_value(rs, xF, pT, x)) * ubQS * e2[2]
+  SGPcs += (((-1 / (N_C**2)) * ftu * HPall1) + ((1 / (2.* C_F)) * ftg *HPall2)) * ouu * ubQS * e2[2]
 
-  SGPcs += (((-1 / (N_C**2)) * ftdb * HPall1) + ((1 / (2. * C_F)) * ftg *HPall2)) * (1. / CV.uu_value(rs, xF, pT, x)) * dQS * e2[3]
+  SGPcs += (((-1 / (N_C**2)) * ftdb * HPall1) + ((1 / (2. * C_F)) * ftg *HPall2)) * ouu * dQS * e2[3]
 
-  SGPcs += (((-1 / (N_C**2)) * ftd * HPall1) + ((1 / (2.* C_F)) * ftg *HPall2)) * (1. / CV.uu_value(rs, xF, pT, x)) * dbQS * e2[4]
+  SGPcs += (((-1 / (N_C**2)) * ftd * HPall1) + ((1 / (2.* C_F)) * ftg *HPall2)) * ouu * dbQS * e2[4]
 
-  SGPcs += (((-1 / (N_C**2)) * ftsb * HPall1) + ((1 / (2. * C_F)) * ftg *HPall2)) * (1. / CV.uu_value(rs, xF, pT, x)) * sQS * e2[5]
+  SGPcs += (((-1 / (N_C**2)) * ftsb * HPall1) + ((1 / (2. * C_F)) * ftg *HPall2)) * ouu * sQS * e2[5]
 
-  SGPcs += (((-1 / (N_C**2)) * fts * HPall1) + ((1 / (2.* C_F)) * ftg *HPall2)) * (1. / CV.uu_value(rs, xF, pT, x)) * sbQS * e2[6]
+  SGPcs += (((-1 / (N_C**2)) * fts * HPall1) + ((1 / (2.* C_F)) * ftg *HPall2)) * ouu * sbQS * e2[6]
 
   return SGPcs * numfac
 
@@ -390,15 +412,73 @@ def get_denomint(xF, pT, rs, nx = 10):
     denom = fixed_quad(ddenomdx, xmin, 1., n = nx)[0]
     return denom
 
+#### NUMERATORS AND DENOMINATOR IN ONE PASS ####
+gauss = {}
+
+# x nodes, prefactors and hard parts of a data point, tabulated once per point
+hard = {}
+
+def get_hard(xF, pT, rs, nx = 10):
+    key = (xF, pT, rs, nx)
+    if key in hard: return hard[key]
+
+    if pT > 1.:
+      Q = pT
+    else:
+      Q = 1.
+
+    if nx not in gauss: gauss[nx] = roots_legendre(nx)
+    y, w = gauss[nx]
+    xmin = -CV.U_value(rs, xF, pT) / (CV.S_value(rs) + CV.T_value(rs, xF, pT))
+
+    tab = {}
+    tab['Q2'] = Q * Q
+    tab['x'] = x = 0.5 * (1. - xmin) * (y + 1.) + xmin
+    tab['w'] = 0.5 * (1. - xmin) * w
+    tab['xp'] = -x * CV.T_value(rs, xF, pT) / (x * CV.S_value(rs) + CV.U_value(rs, xF, pT))
+    tab['kin'] = get_kin(x, xF, pT, rs)
+    hard[key] = tab
+    return tab
+
+def setup_hard(xF, pT, rs, nx = 10):
+    """
+    tabulates get_hard for arrays of data points (called at setup so that
+    the workers inherit the tables)
+    """
+    for i in range(len(xF)): get_hard(xF[i], pT[i], rs[i], nx)
+
+def get_sig_grid(xF, pT, rs, nx = 10):
+    """
+    returns the SFP and SGP numerators and the denominator integrated on
+    the same x nodes as fixed_quad, with each distribution sampled once
+    """
+    tab = get_hard(xF, pT, rs, nx)
+    Q2, x, w, xp, kin = tab['Q2'], tab['x'], tab['w'], tab['xp'], tab['kin']
+
+    # Nonperturbative functions on the nodes (x and xp in one call)
+    fx = conf['pdf'].get_C_batch(np.append(x, xp), np.full(2 * nx, Q2))
+    f = fx[:, :nx]
+    ft = fx[:, nx:]
+    G = conf['sivers'].get_C_batch(x, np.full(nx, Q2))
+    f1Tp = G - x * conf['dsivers'].get_C_batch(x, np.full(nx, Q2))
+
+    numSFP = np.sum(w * _get_polnum_SFP(x, xF, pT, rs, f, ft, G, kin))
+    numSGP = np.sum(w * _get_polnum_SGP(x, xF, pT, rs, f, ft, f1Tp, kin))
+    denom = np.sum(w * _get_upolden(x, xF, pT, rs, f, ft, kin))
+    return numSFP, numSGP, denom
+
 #### DIFFERENT ASPECTS ####
 def get_SFP(xF, pT, rs, nx=10):
-    return get_numint_SFP(xF, pT, rs, nx) / get_denomint(xF, pT, rs, nx)
+    numSFP, numSGP, denom = get_sig_grid(xF, pT, rs, nx)
+    return numSFP / denom
 
 def get_SGP(xF, pT, rs, nx=10):
-    return get_numint_SGP(xF, pT, rs, nx) / get_denomint(xF, pT, rs, nx)
+    numSFP, numSGP, denom = get_sig_grid(xF, pT, rs, nx)
+    return numSGP / denom
 
 def get_AN(xF, pT, rs, nx=10):
-    return get_SFP(xF, pT, rs, nx=10) + get_SGP(xF, pT, rs, nx=10)
+    numSFP, numSGP, denom = get_sig_grid(xF, pT, rs, nx)
+    return numSFP / denom + numSGP / denom
 
 # def get_vars(rs, n):
 #     xF_over_pT = 2 * np.sinh(n) / rs
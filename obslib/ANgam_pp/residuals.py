@@ -21,6 +21,31 @@ class RESIDUALS(_RESIDUALS):
         self.tabs = conf['ANgam tabs']
         self.setup()
 
+    def setup(self):
+        _RESIDUALS.setup(self)
+        self.setup_hard()
+
+    def setup_hard(self):
+        """
+        x nodes and hard parts of every data point, tabulated once here
+        and only contracted with the distributions in the fit loop
+        """
+        for k in self.tabs:
+            tab = self.tabs[k]
+            AN_theory.setup_hard(tab['xF'], tab['pT'], tab['rs'], nx=10)
+
+    def get_sites(self):
+        sites = []
+        for k in self.tabs:
+            tab = self.tabs[k]
+            for i in range(len(tab['value'])):
+                hard = AN_theory.get_hard(tab['xF'][i], tab['pT'][i], tab['rs'][i], nx=10)
+                sites.extend([hard['x'], hard['xp']])
+        return np.concatenate(sites)
+
+    def get_dependencies(self, request):
+        return set(['pdf', 'ffpi', 'ffk', 'sivers'])
+
     def _get_theory(self, entry):
         k, i = entry
         xF = self.tabs[k]['xF'][i]
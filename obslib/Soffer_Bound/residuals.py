@@ -13,6 +13,9 @@ class RESIDUALS(_RESIDUALS):
         self.tabs = conf['SB tabs']
         self.setup()
 
+    def get_dependencies(self, request):
+        return set(['transversity'])
+
     def _get_theory(self, entry):
         k, i = entry
         x = self.tabs[k]['x'][i]
@@ -47,14 +47,7 @@ class STFUNCS:
 
     def p2n(self,p):
         n = np.copy(p)
-        u = n[1]
-        ub = n[2]
-        d = n[3]
-        db = n[4]
-        n[1] = d
-        n[2] = db
-        n[3] = u
-        n[4] = ub
+        n[[1,2,3,4]] = p[[3,4,1,2]]  # also valid for (11,npts) arrays
         return n
 
     def qplus(self,PDF):
@@ -102,6 +95,27 @@ class STFUNCS:
             self.storage[(x,Q2,hadron)] = x * LO #(LO +alpi*NLO)
         return self.storage[(x,Q2,hadron)]
 
+    def get_F2_batch(self,x,Q2,hadron):
+        """
+        x,Q2 arrays of the same size and hadron ('p','n','d') or an array of
+        them: same as get_F2 with one spline call per flavor for all points
+        """
+        x=np.asarray(x,dtype=float)
+        Q2=np.asarray(Q2,dtype=float)
+        hadron=np.broadcast_to(np.asarray(hadron,dtype=object),x.shape)
+        PDF=conf['cpdf'].get_f_batch(x,Q2)
+        Nf=np.array([conf['alphaS'].get_Nf(_) for _ in Q2],dtype=int)
+        F2=np.zeros(x.size)
+        for had in set(hadron):
+            for nf in set(Nf):
+                i=(hadron==had)&(Nf==nf)
+                if not np.any(i): continue
+                self.hadron=had
+                self.Nf=nf
+                F2[i]=x[i]*self.qplus(PDF[:,i])
+        for _x,_Q2,had,_F2 in zip(x,Q2,hadron,F2): self.storage[(_x,_Q2,had)]=_F2
+        return F2
+
 
 if __name__ == '__main__':
 
@@ -24,6 +24,9 @@ class RESIDUALS(_RESIDUALS):
         #self.moments = conf['moments']
         self.setup()
 
+    def get_dependencies(self, request):
+        return set(['transversity'])
+
     def _get_theory(self, entry):
         if self.version==0:
             k, i = entry
@@ -71,40 +74,21 @@ class RESIDUALS(_RESIDUALS):
             obs = self.tabs[k]['obs'][i].strip()
             Q = self.tabs[k]['Q'][i]
             Q2=Q**2
+            mom = conf['transversity'].get_mom(Q2)
             if obs == 'gT':
-                u  =conf['transversity'].get_mom(Q2)[1]
-                ub =conf['transversity'].get_mom(Q2)[2]
-                d  =conf['transversity'].get_mom(Q2)[3]
-                db =conf['transversity'].get_mom(Q2)[4]
-                thy = (u-ub)-(d-db)
+                thy = (mom[1]-mom[2])-(mom[3]-mom[4])
             elif obs == 'gTu':
-                u  =conf['transversity'].get_mom(Q2)[1]
-                ub =conf['transversity'].get_mom(Q2)[2]
-                thy = u-ub
+                thy = mom[1]-mom[2]
             elif obs == 'gTd':
-                d  =conf['transversity'].get_mom(Q2)[3]
-                db =conf['transversity'].get_mom(Q2)[4]
-                thy = d-db
+                thy = mom[3]-mom[4]
             elif obs == 'gTs':
-                s  =conf['transversity'].get_mom(Q2)[5]
-                sb =conf['transversity'].get_mom(Q2)[6]
-                thy = s-sb
+                thy = mom[5]-mom[6]
             elif obs == 'gTc':
-                c  =conf['transversity'].get_mom(Q2)[7]
-                cb =conf['transversity'].get_mom(Q2)[8]
-                thy = c-cb
+                thy = mom[7]-mom[8]
             elif obs == 'gT(u-d)':
-                u  =conf['transversity'].get_mom(Q2)[1]
-                ub =conf['transversity'].get_mom(Q2)[2]
-                d  =conf['transversity'].get_mom(Q2)[3]
-                db =conf['transversity'].get_mom(Q2)[4]
-                thy = (u-ub)-(d-db)
+                thy = (mom[1]-mom[2])-(mom[3]-mom[4])
             elif obs == 'gT(u+d)':
-                u  =conf['transversity'].get_mom(Q2)[1]
-                ub =conf['transversity'].get_mom(Q2)[2]
-                d  =conf['transversity'].get_mom(Q2)[3]
-                db =conf['transversity'].get_mom(Q2)[4]
-                thy = (u-ub)+(d-db)
+                thy = (mom[1]-mom[2])+(mom[3]-mom[4])
             return thy
 
     def gen_report(self, verb=1, level=1):
@@ -15,84 +15,72 @@ class RESIDUALS(_RESIDUALS):
         self.tabs = conf['sia tabs']
         self.setup()
 
+    def get_dependencies(self, request):
+        return self.get_tmd_dependencies(['ffpi', 'ffk', 'collinspi', 'collinsk'])
+
+    #--observables are compiled at setup (see _RESIDUALS.compile_tabs):
+    #--obs -> (kernel, integrated over pT)
+
+    string_columns = {'obs':     lambda s: s.strip(),
+                      'col':     lambda s: s.strip(),
+                      'hadron1': lambda s: s,
+                      'hadron2': lambda s: s}
+
+    observables = {'AUL-0-PT':     ('AUL', False),
+                   'AUC-0-PT':     ('AUC', False),
+                   'AUL-0-PT-INT': ('AUL', True),
+                   'AUC-0-PT-INT': ('AUC', True)}
+
+    def compile_tabs(self):
+        _RESIDUALS.compile_tabs(self)
+        self.kernels = []
+        for obs in self.labels['obs']:
+            if obs in self.observables:
+                kernel, integrated = self.observables[obs]
+                self.kernels.append((getattr(self, '_thy_%s' % kernel), integrated))
+            else:
+                self.kernels.append((None, None))
+        self.scale = [1. if col == 'BESIII' else 100. for col in self.labels['col']]  # from obs to %
+
     def _get_theory(self, entry):
         k, i = entry
-        obs = self.tabs[k]['obs'][i].strip()
-        col = self.tabs[k]['col'][i].strip()
-        z1 = self.tabs[k]['z1'][i]
-        z2 = self.tabs[k]['z2'][i]
-        Q2 = self.tabs[k]['Q2'][i]
-        factor = self.tabs[k]['S2/1+C2'][i]
-
-        if obs == 'AUL-0-PT':
-            pT = self.tabs[k]['pT'][i]
-            h1 = self.tabs[k]['hadron1'][i]
-            h2 = self.tabs[k]['hadron2'][i]
-            ZUuu = stfuncs.ZX(1, z1, z2, Q2, pT, h1 + '+', h2 + '-') + \
-                stfuncs.ZX(1, z1, z2, Q2, pT, h1 + '-', h2 + '+')
-            ZLuu = stfuncs.ZX(1, z1, z2, Q2, pT, h1 + '+', h2 + '+') + \
-                stfuncs.ZX(1, z1, z2, Q2, pT, h1 + '-', h2 + '-')
-            ZUcol = stfuncs.ZX(2, z1, z2, Q2, pT, h1 + '+', h2 + '-') + \
-                stfuncs.ZX(2, z1, z2, Q2, pT, h1 + '-', h2 + '+')
-            ZLcol = stfuncs.ZX(2, z1, z2, Q2, pT, h1 + '+', h2 + '+') + \
-                stfuncs.ZX(2, z1, z2, Q2, pT, h1 + '-', h2 + '-')
-            thy = factor * (ZUcol / ZUuu - ZLcol / ZLuu)
-        elif obs == 'AUC-0-PT':
-            pT = self.tabs[k]['pT'][i]
-            h1 = self.tabs[k]['hadron1'][i]
-            h2 = self.tabs[k]['hadron2'][i]
-            ZUuu = stfuncs.ZX(1, z1, z2, Q2, pT, h1 + '+', h2 + '-') + \
-                stfuncs.ZX(1, z1, z2, Q2, pT, h1 + '-', h2 + '+')
-            ZLuu = stfuncs.ZX(1, z1, z2, Q2, pT, h1 + '+', h2 + '+') + \
-                stfuncs.ZX(1, z1, z2, Q2, pT, h1 + '-', h2 + '-')
-            ZUcol = stfuncs.ZX(2, z1, z2, Q2, pT, h1 + '+', h2 + '-') + \
-                stfuncs.ZX(2, z1, z2, Q2, pT, h1 + '-', h2 + '+')
-            ZLcol = stfuncs.ZX(2, z1, z2, Q2, pT, h1 + '+', h2 + '+') + \
-                stfuncs.ZX(2, z1, z2, Q2, pT, h1 + '-', h2 + '-')
-            ZCuu = ZUuu + ZLuu
-            ZCcol = ZUcol + ZLcol
-            thy = factor * (ZUcol / ZUuu - ZCcol / ZCuu)
-        elif obs == 'AUL-0-PT-INT':
-            #if self.tabs[k]['col'][i]=='BaBaR': pT = self.tabs[k]['pT'][i]
-            #if self.tabs[k]['col'][i]=='belle': pT = None
-            pT = None
-            h1 = self.tabs[k]['hadron1'][i]
-            h2 = self.tabs[k]['hadron2'][i]
-            ZUuu = stfuncs.ZX(1, z1, z2, Q2, pT, h1 + '+', h2 + '-') + \
-                stfuncs.ZX(1, z1, z2, Q2, pT, h1 + '-', h2 + '+')
-            ZLuu = stfuncs.ZX(1, z1, z2, Q2, pT, h1 + '+', h2 + '+') + \
-                stfuncs.ZX(1, z1, z2, Q2, pT, h1 + '-', h2 + '-')
-            ZUcol = stfuncs.ZX(2, z1, z2, Q2, pT, h1 + '+', h2 + '-') + \
-                stfuncs.ZX(2, z1, z2, Q2, pT, h1 + '-', h2 + '+')
-            ZLcol = stfuncs.ZX(2, z1, z2, Q2, pT, h1 + '+', h2 + '+') + \
-                stfuncs.ZX(2, z1, z2, Q2, pT, h1 + '-', h2 + '-')
-            thy = factor * (ZUcol / ZUuu - ZLcol / ZLuu)
-        elif obs == 'AUC-0-PT-INT':
-            #if self.tabs[k]['col'][i]=='BaBaR': pT = self.tabs[k]['pT'][i]
-            #if self.tabs[k]['col'][i]=='belle': pT = None
-            pT = None
-            h1 = self.tabs[k]['hadron1'][i]
-            h2 = self.tabs[k]['hadron2'][i]
-            ZUuu = stfuncs.ZX(1, z1, z2, Q2, pT, h1 + '+', h2 + '-') + \
-                stfuncs.ZX(1, z1, z2, Q2, pT, h1 + '-', h2 + '+')
-            ZLuu = stfuncs.ZX(1, z1, z2, Q2, pT, h1 + '+', h2 + '+') + \
-                stfuncs.ZX(1, z1, z2, Q2, pT, h1 + '-', h2 + '-')
-            ZUcol = stfuncs.ZX(2, z1, z2, Q2, pT, h1 + '+', h2 + '-') + \
-                stfuncs.ZX(2, z1, z2, Q2, pT, h1 + '-', h2 + '+')
-            ZLcol = stfuncs.ZX(2, z1, z2, Q2, pT, h1 + '+', h2 + '+') + \
-                stfuncs.ZX(2, z1, z2, Q2, pT, h1 + '-', h2 + '-')
-            ZCuu = ZUuu + ZLuu
-            ZCcol = ZUcol + ZLcol
-            thy = factor * (ZUcol / ZUuu - ZCcol / ZCuu)
-
-        else:
-            print('ERR: obs=%s  not implemented' % obs)
+        tab, codes = self.tabs[k], self.codes[k]
+        kernel, integrated = self.kernels[codes['obs'][i]]
+        if kernel == None:
+            print('ERR: obs=%s  not implemented' % self.labels['obs'][codes['obs'][i]])
             sys.exit()
 
-        if not col == 'BESIII':
-            thy = thy * 100.  # from obs to %
+        #if self.tabs[k]['col'][i]=='BaBaR': pT = self.tabs[k]['pT'][i]
+        #if self.tabs[k]['col'][i]=='belle': pT = None
+        pT = None if integrated else tab['pT'][i]
+        h1 = self.labels['hadron1'][codes['hadron1'][i]]
+        h2 = self.labels['hadron2'][codes['hadron2'][i]]
+        thy = tab['S2/1+C2'][i] * kernel(tab['z1'][i], tab['z2'][i], tab['Q2'][i], pT, h1, h2)
+        return thy * self.scale[codes['col'][i]]
 
-        return thy
+    def get_Z(self, z1, z2, Q2, pT, h1, h2):
+        """
+        unlike (U) and like (L) sign combinations of the unpolarized and collins terms
+        """
+        ZUuu = stfuncs.ZX(1, z1, z2, Q2, pT, h1 + '+', h2 + '-') + \
+            stfuncs.ZX(1, z1, z2, Q2, pT, h1 + '-', h2 + '+')
+        ZLuu = stfuncs.ZX(1, z1, z2, Q2, pT, h1 + '+', h2 + '+') + \
+            stfuncs.ZX(1, z1, z2, Q2, pT, h1 + '-', h2 + '-')
+        ZUcol = stfuncs.ZX(2, z1, z2, Q2, pT, h1 + '+', h2 + '-') + \
+            stfuncs.ZX(2, z1, z2, Q2, pT, h1 + '-', h2 + '+')
+        ZLcol = stfuncs.ZX(2, z1, z2, Q2, pT, h1 + '+', h2 + '+') + \
+            stfuncs.ZX(2, z1, z2, Q2, pT, h1 + '-', h2 + '-')
+        return ZUuu, ZLuu, ZUcol, ZLcol
+
+    def _thy_AUL(self, z1, z2, Q2, pT, h1, h2):
+        ZUuu, ZLuu, ZUcol, ZLcol = self.get_Z(z1, z2, Q2, pT, h1, h2)
+        return ZUcol / ZUuu - ZLcol / ZLuu
+
+    def _thy_AUC(self, z1, z2, Q2, pT, h1, h2):
+        ZUuu, ZLuu, ZUcol, ZLcol = self.get_Z(z1, z2, Q2, pT, h1, h2)
+        ZCuu = ZUuu + ZLuu
+        ZCcol = ZUcol + ZLcol
+        return ZUcol / ZUuu - ZCcol / ZCuu
 
     def gen_report(self, verb=1, level=1):
         """
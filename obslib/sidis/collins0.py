@@ -5,6 +5,7 @@ import numpy as np
 from tools.tools import load_config
 from qcdlib.aux import AUX
 from tools.config import conf
+from obslib.sidis import upol0 as upol
 
 eu2, ed2 = 4/9., 1/9.
 e2 = []
@@ -90,6 +91,137 @@ def get_FUT(x,z,Q2,pT,tar,had):
 
       return 0.5*(get_FUT(x,z,Q2,pT,'p',had)+get_FUT(x,z,Q2,pT,'n',had))
 
+def get_FUT_FUU(x,z,Q2,pT,tar,had):
+    """
+    returns FUT and FUU of the asymmetry with every distribution sampled
+    once per point: the deuteron reuses the proton samples
+    """
+
+    # get collinear parts (proton and positive hadrons)
+    F = conf['transversity'].get_C(x, Q2)
+    F1 = conf['pdf'].get_C(x, Q2)
+    if   'pi' in had:
+        D = conf['collinspi'].get_C(z, Q2)
+        D1 = conf['ffpi'].get_C(z, Q2)
+    elif  'k' in had:
+        D = conf['collinsk'].get_C(z, Q2)
+        D1 = conf['ffk'].get_C(z, Q2)
+    else:
+        raise ValueError('had=%s not supported in sidis collins AUT'%had)
+    F[0],D[0],F1[0],D1[0]=0,0,0,0  # set glue to zero
+
+    # get widths (proton and positive hadrons)
+    w_tar=conf['transversity'].get_widths(Q2)
+    w_tar1=conf['pdf'].get_widths(Q2)
+    if   'pi' in had:
+        w_had=np.abs(conf['collinspi'].get_widths(Q2))
+        w_had1=np.abs(conf['ffpi'].get_widths(Q2))
+    elif 'k'  in had:
+        w_had=np.abs(conf['collinsk'].get_widths(Q2))
+        w_had1=np.abs(conf['ffk'].get_widths(Q2))
+
+    # build structure functions
+    if tar=='p' or tar=='d':
+        FUTp=_get_FUT(x,z,Q2,pT,'p',had,F,D,w_tar,w_had)
+        FUUp=upol._get_FUU(x,z,Q2,pT,'p',had,F1,D1,w_tar1,w_had1)
+        if tar=='p': return FUTp,FUUp
+
+    F,w_tar=conf['aux'].p2n(F),conf['aux'].p2n(w_tar)
+    F1,w_tar1=conf['aux'].p2n(F1),conf['aux'].p2n(w_tar1)
+    FUTn=_get_FUT(x,z,Q2,pT,'n',had,F,D,w_tar,w_had)
+    FUUn=upol._get_FUU(x,z,Q2,pT,'n',had,F1,D1,w_tar1,w_had1)
+    if tar=='n': return FUTn,FUUn
+
+    return 0.5*(FUTp+FUTn),0.5*(FUUp+FUUn)
+
+
+#--array versions: x,z,Q2,pT are arrays over the rows of a data set
+
+def _get_D_batch(z,Q2,had):
+
+    D=np.zeros((11,z.size))
+    w_had=np.zeros((11,z.size))
+    Mh=np.zeros(z.size)
+    ipi=np.array(['pi' in _ for _ in had])
+    ik =np.array(['k'  in _ for _ in had]) & ~ipi
+    if not np.all(ipi|ik):
+        raise ValueError('had=%s not supported in sidis collins AUT'%had[~(ipi|ik)][0])
+    if np.any(ipi):
+        D[:,ipi]    =conf['collinspi'].get_C_batch(z[ipi],Q2[ipi])
+        w_had[:,ipi]=np.abs(conf['collinspi'].get_widths_batch(Q2[ipi]))
+        Mh[ipi]     =conf['aux'].Mpi
+    if np.any(ik):
+        D[:,ik]    =conf['collinsk'].get_C_batch(z[ik],Q2[ik])
+        w_had[:,ik]=np.abs(conf['collinsk'].get_widths_batch(Q2[ik]))
+        Mh[ik]     =conf['aux'].Mk
+    return D,w_had,Mh
+
+def _get_dw_had_batch(Q2,had,dw):
+
+    dw_had=np.zeros((len(dw),11,Q2.size))
+    ipi=np.array(['pi' in _ for _ in had])
+    ik =np.array(['k'  in _ for _ in had]) & ~ipi
+    for dist,i in [('collinspi',ipi),('collinsk',ik)]:
+        if np.any(i): dw_had[:,:,i]=upol._get_dw_batch(dist,Q2[i],dw)
+    return dw_had
+
+def _get_FUT_batch(x,z,pT,had,F,D,w_tar,w_had,Mh,dw_tar=None,dw_had=None):
+    """
+    with dw_tar,dw_had (derivatives of the widths) returns the derivative of FUT
+    """
+
+    def get_sum(D,w_had,dw_had):
+        wq = z**2 * np.abs(w_tar) + np.abs(w_had)
+        K = 2 * x * z * pT * Mh / wq
+        gauss = np.exp(-pT**2 / wq) / (np.pi * wq)
+        if dw_tar is None: return np.einsum('i,ij->j',e2,K*F*D*gauss)
+        dwq = z**2 * dw_tar + dw_had
+        return np.einsum('i,ij->j',e2,K*F*D*gauss*(pT**2/wq-2)/wq*dwq)
+
+    if dw_tar is None: dw_had_m=None
+    else: dw_had_m=conf['aux'].charge_conj(dw_had)
+    FUTp=get_sum(D,w_had,dw_had)
+    FUTm=get_sum(conf['aux'].charge_conj(D),conf['aux'].charge_conj(w_had),dw_had_m)
+    plus =np.array([_.endswith('+') for _ in had])
+    minus=np.array([_.endswith('-') for _ in had])
+    return np.where(plus,FUTp,np.where(minus,FUTm,0.5*(FUTp+FUTm)))
+
+def get_FUT_batch(x,z,Q2,pT,tar,had,dw=None):
+    """
+    x,z,Q2,pT: arrays of the same size
+    tar,had  : arrays of labels (or single labels) with tar in p,n,d
+    dw       : optional widths directions (see upol0.get_FUU_batch)
+    """
+    x=np.asarray(x,dtype=float)
+    z=np.asarray(z,dtype=float)
+    Q2=np.asarray(Q2,dtype=float)
+    pT=np.asarray(pT,dtype=float)
+    tar=np.broadcast_to(tar,x.shape)
+    had=np.broadcast_to(had,x.shape)
+
+    # get collinear parts and widths (proton and positive hadrons)
+    F=conf['transversity'].get_C_batch(x,Q2)
+    D,w_had,Mh=_get_D_batch(z,Q2,had)
+    F[0],D[0]=0,0  # set glue to zero
+    w_tar=conf['transversity'].get_widths_batch(Q2)
+
+    # build structure function
+    FUTp=_get_FUT_batch(x,z,pT,had,F,D,w_tar,w_had,Mh)
+    if dw is not None:
+        dw_tar=upol._get_dw_batch('transversity',Q2,dw)
+        dw_had=_get_dw_had_batch(Q2,had,dw)
+        dFUTp=np.array([_get_FUT_batch(x,z,pT,had,F,D,w_tar,w_had,Mh,dw_tar[j],dw_had[j]) for j in range(len(dw))])
+    if np.all(tar=='p'):
+        if dw is None: return FUTp
+        return FUTp,dFUTp
+    F=conf['aux'].p2n(F)
+    w_tar=conf['aux'].p2n(w_tar)
+    FUTn=_get_FUT_batch(x,z,pT,had,F,D,w_tar,w_had,Mh)
+    FUT=np.where(tar=='p',FUTp,np.where(tar=='n',FUTn,0.5*(FUTp+FUTn)))
+    if dw is None: return FUT
+    dFUTn=np.array([_get_FUT_batch(x,z,pT,had,F,D,w_tar,w_had,Mh,conf['aux'].p2n(dw_tar[j]),dw_had[j]) for j in range(len(dw))])
+    return FUT,np.where(tar=='p',dFUTp,np.where(tar=='n',dFUTn,0.5*(dFUTp+dFUTn)))
+
 
 if __name__ == '__main__':
 
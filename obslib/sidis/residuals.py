@@ -13,6 +13,15 @@ from obslib.sidis import cahn0 as cahn
 from obslib.sidis import aUTsPs0 as AUTsinphiS
 from obslib.idis.stfuncs import STFUNCS as DIS_STFUNCS
 
+#--distributions used by each observable (see RESMAN.setup_dependencies)
+dependencies={}
+dependencies['FUU']        = ['pdf','ffpi','ffk','ffh']
+dependencies['M']          = ['pdf','ffpi','ffk','ffh']
+dependencies['AUTcollins'] = ['pdf','ffpi','ffk','ffh','transversity','collinspi','collinsk']
+dependencies['AUTsivers']  = ['pdf','ffpi','ffk','ffh','sivers']
+dependencies['AUUcos2']    = ['pdf','ffpi','ffk','ffh','boermulders','collinspi','collinsk','collinsh']
+dependencies['AUTsinphiS'] = ['pdf','ffpi','ffk','ffh','transversity','Htildepi','Htildek']
+
 class RESIDUALS(_RESIDUALS):
 
     def __init__(self,react='sidis'):
@@ -28,199 +37,356 @@ class RESIDUALS(_RESIDUALS):
         self.dis_stfuncs = DIS_STFUNCS()
         self.setup()
 
-    def _get_theory(self, entry):
-        k, i = entry
-        x = self.tabs[k]['x'][i]
-        try: y = self.tabs[k]['y'][i]
-        except (ValueError,KeyError): y=None
-        z = self.tabs[k]['z'][i]
-        try: Q2 = self.tabs[k]['Q2'][i]
-        except ValueError: Q2=None
-        pT = self.tabs[k]['pT'][i]
-        exp = self.tabs[k]['value'][i]
-        tar = self.tabs[k]['target'][i]
-        had = self.tabs[k]['hadron'][i]
-        obs = self.tabs[k]['obs'][i].strip()
-        col = self.tabs[k]['col'][i].strip().upper()
-        try: F2 = self.tabs[k]['F2'][i]
-        except KeyError: F2=None
-
-        M = conf['aux'].M
-        M2     = conf['aux'].M ** 2
-        Mpi2     = conf['aux'].Mpi ** 2
-
-        if   tar=='proton':    tar='p'
-        elif tar=='neutron':   tar='n'
-        elif tar=='deuteron':  tar='d'
-
-        if obs == 'FUU':
-
-            thy = upol.get_FUU(x,z,Q2,pT,tar,had)
+    #--observables are compiled at setup (see _RESIDUALS.compile_tabs) and
+    #--each row is dispatched to the kernel of its observable
 
-        elif obs == 'M':
+    string_columns = {'obs':    lambda s: s.strip(),
+                      'col':    lambda s: s.strip().upper(),
+                      'target': lambda s: {'proton':'p','neutron':'n','deuteron':'d'}.get(s,s),
+                      'hadron': lambda s: s}
 
-            if had=='h+': had='pi+'
-            if had=='h-': had='pi-'
+    def compile_tabs(self):
+        _RESIDUALS.compile_tabs(self)
+        self.kernels = [getattr(self, '_thy_%s' % obs, self._thy_unknown) for obs in self.labels['obs']]
 
-            FUU = upol.get_FUU(x,z,Q2,pT,tar,had)
-            if F2==None: F2 = self.dis_stfuncs.get_F2(x, Q2,tar)
-            thy = FUU / F2
-            if col=='HERMES' or col=='hermes': thy=2*np.pi*pT*thy
-            if col=='COMPASS' or col=='compass': thy=np.pi*thy
+    def setup(self):
+        _RESIDUALS.setup(self)
+        self.setup_F2()
 
-        elif obs == 'AUTcollins':
-
-            # convention factor
-            coeff = 1.
-            if   col == 'HERMES':  coeff = 1  # hermes is sin(phi_s+phi_h)
-            elif col == 'COMPASS': coeff = -1 # compass is sin(phi_s+phi_h+pi)
-
-            # add depolarization factor
-            if col == 'HERMES': coeff *= 2 * (1 - y) / (1 + (1 - y)**2)
-
-            FUT = collins.get_FUT(x,z,Q2,pT,tar,had)
-            FUU = upol.get_FUU(x,z,Q2,pT,tar,had)
-            thy = coeff * FUT / FUU
-
-        elif obs == 'AUTsivers':
-
-            # convention factor
-            coeff = 1.
-
-            FUT = sivers.get_FUT(x,z,Q2,pT,tar,had)
-            FUU = upol.get_FUU(x,z,Q2,pT,tar,had)
-            thy = coeff * FUT / FUU
-
-        elif obs == 'AUUcos2':
+    def setup_F2(self):
+        """
+        F2 for the multiplicities from the data tables or, if absent, from
+        the fixed DIS tables: computed once here, never in the fit loop
+        """
+        self.F2 = {}
+        for k in self.tabs:
+            tab = self.tabs[k]
+            if 'F2' in tab: self.F2[k] = tab['F2']
+            elif 'M' in self.get_labels(k, 'obs', np.arange(len(tab['value']))):
+                tar = self.get_labels(k, 'target', np.arange(len(tab['value'])))
+                self.F2[k] = self.dis_stfuncs.get_F2_batch(tab['x'], tab['Q2'], tar)
+            else: self.F2[k] = None
+
+    def get_sites(self):
+        return np.concatenate([self.tabs[k][_] for k in self.tabs for _ in ['x', 'z'] if _ in self.tabs[k]] + [np.zeros(0)])
+
+    def get_row(self, k, i):
+        tab, codes = self.tabs[k], self.codes[k]
+        x   = tab['x'][i]
+        y   = tab['y'][i] if 'y' in tab else None
+        z   = tab['z'][i]
+        Q2  = tab['Q2'][i]
+        pT  = tab['pT'][i]
+        tar = self.labels['target'][codes['target'][i]]
+        had = self.labels['hadron'][codes['hadron'][i]]
+        col = self.labels['col'][codes['col'][i]]
+        F2  = self.F2[k][i] if self.F2[k] is not None else None
+        return x, y, z, Q2, pT, tar, had, col, F2
 
-            if had=='h+': had='pi+'
-            if had=='h-': had='pi-'
+    def _get_theory(self, entry):
+        k, i = entry
+        return self.kernels[self.codes[k]['obs'][i]](k, i)
 
-            ''' The data from JLab and HERMES do not require any integrations,
-                but require a y-based coefficient. The COMPASS data requires an
-                integration over y, and does not require the coefficient.    '''
+    def _thy_unknown(self, k, i):
+        obs = self.labels['obs'][self.codes[k]['obs'][i]]
+        tar = self.labels['target'][self.codes[k]['target'][i]]
+        print('ERR: exp=%d obs=%s and target=%s not implemented' % (k, obs, tar))
+        sys.exit()
 
-            def yield_thy(accelerator, should_integrate, ny=10):
+    def _thy_FUU(self, k, i):
+        x, y, z, Q2, pT, tar, had, col, F2 = self.get_row(k, i)
+        return upol.get_FUU(x,z,Q2,pT,tar,had)
 
-                # depending on input parameters, either selects the coefficient
-                # method or the integration method of producing a residual value.
-                # root_s and W2_min also fluctuate based on accelerator.
+    def _thy_M(self, k, i):
+        x, y, z, Q2, pT, tar, had, col, F2 = self.get_row(k, i)
 
-                # set known values based on the source of AUUcos2 data
-                if  accelerator == 'COMPASS':
-                    ROOT_S    = 17.3
-                    W2_MIN    = 25.0
-                    RANGE_MIN = 0.2
-                    RANGE_MAX = 0.9
+        if had=='h+': had='pi+'
+        if had=='h-': had='pi-'
 
-                elif accelerator == 'CLAS': #JLab col in the data files
-                    ROOT_S    = 3.42
-                    W2_MIN    = 4.0
-                    RANGE_MIN = 0.2
-                    RANGE_MAX = 0.85
+        FUU = upol.get_FUU(x,z,Q2,pT,tar,had)
+        thy = FUU / F2
+        if col=='HERMES': thy=2*np.pi*pT*thy
+        if col=='COMPASS': thy=np.pi*thy
+        return thy
 
-                elif accelerator == 'HERMES':
-                    ROOT_S    = 7.25
-                    W2_MIN    = 10
-                    RANGE_MIN = 0.2
-                    RANGE_MAX = 0.85
+    def _thy_AUTcollins(self, k, i):
+        x, y, z, Q2, pT, tar, had, col, F2 = self.get_row(k, i)
 
+        # convention factor
+        coeff = 1.
+        if   col == 'HERMES':  coeff = 1  # hermes is sin(phi_s+phi_h)
+        elif col == 'COMPASS': coeff = -1 # compass is sin(phi_s+phi_h+pi)
 
-                if should_integrate:
+        # add depolarization factor
+        if col == 'HERMES': coeff *= 2 * (1 - y) / (1 + (1 - y)**2)
 
-                    def fast_integrate(f, low, hi, ny):
-                        f = np.vectorize(f)
-                        return integrate.fixed_quad(f, low, hi, n=ny)
+        FUT, FUU = collins.get_FUT_FUU(x,z,Q2,pT,tar,had)
+        return coeff * FUT / FUU
 
-                    Q2_MIN = 1
-                    Q2_MAX = 1000
+    def _thy_AUTsivers(self, k, i):
+        x, y, z, Q2, pT, tar, had, col, F2 = self.get_row(k, i)
 
-                    yA = max(   # lower bound of integration
-                            RANGE_MIN,
-                            Q2_MIN / (x * ((ROOT_S ** 2) - M2)),
-                            (W2_MIN - M2) / ((1 - x) * ((ROOT_S ** 2) - M2))
-                            )
-                    yB = min(   # upper bound of integration
-                            Q2_MAX / (x * ((ROOT_S ** 2) - M2)),
-                            RANGE_MAX
-                            )
+        # convention factor
+        coeff = 1.
 
-                    # any value dependent on y must be a function so that its value
-                    # may be recalculated during the integration process
-                    Q  = lambda y : np.sqrt(((ROOT_S ** 2) - M2) * x * y)
+        FUT, FUU = sivers.get_FUT_FUU(x,z,Q2,pT,tar,had)
+        return coeff * FUT / FUU
 
+    def _thy_AUUcos2(self, k, i):
+        x, y, z, Q2, pT, tar, had, col, F2 = self.get_row(k, i)
 
-                    if accelerator=='HERMES':
-                        FUU     = lambda y : (1.- y + 0.5*y**2) * upol.get_FUU(x, z, Q(y) ** 2, pT, tar, had)
-                        FUUcos2 = lambda y : (1.-y) * (boermulders.get_FUU(x, z, Q(y) ** 2, pT, tar, had) + cahn.get_cahn(x, z, Q(y) ** 2, pT, tar, had))
+        M = conf['aux'].M
+        M2     = conf['aux'].M ** 2
+        Mpi2     = conf['aux'].Mpi ** 2
 
-                    elif accelerator=='COMPASS':
-                        FUU     = lambda y : upol.get_FUU(x, z, Q(y) ** 2, pT, tar, had)
-                        FUUcos2 = lambda y : (boermulders.get_FUU(x, z, Q(y) ** 2, pT, tar, had) + cahn.get_cahn(x, z, Q(y) ** 2, pT, tar, had))
+        if had=='h+': had='pi+'
+        if had=='h-': had='pi-'
+
+        ''' The data from JLab and HERMES do not require any integrations,
+            but require a y-based coefficient. The COMPASS data requires an
+            integration over y, and does not require the coefficient.    '''
+
+        def yield_thy(accelerator, should_integrate, ny=10):
+
+            # depending on input parameters, either selects the coefficient
+            # method or the integration method of producing a residual value.
+            # root_s and W2_min also fluctuate based on accelerator.
+
+            # set known values based on the source of AUUcos2 data
+            if  accelerator == 'COMPASS':
+                ROOT_S    = 17.3
+                W2_MIN    = 25.0
+                RANGE_MIN = 0.2
+                RANGE_MAX = 0.9
+
+            elif accelerator == 'CLAS': #JLab col in the data files
+                ROOT_S    = 3.42
+                W2_MIN    = 4.0
+                RANGE_MIN = 0.2
+                RANGE_MAX = 0.85
+
+            elif accelerator == 'HERMES':
+                ROOT_S    = 7.25
+                W2_MIN    = 10
+                RANGE_MIN = 0.2
+                RANGE_MAX = 0.85
+
+
+            if should_integrate:
+
+                def fast_integrate(f, low, hi, ny):
+                    f = np.vectorize(f)
+                    return integrate.fixed_quad(f, low, hi, n=ny)
+
+                Q2_MIN = 1
+                Q2_MAX = 1000
+
+                yA = max(   # lower bound of integration
+                        RANGE_MIN,
+                        Q2_MIN / (x * ((ROOT_S ** 2) - M2)),
+                        (W2_MIN - M2) / ((1 - x) * ((ROOT_S ** 2) - M2))
+                        )
+                yB = min(   # upper bound of integration
+                        Q2_MAX / (x * ((ROOT_S ** 2) - M2)),
+                        RANGE_MAX
+                        )
+
+                # any value dependent on y must be a function so that its value
+                # may be recalculated during the integration process
+                Q  = lambda y : np.sqrt(((ROOT_S ** 2) - M2) * x * y)
+
+
+                if accelerator=='HERMES':
+                    FUU     = lambda y : (1.- y + 0.5*y**2) * upol.get_FUU(x, z, Q(y) ** 2, pT, tar, had)
+                    FUUcos2 = lambda y : (1.-y) * (boermulders.get_FUU(x, z, Q(y) ** 2, pT, tar, had) + cahn.get_cahn(x, z, Q(y) ** 2, pT, tar, had))
+
+                elif accelerator=='COMPASS':
+                    FUU     = lambda y : upol.get_FUU(x, z, Q(y) ** 2, pT, tar, had)
+                    FUUcos2 = lambda y : (boermulders.get_FUU(x, z, Q(y) ** 2, pT, tar, had) + cahn.get_cahn(x, z, Q(y) ** 2, pT, tar, had))
+
+                elif accelerator=='CLAS':
+                    # CLAS accelerators measure H4 / (H2 + H1), which can be related
+                    # to the AUUcos2 asymmetry.
+                    gamma   = lambda y : (2 * M * x) / Q(y)
+                    kappa   = lambda y : 1 / (1 + gamma(x, y) ** 2)
+                    zeta    = lambda y : 1 - y - (0.25 * (gamma(x, y) ** 2) * (y ** 2))
+                    epsilon = lambda y : 1 / (1 + ((y ** 2) / (2 * kappa(x, y) * zeta(x, y))))
+                    ppa_over_Eh = lambda y: np.sqrt(1-(pT**2 + Mpi**2)*(2.*M*x/(z*Q(y)**2))**2)
+
+                    FUU     = lambda y : ppa_over_Eh*(kappa/epsilon)*(1+gamma**2/(2.*x)) * upol.get_FUU(x, z, Q(y) ** 2, pT, tar, had)
+                    FUUcos2 = lambda y : (ppa_over_Eh/2.)*(1+gamma**2/(2.*x)) * (boermulders.get_FUU(x, z, Q(y) ** 2, pT, tar, had) + cahn.get_cahn(x, z, Q(y) ** 2, pT, tar, had))
+
+                # integrate over y for the numerator and denominator of AUUcos2
+                FUUcos2_integral = fast_integrate(lambda y : (1. / (Q(y) ** 4)) * FUUcos2(y), yA, yB, ny)[0]
+                FUU_integral     = fast_integrate(lambda y : (1. / (Q(y) ** 4)) * FUU(y),     yA, yB, ny)[0]
+
+                theory = FUUcos2_integral / FUU_integral
+
+            else:   # no integration
+
+                if accelerator=='HERMES':    coeff  = (1 - y) / (1 - y + 0.5 * y ** 2)
+                elif accelerator=='COMPASS': coeff  = 1.
+                elif accelerator=='CLAS':
+                    gamma   = (2.* M * x) / np.sqrt(Q2)
+                    kappa   = 1. / (1. + gamma**2.)
+                    zeta    = 1. - y - (0.25 * (gamma**2.) * (y ** 2.))
+                    epsilon = 1. / (1. + ((y ** 2.) / (2. * kappa * zeta)))
+                        
+                    coeff =  epsilon / (2. * kappa)
 
-                    elif accelerator=='CLAS':
-                        # CLAS accelerators measure H4 / (H2 + H1), which can be related
-                        # to the AUUcos2 asymmetry.
-                        gamma   = lambda y : (2 * M * x) / Q(y)
-                        kappa   = lambda y : 1 / (1 + gamma(x, y) ** 2)
-                        zeta    = lambda y : 1 - y - (0.25 * (gamma(x, y) ** 2) * (y ** 2))
-                        epsilon = lambda y : 1 / (1 + ((y ** 2) / (2 * kappa(x, y) * zeta(x, y))))
-                        ppa_over_Eh = lambda y: np.sqrt(1-(pT**2 + Mpi**2)*(2.*M*x/(z*Q(y)**2))**2)
 
-                        FUU     = lambda y : ppa_over_Eh*(kappa/epsilon)*(1+gamma**2/(2.*x)) * upol.get_FUU(x, z, Q(y) ** 2, pT, tar, had)
-                        FUUcos2 = lambda y : (ppa_over_Eh/2.)*(1+gamma**2/(2.*x)) * (boermulders.get_FUU(x, z, Q(y) ** 2, pT, tar, had) + cahn.get_cahn(x, z, Q(y) ** 2, pT, tar, had))
+                FUUcos2 = (boermulders.get_FUU(x, z, Q2, pT, tar, had) + cahn.get_cahn(x, z, Q2, pT, tar, had))
+                FUU     = upol.get_FUU(x,z,Q2,pT,tar,had)
 
-                    # integrate over y for the numerator and denominator of AUUcos2
-                    FUUcos2_integral = fast_integrate(lambda y : (1. / (Q(y) ** 4)) * FUUcos2(y), yA, yB, ny)[0]
-                    FUU_integral     = fast_integrate(lambda y : (1. / (Q(y) ** 4)) * FUU(y),     yA, yB, ny)[0]
+                theory = coeff * FUUcos2 / FUU
 
-                    theory = FUUcos2_integral / FUU_integral
+            return theory
 
-                else:   # no integration
+        if col=='COMPASS':   thy = yield_thy(col, should_integrate = True,  ny=10)
+        elif col=='HERMES':  thy = yield_thy(col, should_integrate = False, ny=10)
+        elif col=='CLAS':    thy = yield_thy(col, should_integrate = False, ny=10)
 
-                    if accelerator=='HERMES':    coeff  = (1 - y) / (1 - y + 0.5 * y ** 2)
-                    elif accelerator=='COMPASS': coeff  = 1.
-                    elif accelerator=='CLAS':
-                        gamma   = (2.* M * x) / np.sqrt(Q2)
-                        kappa   = 1. / (1. + gamma**2.)
-                        zeta    = 1. - y - (0.25 * (gamma**2.) * (y ** 2.))
-                        epsilon = 1. / (1. + ((y ** 2.) / (2. * kappa * zeta)))
-                        
-                        coeff =  epsilon / (2. * kappa)
+        return thy
 
+    def _thy_AUTsinphiS(self, k, i):  # This is for collinear!
+        x, y, z, Q2, pT, tar, had, col, F2 = self.get_row(k, i)
 
-                    FUUcos2 = (boermulders.get_FUU(x, z, Q2, pT, tar, had) + cahn.get_cahn(x, z, Q2, pT, tar, had))
-                    FUU     = upol.get_FUU(x,z,Q2,pT,tar,had)
+        if tar == 'p':
+            pT = None
+            FUTsinphiS = AUTsinphiS.get_FX(x, z, Q2, pT, 'p', had)
+            FUU = upol.get_FUU(x,z,Q2,pT,'p',had)
 
-                    theory = coeff * FUUcos2 / FUU
+        coeff = 1.
+        if col == 'HERMES':
+            # add depolarization factor for HERMES
+            coeff = np.sqrt(1.0 - y) * (2 - y) / (1 - y + 0.5 * y**2)
+        if col == 'COMPASS':
+            coeff = 1.
 
-                return theory
+        return coeff * FUTsinphiS / FUU
 
-            if col=='COMPASS':   thy = yield_thy(col, should_integrate = True,  ny=10)
-            elif col=='HERMES':  thy = yield_thy(col, should_integrate = False, ny=10)
-            elif col=='CLAS':    thy = yield_thy(col, should_integrate = False, ny=10)
 
-        elif obs == 'AUTsinphiS':  # This is for collinear!
+    #--batch mode: one request per data set
 
-            if tar == 'p':
-                pT = None
-                FUTsinphiS = AUTsinphiS.get_FX(x, z, Q2, pT, 'p', had)
-                FUU = upol.get_FUU(x,z,Q2,pT,'p',had)
+    def setup_requests(self):
+        if 'sidis batch' not in conf or conf['sidis batch']==False:
+            return _RESIDUALS.setup_requests(self)
+        requests=[]
+        for idx in self.tabs:
+            npts=len(self.tabs[idx]['value'])
+            request={}
+            request['reaction'] = self.reaction
+            request['dataset']  = idx
+            request['irow']     = np.arange(npts)
+            request['thy']      = np.zeros(npts)
+            requests.append(request)
+        self.requests=requests
 
-            coeff = 1.
-            if col == 'HERMES':
-                # add depolarization factor for HERMES
-                coeff = np.sqrt(1.0 - y) * (2 - y) / (1 - y + 0.5 * y**2)
-            if col == 'COMPASS':
-                coeff = 1.
+    def process_request(self,request):
+        if isinstance(request['irow'],np.ndarray):
+            request['thy']=self._get_theory_batch(request['dataset'],request['irow'])
+        else:
+            _RESIDUALS.process_request(self,request)
 
-            thy = coeff * FUTsinphiS / FUU
+    def get_dependencies(self,request):
+        k=request['dataset']
+        deps=set()
+        for obs in set(self.get_labels(k,'obs',np.atleast_1d(request['irow']))):
+            if obs not in dependencies: return None
+            deps.update(self.get_tmd_dependencies(dependencies[obs]))
+        return deps
 
-        else:
-            print('ERR: exp=%d obs=%s and target=%s not implemented' % (k, obs, tar))
-            sys.exit()
+    def process_request_jac(self,request,dw):
+        """
+        derivatives of the theory along the widths directions dw in
+        request['dthy'] (None if they are not available for the request)
+        """
+        request['dthy']=None
+        if isinstance(request['irow'],np.ndarray):
+            thy,dthy=self._get_theory_batch(request['dataset'],request['irow'],dw)
+            if dthy is not None: request['thy'],request['dthy']=thy,dthy
 
-        return thy
+    def _get_theory_batch(self, k, irow, dw=None):
+        """
+        array version of _get_theory for the rows irow of data set k.
+        FUU, M, AUTcollins and AUTsivers are evaluated with the array kernels;
+        the remaining observables go row by row through _get_theory.
+        With the widths directions dw the derivatives along them are also
+        returned (None if some rows are outside the array kernels).
+        """
+        tab = self.tabs[k]
+        obs = self.get_labels(k,'obs',irow)
+        col = self.get_labels(k,'col',irow)
+        thy = np.zeros(irow.size)
+
+        batch = np.isin(obs,['FUU','M','AUTcollins','AUTsivers'])
+        if 'Q2' not in tab or not isinstance(tab['Q2'],np.ndarray): batch[:] = False
+        if dw is not None and not np.all(batch): return None, None
+        for i in np.nonzero(~batch)[0]:
+            thy[i] = self._get_theory((k,irow[i]))
+        if not np.any(batch): return thy
+
+        rows = irow[batch]
+        obs  = obs[batch]
+        col  = col[batch]
+        x    = tab['x'][rows]
+        z    = tab['z'][rows]
+        Q2   = tab['Q2'][rows]
+        pT   = tab['pT'][rows]
+        if 'y' in tab: y = tab['y'][rows]
+        else:          y = np.zeros(rows.size)
+        tar  = self.get_labels(k,'target',rows)
+        had  = self.get_labels(k,'hadron',rows)
+
+        _thy = np.zeros(rows.size)
+        if dw is not None: _dthy = np.zeros((len(dw),rows.size))
+
+        #--multiplicities use pi instead of unidentified hadrons
+        i = obs=='M'
+        if np.any(i):
+            _had = np.copy(had[i])
+            _had[_had=='h+'] = 'pi+'
+            _had[_had=='h-'] = 'pi-'
+            if dw is None: FUU = upol.get_FUU_batch(x[i],z[i],Q2[i],pT[i],tar[i],_had)
+            else: FUU, dFUU = upol.get_FUU_batch(x[i],z[i],Q2[i],pT[i],tar[i],_had,dw)
+            F2 = self.F2[k][rows[i]]
+            fac = np.ones(F2.size)
+            fac[col[i]=='HERMES']  = 2*np.pi*pT[i][col[i]=='HERMES']
+            fac[col[i]=='COMPASS'] = np.pi
+            _thy[i] = FUU / F2 * fac
+            if dw is not None: _dthy[:,i] = dFUU / F2 * fac
+
+        #--the sivers asymmetry gets FUU together with FUT below
+        i = (obs!='M') & (obs!='AUTsivers')
+        if np.any(i):
+            if dw is None: FUU = upol.get_FUU_batch(x[i],z[i],Q2[i],pT[i],tar[i],had[i])
+            else: FUU, _dthy[:,i] = upol.get_FUU_batch(x[i],z[i],Q2[i],pT[i],tar[i],had[i],dw)
+            _thy[i] = FUU
+
+        i = obs=='AUTcollins'
+        if np.any(i):
+            coeff = np.ones(np.count_nonzero(i))
+            coeff[col[i]=='COMPASS'] = -1
+            _y = y[i]
+            hermes = col[i]=='HERMES'
+            coeff[hermes] *= 2 * (1 - _y[hermes]) / (1 + (1 - _y[hermes])**2)
+            if dw is None: FUT = collins.get_FUT_batch(x[i],z[i],Q2[i],pT[i],tar[i],had[i])
+            else:
+                FUT, dFUT = collins.get_FUT_batch(x[i],z[i],Q2[i],pT[i],tar[i],had[i],dw)
+                _dthy[:,i] = coeff * (dFUT - FUT * _dthy[:,i] / _thy[i]) / _thy[i]
+            _thy[i] = coeff * FUT / _thy[i]
+
+        i = obs=='AUTsivers'
+        if np.any(i):
+            if dw is None: FUT, FUU = sivers.get_FUT_FUU_batch(x[i],z[i],Q2[i],pT[i],tar[i],had[i])
+            else:
+                FUT, FUU, dFUT, dFUU = sivers.get_FUT_FUU_batch(x[i],z[i],Q2[i],pT[i],tar[i],had[i],dw)
+                _dthy[:,i] = (dFUT - FUT * dFUU / FUU) / FUU
+            _thy[i] = FUT / FUU
+
+        thy[batch] = _thy
+        if dw is None: return thy
+        return thy, _dthy
 
     def gen_report(self, verb=1, level=1):
         """
@@ -5,6 +5,7 @@ import numpy as np
 from tools.tools import load_config
 from qcdlib.aux import AUX
 from tools.config import conf
+from obslib.sidis import upol0 as upol
 
 eu2, ed2 = 4/9., 1/9.
 e2 = []
@@ -90,6 +91,157 @@ def get_FUT(x,z,Q2,pT,tar,had):
 
       return 0.5*(get_FUT(x,z,Q2,pT,'p',had)+get_FUT(x,z,Q2,pT,'n',had))
 
+def get_FUT_FUU(x,z,Q2,pT,tar,had):
+    """
+    returns FUT and FUU of the asymmetry: the FFs and their widths, shared by
+    numerator and denominator, are sampled once and the deuteron reuses the
+    proton samples
+    """
+
+    # get collinear parts (proton and positive hadrons)
+    F = conf['sivers'].get_C(x, Q2)
+    F1 = conf['pdf'].get_C(x, Q2)
+    if   'pi' in had:  D = conf['ffpi'].get_C(z, Q2)
+    elif 'h' in had:  D = conf['ffpi'].get_C(z, Q2) + conf['ffk'].get_C(z, Q2)
+    elif  'k' in had:  D = conf['ffk'].get_C(z, Q2)
+    F[0],F1[0],D[0]=0,0,0  # set glue to zero
+
+    # get widths (proton and positive hadrons)
+    w_tar=conf['sivers'].get_widths(Q2)
+    w_tar1=conf['pdf'].get_widths(Q2)
+    if   'pi' in had: w_had=np.abs(conf['ffpi'].get_widths(Q2))
+    elif 'h' in had:  w_had=np.abs(conf['ffh'].get_widths(Q2))
+    elif 'k'  in had: w_had=np.abs(conf['ffk'].get_widths(Q2))
+
+    # build structure functions
+    if tar=='p' or tar=='d':
+        FUTp=_get_FUT(x,z,Q2,pT,'p',had,F,D,w_tar,w_had)
+        FUUp=upol._get_FUU(x,z,Q2,pT,'p',had,F1,D,w_tar1,w_had)
+        if tar=='p': return FUTp,FUUp
+
+    F,w_tar=conf['aux'].p2n(F),conf['aux'].p2n(w_tar)
+    F1,w_tar1=conf['aux'].p2n(F1),conf['aux'].p2n(w_tar1)
+    FUTn=_get_FUT(x,z,Q2,pT,'n',had,F,D,w_tar,w_had)
+    FUUn=upol._get_FUU(x,z,Q2,pT,'n',had,F1,D,w_tar1,w_had)
+    if tar=='n': return FUTn,FUUn
+
+    return 0.5*(FUTp+FUTn),0.5*(FUUp+FUUn)
+
+
+#--array versions: x,z,Q2,pT are arrays over the rows of a data set
+
+def _get_D_batch(z,Q2,had):
+
+    D=np.zeros((11,z.size))
+    w_had=np.zeros((11,z.size))
+    ipi=np.array(['pi' in _ for _ in had])
+    ih =np.array(['h'  in _ for _ in had]) & ~ipi
+    ik =np.array(['k'  in _ for _ in had]) & ~ipi & ~ih
+    if np.any(ipi):
+        D[:,ipi]    =conf['ffpi'].get_C_batch(z[ipi],Q2[ipi])
+        w_had[:,ipi]=np.abs(conf['ffpi'].get_widths_batch(Q2[ipi]))
+    if np.any(ih):
+        D[:,ih]    =conf['ffpi'].get_C_batch(z[ih],Q2[ih])+conf['ffk'].get_C_batch(z[ih],Q2[ih])
+        w_had[:,ih]=np.abs(conf['ffh'].get_widths_batch(Q2[ih]))
+    if np.any(ik):
+        D[:,ik]    =conf['ffk'].get_C_batch(z[ik],Q2[ik])
+        w_had[:,ik]=np.abs(conf['ffk'].get_widths_batch(Q2[ik]))
+    return D,w_had
+
+def _get_FUT_batch(x,z,pT,had,F,D,w_tar,w_had,dw_tar=None,dw_had=None):
+    """
+    with dw_tar,dw_had (derivatives of the widths) returns the derivative of FUT
+    """
+
+    M=conf['aux'].M
+
+    def get_sum(D,w_had,dw_had):
+        wq = z**2 * np.abs(w_tar) + np.abs(w_had)
+        K = -2 * x * z * pT * M / wq
+        gauss = np.exp(-pT**2 / wq) / (np.pi * wq)
+        if dw_tar is None: return np.einsum('i,ij->j',e2,K*F*D*gauss)
+        dwq = z**2 * dw_tar + dw_had
+        return np.einsum('i,ij->j',e2,K*F*D*gauss*(pT**2/wq-2)/wq*dwq)
+
+    if dw_tar is None: dw_had_m=None
+    else: dw_had_m=conf['aux'].charge_conj(dw_had)
+    FUTp=get_sum(D,w_had,dw_had)
+    FUTm=get_sum(conf['aux'].charge_conj(D),conf['aux'].charge_conj(w_had),dw_had_m)
+    plus =np.array([_.endswith('+') for _ in had])
+    minus=np.array([_.endswith('-') for _ in had])
+    return np.where(plus,FUTp,np.where(minus,FUTm,0.5*(FUTp+FUTm)))
+
+def get_FUT_batch(x,z,Q2,pT,tar,had):
+    """
+    x,z,Q2,pT: arrays of the same size
+    tar,had  : arrays of labels (or single labels) with tar in p,n,d
+    """
+    x=np.asarray(x,dtype=float)
+    z=np.asarray(z,dtype=float)
+    Q2=np.asarray(Q2,dtype=float)
+    pT=np.asarray(pT,dtype=float)
+    tar=np.broadcast_to(tar,x.shape)
+    had=np.broadcast_to(had,x.shape)
+
+    # get collinear parts and widths (proton and positive hadrons)
+    F=conf['sivers'].get_C_batch(x,Q2)
+    D,w_had=_get_D_batch(z,Q2,had)
+    F[0],D[0]=0,0  # set glue to zero
+    w_tar=conf['sivers'].get_widths_batch(Q2)
+
+    # build structure function
+    FUTp=_get_FUT_batch(x,z,pT,had,F,D,w_tar,w_had)
+    if np.all(tar=='p'): return FUTp
+    F=conf['aux'].p2n(F)
+    w_tar=conf['aux'].p2n(w_tar)
+    FUTn=_get_FUT_batch(x,z,pT,had,F,D,w_tar,w_had)
+    return np.where(tar=='p',FUTp,np.where(tar=='n',FUTn,0.5*(FUTp+FUTn)))
+
+def get_FUT_FUU_batch(x,z,Q2,pT,tar,had,dw=None):
+    """
+    array version of get_FUT_FUU. With the widths directions dw (see
+    upol0.get_FUU_batch) the derivatives dFUT,dFUU are also returned
+    """
+    x=np.asarray(x,dtype=float)
+    z=np.asarray(z,dtype=float)
+    Q2=np.asarray(Q2,dtype=float)
+    pT=np.asarray(pT,dtype=float)
+    tar=np.broadcast_to(tar,x.shape)
+    had=np.broadcast_to(had,x.shape)
+
+    # get collinear parts and widths (proton and positive hadrons)
+    F=conf['sivers'].get_C_batch(x,Q2)
+    F1=conf['pdf'].get_C_batch(x,Q2)
+    D,w_had=_get_D_batch(z,Q2,had)
+    F[0],F1[0],D[0]=0,0,0
+    w_tar=conf['sivers'].get_widths_batch(Q2)
+    w_tar1=conf['pdf'].get_widths_batch(Q2)
+
+    # build structure functions
+    FUTp=_get_FUT_batch(x,z,pT,had,F,D,w_tar,w_had)
+    FUUp=upol._get_FUU_batch(x,z,pT,had,F1,D,w_tar1,w_had)
+    if dw is not None:
+        dw_tar=upol._get_dw_batch('sivers',Q2,dw)
+        dw_tar1=upol._get_dw_batch('pdf',Q2,dw)
+        dw_had=upol._get_dw_had_batch(Q2,had,dw)
+        dFUTp=np.array([_get_FUT_batch(x,z,pT,had,F,D,w_tar,w_had,dw_tar[j],dw_had[j]) for j in range(len(dw))])
+        dFUUp=np.array([upol._get_FUU_batch(x,z,pT,had,F1,D,w_tar1,w_had,dw_tar1[j],dw_had[j]) for j in range(len(dw))])
+    if np.all(tar=='p'):
+        if dw is None: return FUTp,FUUp
+        return FUTp,FUUp,dFUTp,dFUUp
+    F,w_tar=conf['aux'].p2n(F),conf['aux'].p2n(w_tar)
+    F1,w_tar1=conf['aux'].p2n(F1),conf['aux'].p2n(w_tar1)
+    FUTn=_get_FUT_batch(x,z,pT,had,F,D,w_tar,w_had)
+    FUUn=upol._get_FUU_batch(x,z,pT,had,F1,D,w_tar1,w_had)
+    FUT=np.where(tar=='p',FUTp,np.where(tar=='n',FUTn,0.5*(FUTp+FUTn)))
+    FUU=np.where(tar=='p',FUUp,np.where(tar=='n',FUUn,0.5*(FUUp+FUUn)))
+    if dw is None: return FUT,FUU
+    dFUTn=np.array([_get_FUT_batch(x,z,pT,had,F,D,w_tar,w_had,conf['aux'].p2n(dw_tar[j]),dw_had[j]) for j in range(len(dw))])
+    dFUUn=np.array([upol._get_FUU_batch(x,z,pT,had,F1,D,w_tar1,w_had,conf['aux'].p2n(dw_tar1[j]),dw_had[j]) for j in range(len(dw))])
+    dFUT=np.where(tar=='p',dFUTp,np.where(tar=='n',dFUTn,0.5*(dFUTp+dFUTn)))
+    dFUU=np.where(tar=='p',dFUUp,np.where(tar=='n',dFUUn,0.5*(dFUUp+dFUUn)))
+    return FUT,FUU,dFUT,dFUU
+
 
 if __name__ == '__main__':
 
@@ -115,6 +115,109 @@ def get_FUU(x,z,Q2,pT,tar,had):
       return 0.5*(get_FUU(x,z,Q2,pT,'p',had)+get_FUU(x,z,Q2,pT,'n',had))
 
 
+#--array versions: x,z,Q2,pT are arrays over the rows of a data set
+
+def _get_D_batch(z,Q2,had):
+
+    D=np.zeros((11,z.size))
+    w_had=np.zeros((11,z.size))
+    ipi=np.array(['pi' in _ for _ in had])
+    ik =np.array(['k'  in _ for _ in had]) & ~ipi
+    ih =np.array(['h'  in _ for _ in had]) & ~ipi & ~ik
+    if np.any(ipi):
+        D[:,ipi]    =conf['ffpi'].get_C_batch(z[ipi],Q2[ipi])
+        w_had[:,ipi]=np.abs(conf['ffpi'].get_widths_batch(Q2[ipi]))
+    if np.any(ik):
+        D[:,ik]    =conf['ffk'].get_C_batch(z[ik],Q2[ik])
+        w_had[:,ik]=np.abs(conf['ffk'].get_widths_batch(Q2[ik]))
+    if np.any(ih):
+        D[:,ih]    =conf['ffpi'].get_C_batch(z[ih],Q2[ih])+conf['ffk'].get_C_batch(z[ih],Q2[ih])
+        w_had[:,ih]=np.abs(conf['ffh'].get_widths_batch(Q2[ih]))
+    return D,w_had
+
+def _get_dw_batch(dist,Q2,dw):
+    """
+    derivatives of the widths of dist along the directions dw: shape (len(dw),11,Q2.size)
+    """
+    dw_dist=np.zeros((len(dw),11,Q2.size))
+    for j in range(len(dw)):
+        if dist in dw[j]: dw_dist[j]=conf[dist].get_dwidths_batch(Q2,*dw[j][dist])
+    return dw_dist
+
+def _get_dw_had_batch(Q2,had,dw):
+
+    dw_had=np.zeros((len(dw),11,Q2.size))
+    ipi=np.array(['pi' in _ for _ in had])
+    ik =np.array(['k'  in _ for _ in had]) & ~ipi
+    ih =np.array(['h'  in _ for _ in had]) & ~ipi & ~ik
+    for dist,i in [('ffpi',ipi),('ffk',ik),('ffh',ih)]:
+        if np.any(i): dw_had[:,:,i]=_get_dw_batch(dist,Q2[i],dw)
+    return dw_had
+
+def _get_FUU_batch(x,z,pT,had,F,D,w_tar,w_had,dw_tar=None,dw_had=None):
+    """
+    with dw_tar,dw_had (derivatives of the widths) returns the derivative of FUU
+    """
+
+    def get_sum(D,w_had,dw_had):
+        if pT is not None:
+            wq = z**2 * np.abs(w_tar) + np.abs(w_had)
+            gauss = np.exp(-pT**2 / wq) / (np.pi * wq)
+        else: #for collinear
+            gauss = 1
+        if dw_tar is None: return np.einsum('i,ij->j',e2,x*F*D*gauss)
+        if pT is None: return np.zeros(x.size)
+        dwq = z**2 * dw_tar + dw_had
+        return np.einsum('i,ij->j',e2,x*F*D*gauss*(pT**2/wq-1)/wq*dwq)
+
+    if dw_tar is None: dw_had_m=None
+    else: dw_had_m=conf['aux'].charge_conj(dw_had)
+    FUUp=get_sum(D,w_had,dw_had)
+    FUUm=get_sum(conf['aux'].charge_conj(D),conf['aux'].charge_conj(w_had),dw_had_m)
+    plus =np.array([_.endswith('+') for _ in had])
+    minus=np.array([_.endswith('-') for _ in had])
+    return np.where(plus,FUUp,np.where(minus,FUUm,0.5*(FUUp+FUUm)))
+
+def get_FUU_batch(x,z,Q2,pT,tar,had,dw=None):
+    """
+    x,z,Q2 : arrays of the same size
+    pT     : array or None for collinear
+    tar,had: arrays of labels (or single labels) with tar in p,n,d
+    dw     : optional list of directions {dist:(dwidths1,dwidths2)}. The
+             derivatives of FUU along them are returned as a second output
+             with shape (len(dw),x.size)
+    """
+    x=np.asarray(x,dtype=float)
+    z=np.asarray(z,dtype=float)
+    Q2=np.asarray(Q2,dtype=float)
+    if pT is not None: pT=np.asarray(pT,dtype=float)
+    tar=np.broadcast_to(tar,x.shape)
+    had=np.broadcast_to(had,x.shape)
+
+    # get collinear parts and widths (proton and positive hadrons)
+    F=conf['pdf'].get_C_batch(x,Q2)
+    D,w_had=_get_D_batch(z,Q2,had)
+    F[0],D[0]=0,0
+    w_tar=conf['pdf'].get_widths_batch(Q2)
+
+    # build structure function
+    FUUp=_get_FUU_batch(x,z,pT,had,F,D,w_tar,w_had)
+    if dw is not None:
+        dw_tar=_get_dw_batch('pdf',Q2,dw)
+        dw_had=_get_dw_had_batch(Q2,had,dw)
+        dFUUp=np.array([_get_FUU_batch(x,z,pT,had,F,D,w_tar,w_had,dw_tar[j],dw_had[j]) for j in range(len(dw))])
+    if np.all(tar=='p'):
+        if dw is None: return FUUp
+        return FUUp,dFUUp
+    F=conf['aux'].p2n(F)
+    w_tar=conf['aux'].p2n(w_tar)
+    FUUn=_get_FUU_batch(x,z,pT,had,F,D,w_tar,w_had)
+    FUU=np.where(tar=='p',FUUp,np.where(tar=='n',FUUn,0.5*(FUUp+FUUn)))
+    if dw is None: return FUU
+    dFUUn=np.array([_get_FUU_batch(x,z,pT,had,F,D,w_tar,w_had,conf['aux'].p2n(dw_tar[j]),dw_had[j]) for j in range(len(dw))])
+    return FUU,np.where(tar=='p',dFUUp,np.where(tar=='n',dFUUn,0.5*(dFUUp+dFUUn)))
+
+
 if __name__ == '__main__':
 
     from qcdlib.pdf0 import PDF
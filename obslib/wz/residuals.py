@@ -14,6 +14,9 @@ class RESIDUALS(_RESIDUALS):
         self.tabs = conf['wz tabs']
         self.setup()
 
+    def get_dependencies(self, request):
+        return self.get_tmd_dependencies(['pdf', 'pdfpi-', 'sivers'])
+
     def _get_theory(self, entry):
         k, i = entry
         y = self.tabs[k]['y'][i]
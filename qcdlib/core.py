@@ -112,6 +112,38 @@ class CORE:
         s=np.log(Q2/conf['aux'].Q02 )
         return np.abs(self.widths1+s*self.widths2)
 
+    # batched evaluation
+
+    def get_C_batch(self,x,Q2):
+        """
+        x,Q2 arrays of the same size: returns the collinear parts with shape (11,x.size)
+        """
+        x=np.asarray(x,dtype=float)
+        Q2=np.asarray(Q2,dtype=float)
+        C=np.zeros((11,x.size))
+        for q2 in np.unique(Q2):
+            i=np.nonzero(Q2==q2)[0]
+            C[:,i]=np.transpose([self.get_C(_,q2) for _ in x[i]])
+        return C
+
+    def get_widths_batch(self,Q2):
+        """
+        Q2 array: returns the widths with shape (11,Q2.size)
+        """
+        Q2=np.asarray(Q2,dtype=float)
+        q2,inv=np.unique(Q2,return_inverse=True)
+        return np.transpose([self.get_widths(_) for _ in q2])[:,inv]
+
+    def get_dwidths_batch(self,Q2,dwidths1,dwidths2):
+        """
+        derivative of get_widths_batch along the direction (dwidths1,dwidths2)
+        of widths1 and widths2: returns shape (11,Q2.size)
+        """
+        Q2=np.asarray(Q2,dtype=float)
+        s=np.log(Q2/conf['aux'].Q02)
+        w=self.widths1[:,None]+s*self.widths2[:,None]
+        return np.sign(w)*(dwidths1[:,None]+s*dwidths2[:,None])
+
     # tmd
 
     def get_tmd(self,x,Q2,kT,hadron,dist,icol=False,deriv=False):
@@ -1,16 +1,24 @@
-import sys
+import sys,os
+import hashlib
 import numpy as np
 
 
 class DGLAP:
+
+  #--process-wide store of the evolution operators (see get_evolution_operators)
+  cache={}
  
-  def __init__(self,mell,asevo,spl,mode='truncated',order='NLO'):
+  def __init__(self,mell,asevo,spl,mode='truncated',order='NLO',cache=True):
       """
       mell  = class mellin
       asevo = class alphaS
       spl   = class splitting function 
       mode  = flag truncated,iterated
       order = flag LO,NLO,NNLO
+      cache = store the N-space operators for each (Q2ini,Q2fin,Nf) and share
+              the evolution operators between instances with the same contour,
+              splitting functions and beta coefficients (in memory and in
+              $JAM3D/qcdlib/tables/.cache)
       itermax = maximun terms in the iterated singlet evolution
       
       Nomenclature:
@@ -26,6 +34,7 @@ class DGLAP:
       if   order=='LO':   self.order=0 
       if   order=='NLO':  self.order=1
       if   order=='NNLO': self.order=2
+      self.cache=cache
       self.get_beta_matrix()
       self.get_evolution_operators()
 
@@ -155,8 +164,7 @@ class DGLAP:
               RH[Nf,HO,:,:,:] = - b[Nf,1] * RH[Nf,HO-1,:,:,:]
               RT[Nf,HO,:,:,:] =  np.copy(RH[Nf,HO,:,:,:])
               for j in range(1,HO):
-                  for k in range(Nsize):
-                      RT[Nf,HO,:,:,k]+= np.dot(RH[Nf,j,:,:,k],U1H[Nf,HO-j,:,:,k])
+                  RT[Nf,HO]+= np.einsum('ij...,jk...->ik...',RH[Nf,j],U1H[Nf,HO-j])
 
               U11=-np.einsum('ij...,jk...,kl...->il...',RP[Nf],RT[Nf,HO],RP[Nf])/HO
               U12=-np.einsum('ij...,jk...,kl...->il...',RM[Nf],RT[Nf,HO],RM[Nf])/HO
@@ -166,14 +174,74 @@ class DGLAP:
   
       return {'U':U,'rp':rp,'rm':rm,'RP':RP,'RM':RM,'U1H':U1H}
 
-  def get_evolution_operators(self):
+  def get_key(self):
+      """
+      content key of the evolution operators: contour, splitting functions
+      (all orders), beta coefficients and itermax
+      """
       spl=self.spl
-      self.EO_NSP = self.get_non_singlet_evolution_operator(spl.PNSP)
-      self.EO_NSM = self.get_non_singlet_evolution_operator(spl.PNSM)
-      self.EO_NSV = self.get_non_singlet_evolution_operator(spl.PNSV)
-      self.EO_S   = self.get_singlet_evolution_operator(spl.P)
+      key=hashlib.sha1()
+      for _ in [self.mell.N,spl.PNSP,spl.PNSM,spl.PNSV,spl.P,self.asevo.beta]:
+          key.update(np.ascontiguousarray(_).tobytes())
+      key.update(str(self.itermax).encode())
+      return key.hexdigest()
 
-  def evolve_nonsinglet(self,EO,qini,Q2ini,Q2fin,Nf):
+  def build_evolution_operators(self):
+      spl=self.spl
+      EO={}
+      EO['NSP'] = self.get_non_singlet_evolution_operator(spl.PNSP)
+      EO['NSM'] = self.get_non_singlet_evolution_operator(spl.PNSM)
+      EO['NSV'] = self.get_non_singlet_evolution_operator(spl.PNSV)
+      EO['S']   = self.get_singlet_evolution_operator(spl.P)
+      return EO
+
+  def load_evolution_operators(self,key):
+      path='%s/qcdlib/tables/.cache'%os.environ['JAM3D']
+      fname='%s/dglap-%s.npz'%(path,key)
+      if os.path.exists(fname):
+          data=np.load(fname)
+          EO={}
+          for _ in data.files:
+              label,k=_.split('_')
+              EO.setdefault(label,{})[k]=data[_]
+          return EO
+      EO=self.build_evolution_operators()
+      if not os.path.exists(path): os.makedirs(path,exist_ok=True)
+      #--atomic publish: concurrent builders of the same operators race harmlessly
+      tmp='%s/.%s-%d.npz'%(path,key,os.getpid())
+      np.savez(tmp,**{'%s_%s'%(label,k):EO[label][k] for label in EO for k in EO[label]})
+      try: os.rename(tmp,fname)
+      except OSError: os.remove(tmp)
+      return EO
+
+  def get_evolution_operators(self):
+      if self.cache:
+          key=self.get_key()
+          if key not in DGLAP.cache: DGLAP.cache[key]=self.load_evolution_operators(key)
+          EO=DGLAP.cache[key]
+      else:
+          EO=self.build_evolution_operators()
+      self.EO_NSP = dict(EO['NSP'],label='NSP')
+      self.EO_NSM = dict(EO['NSM'],label='NSM')
+      self.EO_NSV = dict(EO['NSV'],label='NSV')
+      self.EO_S   = dict(EO['S'],label='S')
+      self.operators={}
+
+  def get_operator(self,EO,Q2ini,Q2fin,Nf,singlet):
+      """
+      The operators depend only on alphaS and the splitting functions, so
+      they are reused across parameter updates
+      """
+      if not self.cache:
+          if singlet: return self.get_singlet_operator(EO,Q2ini,Q2fin,Nf)
+          else:       return self.get_nonsinglet_operator(EO,Q2ini,Q2fin,Nf)
+      key=(EO['label'],Q2ini,Q2fin,Nf,self.order,self.mode)
+      if key not in self.operators:
+          if singlet: self.operators[key]=self.get_singlet_operator(EO,Q2ini,Q2fin,Nf)
+          else:       self.operators[key]=self.get_nonsinglet_operator(EO,Q2ini,Q2fin,Nf)
+      return self.operators[key]
+
+  def get_nonsinglet_operator(self,EO,Q2ini,Q2fin,Nf):
 
       # evolve
       a = self.asevo.get_a(Q2fin)
@@ -202,10 +270,13 @@ class DGLAP:
               print('ERR(DGLAP): iterated non-singlet evolution not implemented for NNLO')
               sys.exit()
 
-      q=operator*qini
-      return q
+      return operator
 
-  def evolve_singlet(self,EO,qini,Q2ini,Q2fin,Nf):
+  def evolve_nonsinglet(self,EO,qini,Q2ini,Q2fin,Nf):
+      operator=self.get_operator(EO,Q2ini,Q2fin,Nf,False)
+      return operator*qini
+
+  def get_singlet_operator(self,EO,Q2ini,Q2fin,Nf):
 
       Nsize=self.mell.N.size
 
@@ -271,8 +342,11 @@ class DGLAP:
 
         operator=np.einsum('ij...,jk...,kl...->il...',UF,L,UM,dtype=complex)
 
-      q=np.einsum('ij...,j...->i...',operator,qini,dtype=complex)
-      return q
+      return operator
+
+  def evolve_singlet(self,EO,qini,Q2ini,Q2fin,Nf):
+      operator=self.get_operator(EO,Q2ini,Q2fin,Nf,True)
+      return np.einsum('ij...,j...->i...',operator,qini,dtype=complex)
 
   def evolve(self,BC,Q2ini,Q2fin,Nf):
 
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+import sys,os
+import numpy as np
+from tools.config import conf
+
+class EVOGRID:
+
+    def __init__(self,dist,Q2min=1.0,Q2max=1.0e3,nodes=8):
+        """
+        dist  = pdf2.PDF or ff2.FF like object providing get_Nf and get_evolved
+        Q2min = lower edge of the grid
+        Q2max = upper edge of the grid
+        nodes = number of nodes per unit of log(Q2) (at least 4 per Nf region)
+
+        Moments are evolved exactly onto the nodes once per parameter set
+        (lazily for each Nf region) and interpolated in between with cubic
+        Lagrange polynomials in log(Q2). Outside [Q2min,Q2max] the exact
+        evolution is used.
+        """
+        self.dist=dist
+        self.Q2min=Q2min
+        self.Q2max=Q2max
+        self.nodes=nodes
+        self.set_regions()
+        self.reset()
+
+    def set_regions(self):
+        edges={3:(0,self.dist.mc2),4:(self.dist.mc2,self.dist.mb2),5:(self.dist.mb2,np.inf)}
+        self.regions={}
+        for Nf in edges:
+            lo=max(self.Q2min,edges[Nf][0])
+            hi=min(self.Q2max,edges[Nf][1])
+            if lo>=hi: continue
+            n=max(4,int(np.ceil(self.nodes*np.log(hi/lo)))+1)
+            self.regions[Nf]=np.linspace(np.log(lo),np.log(hi),n)
+
+    def reset(self):
+        self.tables={}
+
+    def get_table(self,Nf):
+        if Nf not in self.tables:
+            self.tables[Nf]=[self.dist.get_evolved(np.exp(t),Nf) for t in self.regions[Nf]]
+        return self.tables[Nf]
+
+    def get_weights(self,T,t):
+        i0=np.clip(np.searchsorted(T,t)-2,0,T.size-4)
+        TT=T[i0:i0+4]
+        w=np.ones(4)
+        for j in range(4):
+            for k in range(4):
+                if k!=j: w[j]*=(t-TT[k])/(TT[j]-TT[k])
+        return i0,w
+
+    def get_moments(self,Q2):
+        Nf=self.dist.get_Nf(Q2)
+        if Q2<self.Q2min or Q2>self.Q2max or Nf not in self.regions:
+            return self.dist.get_evolved(Q2,Nf)
+        table=self.get_table(Nf)
+        i0,w=self.get_weights(self.regions[Nf],np.log(Q2))
+        result={}
+        for k in table[0]:
+            if isinstance(table[0][k],dict): continue
+            result[k]=w[0]*table[i0][k]+w[1]*table[i0+1][k]+w[2]*table[i0+2][k]+w[3]*table[i0+3][k]
+        return result
+
+    def get_error(self,Q2,x,flavs=None):
+        """
+        returns the largest deviation, in x space, between the interpolated
+        and the exact evolution at the given Q2 and x values relative to the
+        largest exact value among the flavors
+        """
+        if flavs==None: flavs=self.dist.ford
+        x=np.asarray(x,dtype=float)
+        deriv=self.dist.shape=='deriv'
+        grid =self.get_moments(Q2)
+        exact=self.dist.get_evolved(Q2,self.dist.get_Nf(Q2))
+        F0=self.dist.mellin.invert_batch(x,np.array([exact[k] for k in flavs]),deriv)
+        F1=self.dist.mellin.invert_batch(x,np.array([grid[k] for k in flavs]),deriv)
+        scale=np.amax(np.abs(F0))
+        if scale==0: return 0
+        return np.amax(np.abs(F1-F0))/scale
+
+    def gen_report(self,x=None,npts=5):
+        """
+        interpolation error at the midpoints between grid nodes
+        """
+        if x is None: x=10**np.linspace(-3,np.log10(0.9),20)
+        L=[]
+        for Nf in sorted(self.regions):
+            T=self.regions[Nf]
+            for t in 0.5*(T[1:]+T[:-1])[::max(1,(T.size-1)//npts)]:
+                Q2=np.exp(t)
+                L.append('Nf=%d  Q2=%10.3e  err=%10.3e'%(Nf,Q2,self.get_error(Q2,x)))
+        return L
+
+if __name__=='__main__':
+
+    from qcdlib.aux import AUX
+    from qcdlib.mellin import MELLIN
+    from qcdlib.alphaS import ALPHAS
+    conf['order']='LO'
+    conf['Q20'] = 1.27**2
+    conf['aux']=AUX()
+    conf['mellin']=MELLIN(npts=16)
+    conf['alphaS']=ALPHAS()
+    from qcdlib.pdf2 import PDF
+    pdf=PDF('h1')
+    for nodes in [2,4,8]:
+        grid=EVOGRID(pdf,1.0,1.0e3,nodes)
+        print('nodes per log(Q2)=%d'%nodes)
+        for l in grid.gen_report(): print(l)
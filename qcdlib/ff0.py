@@ -61,6 +61,10 @@ class FF(CORE):
         if self.hadron == 'pi' or self.hadron == 'k': return self.ff.get_f(z, Q2)
         elif self.hadron == 'h': return self.ffpi.get_f(z, Q2) + self.ffk.get_f(z, Q2)
 
+    def get_C_batch(self, z, Q2):
+        if self.hadron == 'pi' or self.hadron == 'k': return self.ff.get_f_batch(z, Q2)
+        elif self.hadron == 'h': return self.ffpi.get_f_batch(z, Q2) + self.ffk.get_f_batch(z, Q2)
+
     def get_state(self):
         return self.widths1,self.widths2
 
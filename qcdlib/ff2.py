@@ -13,6 +13,7 @@ from qcdlib.aux import AUX
 from qcdlib.dglap import DGLAP
 from qcdlib.kernels import KERNELS
 from qcdlib.mellin import MELLIN
+from qcdlib.evogrid import EVOGRID
 from scipy.integrate import quad
 
 
@@ -31,6 +32,10 @@ class FF(CORE):
         self.kernel=KERNELS(self.mellin,spl)
         self.dglap=DGLAP(self.mellin,conf['alphaS'],self.kernel,'truncated','LO')
 
+        #--optional Q2 grid for the evolved moments
+        self.evogrid=None
+        if 'evolution grid' in conf: self.evogrid=EVOGRID(self,**conf['evolution grid'])
+
         self.set_default_params()
         self.setup()
         self.ford=['g','u','ub','d','db','s','sb','c','cb','b','bb']
@@ -121,6 +126,7 @@ class FF(CORE):
         self.set_widths()
         #--store moments of a given Q2 that has been already calculated
         self.storage={}
+        if self.evogrid!=None: self.evogrid.reset()
 
     def beta(self,a,b):
         return gamma(a)*gamma(b)/gamma(a+b)
@@ -206,6 +212,7 @@ class FF(CORE):
     def set_state(self,state):
         self.widths1,self.widths2,self.BC3, self.BC4, self.BC5 = state[:]
         self.storage = {}
+        if self.evogrid!=None: self.evogrid.reset()
 
     def get_BC(self,moms):
         N=self.mellin.N
@@ -258,23 +265,29 @@ class FF(CORE):
         bm=moms['bm']
         self.BC5=self._get_BC(g,up,um,dp,dm,sp,sm,cp,cm,bp,bm,zero,zero)
 
+    def get_Nf(self,Q2):
+        if   self.mb2<Q2:  return 5
+        elif self.mc2<=Q2: return 4
+        else:              return 3
+
+    def get_evolved(self,Q2,Nf):
+        if   Nf==5: return self.dglap.evolve(self.BC5,self.mb2,Q2,5)
+        elif Nf==4: return self.dglap.evolve(self.BC4,self.mc2,Q2,4)
+        elif Nf==3: return self.dglap.evolve(self.BC3,self.Q20,Q2,3)
+
     def evolve(self,Q2):
 
         if Q2 not in self.storage:
-            if self.mb2<Q2:
-                self.storage[Q2]=self.dglap.evolve(self.BC5,self.mb2,Q2,5)
-            elif self.mc2<=Q2 and Q2<=self.mb2:
-                self.storage[Q2]=self.dglap.evolve(self.BC4,self.mc2,Q2,4)
-            elif Q2<self.mc2:
-                self.storage[Q2]=self.dglap.evolve(self.BC3,self.Q20,Q2,3)
+            if self.evogrid!=None:
+                self.storage[Q2]=self.evogrid.get_moments(Q2)
+            else:
+                self.storage[Q2]=self.get_evolved(Q2,self.get_Nf(Q2))
+            #--(flavor x N) moment matrix for batched inversion
+            self.storage[Q2]['C']=np.array([self.storage[Q2][_] for _ in self.ford])
 
     def get_xF(self,x,Q2,flav,evolve=True):
         if evolve: self.evolve(Q2)
-
-        if self.shape=='nderiv':
-            return x*self.mellin.invert(x,self.storage[Q2][flav])
-        elif self.shape=='deriv':
-            return x*self.mellin.invert_deriv(x,self.storage[Q2][flav])
+        return x*self.mellin.invert_batch(x,self.storage[Q2][flav],self.shape=='deriv')
 
     def get_xF0(self,x,flav):
         if   flav=='um': mom=self.moms0['um']
@@ -285,13 +298,24 @@ class FF(CORE):
         elif self.shape=='deriv': return x*conf['mellin'].invert_deriv(x,mom)
 
     def get_C(self,x, Q2):
+        """
+        x can be a scalar or an array: returns shape (11,)+x.shape
+        """
         self.evolve(Q2)
+        C=self.mellin.invert_batch(x,self.storage[Q2]['C'],self.shape=='deriv')
+        return np.moveaxis(C,-1,0)
 
-        if self.shape=='nderiv':
-            return np.array([self.mellin.invert(x,self.storage[Q2][_]) for _ in self.ford])
-        elif self.shape=='deriv':
-            return np.array([self.mellin.invert_deriv(x,self.storage[Q2][_]) for _ in self.ford])
-
+    def get_C_batch(self,x,Q2):
+        """
+        x,Q2 arrays of the same size: one batched inversion per distinct Q2
+        """
+        x=np.asarray(x,dtype=float)
+        Q2=np.asarray(Q2,dtype=float)
+        C=np.zeros((11,x.size))
+        for q2 in np.unique(Q2):
+            i=np.nonzero(Q2==q2)[0]
+            C[:,i]=self.get_C(x[i],q2)
+        return C
 
 if __name__ == '__main__':
 
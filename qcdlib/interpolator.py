@@ -1,4 +1,6 @@
 import sys,os
+import shutil
+import hashlib
 import numpy as np
 import pylab as py
 from scipy.interpolate import RectBivariateSpline
@@ -6,32 +8,86 @@ from scipy.interpolate import RectBivariateSpline
 
 class INTERPOLATOR:
 
-    def __init__(self,fname):
+    def __init__(self,fname,cache=True):
+        """
+        fname = lhagrid1 table at $JAM3D/qcdlib/tables/fname.dat
+        cache = keep the parsed grid in $JAM3D/qcdlib/tables/.cache
 
-        L=open('%s/qcdlib/tables/%s.dat'%(os.environ['JAM3D'],fname)).readlines()
-        x=[float(val) for val in L[3].split()]
-        Q=[float(val) for val in L[4].split()]
-        iflav=[int(val) for val in L[5].split()]
-        L=[l.split() for l in L[6:] if '---' not in l]
-        data=[[float(val) for val in l] for l in L]
-        data=np.transpose(data)
-
-        nx=len(x)
-        nQ=len(Q)
-        nf=len(iflav)
+        All flavors share the knots of the (kx,ky)=(3,4) splines in (x,Q),
+        so their coefficients are stacked into one tensor and get_f_batch
+        evaluates many (x,Q2) points for all flavors at once. Single points
+        (get_f) are cheaper through the per-flavor splines.
+        """
+        fname='%s/qcdlib/tables/%s.dat'%(os.environ['JAM3D'],fname)
+        if cache: x,Q,iflav,tables=self.load_cached(fname)
+        else:     x,Q,iflav,tables=self.load(fname)
 
         self.T={}
-
-        for i in range(nf): 
-            table=np.zeros((nx,nQ))
-            cnt=-1
-            for ix in range(nx):
-                for iQ in range(nQ):
-                    cnt+=1
-                    table[ix,iQ]=data[i][cnt]
-            self.T[iflav[i]]=RectBivariateSpline(x,Q,table,kx=3, ky=4)
+        for i in range(len(iflav)):
+            self.T[iflav[i]]=RectBivariateSpline(x,Q,tables[i],kx=3, ky=4)
 
         self.IFLAV=[21,2,-2,1,-1,3,-3,4,-4,5,-5]
+        self.setup_tensor()
+
+    #--table loading
+
+    def load(self,fname):
+        L=open(fname).readlines()
+        x=np.array(L[3].split(),dtype=float)
+        Q=np.array(L[4].split(),dtype=float)
+        iflav=np.array(L[5].split(),dtype=int)
+        data=np.array(' '.join([l for l in L[6:] if '---' not in l]).split(),dtype=float)
+        tables=np.transpose(data.reshape(x.size,Q.size,iflav.size),(2,0,1))
+        return x,Q,iflav,tables
+
+    def load_cached(self,fname):
+        path='%s/.cache'%os.path.dirname(fname)
+        with open(fname,'rb') as f: key=hashlib.sha1(f.read()).hexdigest()
+        cname='%s/%s-%s.npz'%(path,os.path.basename(fname)[:-4],key)
+        if os.path.exists(cname):
+            data=np.load(cname)
+            return data['x'],data['Q'],data['iflav'],data['tables']
+        x,Q,iflav,tables=self.load(fname)
+        if not os.path.exists(path): os.makedirs(path,exist_ok=True)
+        #--atomic publish: concurrent builders of the same table race harmlessly
+        tmp='%s/.%s-%d.npz'%(path,key,os.getpid())
+        np.savez(tmp,x=x,Q=Q,iflav=iflav,tables=tables)
+        try: os.rename(tmp,cname)
+        except OSError: os.remove(tmp)
+        return x,Q,iflav,tables
+
+    #--stacked evaluation
+
+    def setup_tensor(self):
+        T=self.T[self.IFLAV[0]]
+        self.kx,self.ky=T.degrees
+        self.tx,self.tQ=T.get_knots()
+        ncx=self.tx.size-self.kx-1
+        ncQ=self.tQ.size-self.ky-1
+        self.C=np.array([self.T[iflav].get_coeffs().reshape(ncx,ncQ) for iflav in self.IFLAV])
+
+    def get_basis(self,t,k,x):
+        """
+        the k+1 nonzero B-splines of degree k at x (clamped to the knot range
+        like fitpack): index of the first one and values with shape (k+1,x.size)
+        """
+        n=t.size-k-1
+        x=np.clip(x,t[k],t[n])
+        l=np.clip(np.searchsorted(t,x,side='right')-1,k,n-1)
+        N=np.zeros((k+1,x.size))
+        N[0]=1
+        left=np.zeros((k+1,x.size))
+        right=np.zeros((k+1,x.size))
+        for j in range(1,k+1):
+            left[j]=x-t[l+1-j]
+            right[j]=t[l+j]-x
+            saved=0
+            for r in range(j):
+                temp=N[r]/(right[r+1]+left[j-r])
+                N[r]=saved+right[r+1]*temp
+                saved=left[j-r]*temp
+            N[j]=saved
+        return l-k,N
 
     def _get_f(self,iflav,x,Q2):
         return self.T[iflav](x,Q2**0.5)[0,0]/x
@@ -39,4 +95,14 @@ class INTERPOLATOR:
     def get_f(self,x,Q2):
         return np.array([self._get_f(iflav,x,Q2) for iflav in self.IFLAV])
 
-
+    def get_f_batch(self,x,Q2):
+        """
+        x,Q2 arrays of the same size: returns shape (11,x.size)
+        """
+        x=np.asarray(x,dtype=float)
+        Q=np.asarray(Q2,dtype=float)**0.5
+        ix,Nx=self.get_basis(self.tx,self.kx,x)
+        iQ,NQ=self.get_basis(self.tQ,self.ky,Q)
+        ix=ix[:,None,None]+np.arange(self.kx+1)[None,:,None]
+        iQ=iQ[:,None,None]+np.arange(self.ky+1)[None,None,:]
+        return np.einsum('fpab,ap,bp->fp',self.C[:,ix,iQ],Nx,NQ)/x
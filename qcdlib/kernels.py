@@ -1,10 +1,21 @@
+import hashlib
 import numpy as np
 from mpmath import fp
+from scipy.special import digamma
 
 class KERNELS:
 
+    #--process-wide store of the splitting functions for each (contour,Type)
+    cache={}
+
     def __init__(self,mell,Type='f1'):
 
+        self.Type=Type
+        key=(hashlib.sha1(mell.N.tobytes()).hexdigest(),Type)
+        if key in KERNELS.cache:
+            self.D,self.PNSP,self.PNSM,self.PNSV,self.P=KERNELS.cache[key]
+            return
+
         self.D={}
         self.D['N']=mell.N
         self.D['nflav']=6+1
@@ -28,6 +39,8 @@ class KERNELS:
         elif Type=='Siv' : self.load_Siv_spl()
         elif Type=='BM' : self.load_BM_spl()
 
+        KERNELS.cache[key]=(self.D,self.PNSP,self.PNSM,self.PNSV,self.P)
+
     def set_abbreviations(self):
         D=self.D
         D['CA']=3.0
@@ -36,10 +49,7 @@ class KERNELS:
         zeta2=fp.zeta(2)
         zeta3=fp.zeta(3)
         N   = D['N']
-        psi=lambda i,_N: fp.psi(i,complex(_N.real,_N.imag))
-        S1f = lambda _N: fp.euler + psi(0,_N+1)
-        S2f = lambda _N: zeta2 - psi(1,_N+1)
-        S1 = np.array([S1f(n) for n in N])
+        S1 = np.euler_gamma + digamma(N+1)
         D['S1']=S1
 
         # Add def LO_transversity_splitting_functions(self):
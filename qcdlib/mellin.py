@@ -1,16 +1,31 @@
 #!/usr/bin/env python
 import sys,os
 import numpy as np
+from scipy.special import loggamma
+
+#--segments of the contour in z=|N-c| (beyond z=150 the gamma functions of
+#--the moments in pdf2/ff2 overflow)
+ZNODES=[0.0,0.1,0.3,0.6,1.0,1.6,2.4,3.5,5,7,10,14,19,25,32,40,50,63]
+ZEXTENDED=[70,80,90,100,110,120,130,140,150]
+
+#--(a,b) of the test functions x**a*(1-x)**b of get_error
+TESTS=[(a,b) for a in [-1.0,-0.5,0.0,1.0,2.0] for b in [2.0,3.0,6.0]]
 
 class MELLIN:
 
-    def __init__(self,npts=16,extended=True,c=None):
+    def __init__(self,npts=16,extended=True,c=None,znodes=None):
+        """
+        znodes: segments of the contour (default ZNODES, plus ZEXTENDED if
+                extended), each with npts Gauss-Legendre points
+        """
 
         #--gen z and w values along coutour
         x,w=np.polynomial.legendre.leggauss(npts)
-        znodes=[0.0,0.1,0.3,0.6,1.0,1.6,2.4,3.5,5,7,10,14,19,25,32,40,50,63]
-        if extended: znodes.extend([70,80,90,100,110,120,130,140,150])
-        #if extended: znodes.extend([70,80,90,100])
+        if znodes is None:
+            znodes=ZNODES[:]
+            if extended: znodes.extend(ZEXTENDED)
+        self.npts=npts
+        self.znodes=[float(_) for _ in znodes]
 
         Z,W,JAC=[],[],[]
         for i in range(len(znodes)-1):
@@ -24,20 +39,125 @@ class MELLIN:
         self.Z=Z
         self.JAC=np.array(JAC)
         #--gen mellin contour
-        if c==None: c=1.9
+        if c is None: c=1.9
+        self.c=c
         phi=3.0/4.0*np.pi
 
         self.N=c+Z*np.exp(complex(0,phi))
         self.phase= np.exp(complex(0,phi))
 
+        #--inversion matrices of the evaluation sites (see set_sites)
+        self.sites=None
+        self.tables={}
+
     def invert(self,x,F):
         return np.sum(np.imag(self.phase * x**(-self.N) * F)/np.pi * self.W * self.JAC)
 
     def invert_deriv(self,x,F):
         return np.sum(np.imag(self.phase * (-self.N)*x**(-self.N-1) * F)/np.pi * self.W * self.JAC)
 
+    def _get_inversion_matrix(self,x,deriv=False):
+        x=np.asarray(x,dtype=float)
+        if deriv: xN=(-self.N)*np.power.outer(x,-self.N-1)
+        else:     xN=np.power.outer(x,-self.N)
+        return xN*(self.phase*self.W*self.JAC/np.pi)
+
+    def set_sites(self,x):
+        """
+        tabulates the inversion matrices (both shapes) at the x values where
+        the distributions are evaluated during a fit (x and z of the data and
+        of the quadrature nodes). Must be called before the workers are forked
+        so that they share the tables.
+        """
+        self.sites=np.unique(np.asarray(x,dtype=float))
+        self.tables={deriv:self._get_inversion_matrix(self.sites,deriv) for deriv in [False,True]}
+
+    def get_inversion_matrix(self,x,deriv=False):
+        """
+        returns the complex weights phase*W*JAC/pi * x**(-N) (or d/dx of x**(-N) if deriv)
+        with shape x.shape+(N.size,). The matrix depends only on x and the contour
+        so it can be reused for any set of moments. If every x is a site (set_sites)
+        the rows are gathered from the tables, otherwise they are computed.
+        """
+        x=np.asarray(x,dtype=float)
+        if self.sites is not None and self.sites.size>0:
+            i=np.minimum(np.searchsorted(self.sites,x),self.sites.size-1)
+            if np.all(self.sites[i]==x): return self.tables[deriv][i]
+        return self._get_inversion_matrix(x,deriv)
+
+    def invert_batch(self,x,F,deriv=False,M=None):
+        """
+        x: scalar or array of x values
+        F: moments with shape (N.size,) or (nflav,N.size)
+        M: optional precomputed matrix from get_inversion_matrix
+        returns the inversion with shape x.shape+F.shape[:-1] using a single matmul
+        """
+        if M is None: M=self.get_inversion_matrix(x,deriv)
+        return np.imag(np.dot(M,np.transpose(F)))
+
+    def get_error(self,x,deriv=False,tests=TESTS):
+        """
+        inversion error at x of the test functions x**a*(1-x)**b (or of their
+        derivatives), whose moments B(N+a,b+1) are exact: the largest
+        |inverse-exact|/max|exact| over the tests
+        """
+        x=np.asarray(x,dtype=float)
+        M=self.get_inversion_matrix(x,deriv)
+        error=0
+        for a,b in tests:
+            F=np.exp(loggamma(self.N+a)+loggamma(b+1)-loggamma(self.N+a+b+1))
+            f=x**a*(1-x)**b
+            if deriv: f=f*(a/x-b/(1-x))
+            error=max(error,np.max(np.abs(self.invert_batch(x,F,deriv,M)-f))/np.max(np.abs(f)))
+        return error
+
+class MOMENTS:
+
+    def __init__(self,N):
+        """
+        fixed (real) moments N in place of the contour: KERNELS and DGLAP
+        only use N, so the evolution of F(N) itself is available
+        """
+        self.N=np.array(N,dtype=complex).ravel()
+
+def get_probes(x,n=64):
+    """
+    the extremes and n quantiles of the evaluation sites x (0<x<1), empty
+    if there are none
+    """
+    x=np.asarray(x,dtype=float)
+    x=x[(x>0)&(x<1)]
+    if x.size==0: return x
+    return np.unique(np.concatenate([[x.min(),x.max()],np.quantile(x,np.linspace(0,1,n))]))
+
+def gen_contour(x,tol=1e-4,deriv=True,c=None,npts=range(4,17)):
+    """
+    returns the contour with the fewest nodes whose get_error at the sites x
+    (and with deriv the error of the derivative) is below max(tol,1.1*error of
+    the default contour): where the default contour is not within tol (x->1)
+    the candidate may not be worse than it. The candidates are npts points on
+    each of the first segments of ZNODES+ZEXTENDED. Without sites x the
+    default contour is returned.
+    """
+    x=get_probes(x)
+    ref=MELLIN(16,c=c)
+    if x.size==0: return ref
+    bounds=[(False,max(tol,1.1*ref.get_error(x)))]
+    if deriv: bounds.append((True,max(tol,1.1*ref.get_error(x,True))))
+    znodes=ZNODES+ZEXTENDED
+    best=ref
+    for n in npts:
+        for k in range(2,len(znodes)+1):
+            if n*(k-1)>=best.N.size: break
+            mell=MELLIN(n,c=c,znodes=znodes[:k])
+            if all([mell.get_error(x,d)<bound for d,bound in bounds]):
+                best=mell
+                break
+    return best
+
 if __name__=='__main__':
 
+  from scipy.special import gamma
   mell=MELLIN(8)
   a=-1.8
   b=6.0
@@ -47,4 +167,5 @@ if __name__=='__main__':
   X=10**np.linspace(-5,-1,10)
   f=lambda x: x**a*(1-x)**b
   for x in X:
-      print('x=%10.4e  f=%10.4e  inv=%10.4e'%(x,f(x),mell.invert_deriv(x,mom)))
+      print('x=%10.4e  f=%10.4e  inv=%10.4e'%(x,f(x),mell.invert(x,mom)))
+  print(np.abs(mell.invert_batch(X,mom)/f(X)-1).max())
@@ -68,6 +68,9 @@ class PDF(CORE):
     def get_C(self, x, Q2):
         return self.pdf.get_f(x,Q2)
 
+    def get_C_batch(self, x, Q2):
+        return self.pdf.get_f_batch(x,Q2)
+
     def get_state(self):
         return self.widths1,self.widths2
 
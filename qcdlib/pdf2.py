@@ -12,7 +12,8 @@ from qcdlib.alphaS import ALPHAS
 from qcdlib.aux import AUX
 from qcdlib.dglap import DGLAP
 from qcdlib.kernels import KERNELS
-from qcdlib.mellin import MELLIN
+from qcdlib.mellin import MELLIN,MOMENTS
+from qcdlib.evogrid import EVOGRID
 from scipy.integrate import fixed_quad
 
 
@@ -30,6 +31,15 @@ class PDF(CORE):
         self.kernel=KERNELS(self.mellin,spl)
         self.dglap=DGLAP(self.mellin,conf['alphaS'],self.kernel,'truncated','LO')
 
+        #--first moments (see get_mom): the N=1 evolution is set up on first use
+        self.spl=spl
+        self.mellin1=MOMENTS([1])
+        self.dglap1=None
+
+        #--optional Q2 grid for the evolved moments
+        self.evogrid=None
+        if 'evolution grid' in conf: self.evogrid=EVOGRID(self,**conf['evolution grid'])
+
         self.set_default_params()
         self.setup()
         self.ford=['g','u','ub','d','db','s','sb','c','cb','b','bb']
@@ -98,21 +108,26 @@ class PDF(CORE):
 
         #for _ in sorted(self.sr): print _, self.sr[_]
 
-    def set_moms(self):
+    def gen_moms(self,N=None):
 
-        sea1=self.get_moments('sea1')
-        sea2=self.get_moments('sea2')
+        sea1=self.get_moments('sea1',N)
+        sea2=self.get_moments('sea2',N)
 
         moms={}
-        moms['g']  = self.get_moments('g1')
-        moms['up'] = self.get_moments('uv1')+2*(sea1+self.get_moments('ub1'))
-        moms['dp'] = self.get_moments('dv1')+2*(sea1+self.get_moments('db1'))
-        moms['sp'] = 2*sea2+self.get_moments('s1')+self.get_moments('sb1')
-        moms['um'] = self.get_moments('uv1')
-        moms['dm'] = self.get_moments('dv1')
-        moms['sm'] = self.get_moments('s1')-self.get_moments('sb1')
-        self.moms0=moms
-        self.get_BC(moms)
+        moms['g']  = self.get_moments('g1',N)
+        moms['up'] = self.get_moments('uv1',N)+2*(sea1+self.get_moments('ub1',N))
+        moms['dp'] = self.get_moments('dv1',N)+2*(sea1+self.get_moments('db1',N))
+        moms['sp'] = 2*sea2+self.get_moments('s1',N)+self.get_moments('sb1',N)
+        moms['um'] = self.get_moments('uv1',N)
+        moms['dm'] = self.get_moments('dv1',N)
+        moms['sm'] = self.get_moments('s1',N)-self.get_moments('sb1',N)
+        return moms
+
+    def set_moms(self):
+        self.moms0=self.gen_moms()
+        self.get_BC(self.moms0)
+        #--input moments at N=1 (evolved in get_mom)
+        self.moms1=self.gen_moms(self.mellin1.N)
 
     def set_widths(self):
         for i in range(11):
@@ -130,6 +145,9 @@ class PDF(CORE):
         self.set_widths()
         #--store moments of a given Q2 that has been already calculated
         self.storage={}
+        self.BC1=None
+        self.mom={}
+        if self.evogrid!=None: self.evogrid.reset()
 
     def beta(self,a,b):
         return gamma(a)*gamma(b)/gamma(a+b)
@@ -180,7 +198,7 @@ class PDF(CORE):
         #    return M1*mom/norm
 
     def _get_BC(self,g,up,um,dp,dm,sp,sm,cp,cm,bp,bm,tp,tm):
-        N=self.mellin.N
+        size=np.size(g)
 
         # flav composition
         vm,vp={},{}
@@ -189,8 +207,8 @@ class PDF(CORE):
         vm[15]= -3*cm + dm + sm + um
         vm[8] = dm - 2*sp + 2*(-sm + sp) + um
         vm[3] = -dm + um
-        vm[0] = np.zeros(N.size,dtype=complex)
-        vp[0] = np.zeros(N.size,dtype=complex)
+        vm[0] = np.zeros(size,dtype=complex)
+        vp[0] = np.zeros(size,dtype=complex)
         vp[3] = -dp + up
         vp[8] = dp - 2*sp + up
         vp[15]= -3*cp + dp + sp + up
@@ -198,7 +216,7 @@ class PDF(CORE):
         vp[35]= bp + cp + dp + sp - 5*tp + up
         qs    = bp + cp + dp + sp + tp + up
         qv    = bm + cm + dm + sm + tm + um
-        q     = np.zeros((2,N.size),dtype=complex)
+        q     = np.zeros((2,size),dtype=complex)
         q[0]=np.copy(qs)
         q[1]=np.copy(g)
 
@@ -210,15 +228,23 @@ class PDF(CORE):
         return BC
 
     def get_state(self):
-        return (self.widths1,self.widths2,self.BC3,self.BC4,self.BC5)
+        return (self.widths1,self.widths2,self.BC3,self.BC4,self.BC5,self.moms1)
 
     def set_state(self,state):
-        self.widths1,self.widths2,self.BC3, self.BC4, self.BC5 = state[:]
+        self.widths1,self.widths2,self.BC3, self.BC4, self.BC5, self.moms1 = state[:]
         self.storage = {}
+        self.BC1 = None
+        self.mom = {}
+        if self.evogrid!=None: self.evogrid.reset()
 
     def get_BC(self,moms):
+        self.BC3,self.BC4,self.BC5=self.gen_BC(moms,self.dglap)
 
-        N=self.mellin.N
+    def gen_BC(self,moms,dglap):
+        """
+        boundary conditions for Nf=3,4,5 at the moments N of dglap
+        """
+        N=dglap.mell.N
         zero=np.zeros(N.size,dtype=complex)
 
         ###############################################
@@ -234,11 +260,11 @@ class PDF(CORE):
         cm  = zero
         bp  = zero
         bm  = zero
-        self.BC3=self._get_BC(g,up,um,dp,dm,sp,sm,zero,zero,zero,zero,zero,zero)
+        BC3=self._get_BC(g,up,um,dp,dm,sp,sm,zero,zero,zero,zero,zero,zero)
 
         ###############################################
         # BC for Nf=4
-        BC4=self.dglap.evolve(self.BC3,self.Q20,self.mc2,3)
+        BC4=dglap.evolve(BC3,self.Q20,self.mc2,3)
         g =BC4['g']
         up=BC4['up']
         dp=BC4['dp']
@@ -252,11 +278,11 @@ class PDF(CORE):
         cm=BC4['cm']
         bm=BC4['bm']
         tm=BC4['tm']
-        self.BC4=self._get_BC(g,up,um,dp,dm,sp,sm,cp,cm,bp,bm,tp,tm)
+        BC4=self._get_BC(g,up,um,dp,dm,sp,sm,cp,cm,bp,bm,tp,tm)
 
         ###############################################
         # BC for Nf=5
-        BC5=self.dglap.evolve(self.BC4,self.mc2,self.mb2,4)
+        BC5=dglap.evolve(BC4,self.mc2,self.mb2,4)
         g =BC5['g']
         up=BC5['up']
         dp=BC5['dp']
@@ -270,27 +296,34 @@ class PDF(CORE):
         cm=BC5['cm']
         bm=BC5['bm']
         tm=BC5['tm']
-        self.BC5=self._get_BC(g,up,um,dp,dm,sp,sm,cp,cm,bp,bm,tp,tm)
+        BC5=self._get_BC(g,up,um,dp,dm,sp,sm,cp,cm,bp,bm,tp,tm)
+        return BC3,BC4,BC5
+
+    def get_Nf(self,Q2):
+        if   self.mb2<Q2:  return 5
+        elif self.mc2<=Q2: return 4
+        else:              return 3
+
+    def get_evolved(self,Q2,Nf,BC=None,dglap=None):
+        if BC==None: BC=(self.BC3,self.BC4,self.BC5)
+        if dglap==None: dglap=self.dglap
+        if   Nf==5: return dglap.evolve(BC[2],self.mb2,Q2,5)
+        elif Nf==4: return dglap.evolve(BC[1],self.mc2,Q2,4)
+        elif Nf==3: return dglap.evolve(BC[0],self.Q20,Q2,3)
 
     def evolve(self,Q2):
 
         if Q2 not in self.storage:
-            if self.mb2<Q2:
-                self.storage[Q2]=self.dglap.evolve(self.BC5,self.mb2,Q2,5)
-            elif self.mc2<=Q2 and Q2<=self.mb2:
-                self.storage[Q2]=self.dglap.evolve(self.BC4,self.mc2,Q2,4)
-            elif Q2<self.mc2:
-                self.storage[Q2]=self.dglap.evolve(self.BC3,self.Q20,Q2,3)
+            if self.evogrid!=None:
+                self.storage[Q2]=self.evogrid.get_moments(Q2)
+            else:
+                self.storage[Q2]=self.get_evolved(Q2,self.get_Nf(Q2))
+            #--(flavor x N) moment matrix for batched inversion
+            self.storage[Q2]['C']=np.array([self.storage[Q2][_] for _ in self.ford])
 
     def get_xF(self,x,Q2,flav,evolve=True):
         if evolve: self.evolve(Q2)
-
-        #return x*self.mellin.invert(x,self.storage[Q2][flav])
-        if self.shape=='nderiv':
-            return x*self.mellin.invert(x,self.storage[Q2][flav])
-
-        if self.shape=='deriv':
-            return x*self.mellin.invert_deriv(x,self.storage[Q2][flav])
+        return x*self.mellin.invert_batch(x,self.storage[Q2][flav],self.shape=='deriv')
 
     def get_xF0(self,x,flav):
         if   flav=='um': mom=self.moms0['um']
@@ -302,24 +335,44 @@ class PDF(CORE):
         if self.shape=='deriv': return x*conf['mellin'].invert_deriv(x,mom)
 
     def get_C(self,x, Q2):
+        """
+        x can be a scalar or an array: returns shape (11,)+x.shape
+        """
         self.evolve(Q2)
+        C=self.mellin.invert_batch(x,self.storage[Q2]['C'],self.shape=='deriv')
+        return np.moveaxis(C,-1,0)
 
-        #return np.array([self.mellin.invert(x,self.storage[Q2][_]) for _ in self.ford])
-        if self.shape=='nderiv':
-            return np.array([self.mellin.invert(x,self.storage[Q2][_]) for _ in self.ford])
-
-        if self.shape=='deriv':
-            return np.array([self.mellin.invert_deriv(x,self.storage[Q2][_]) for _ in self.ford])
+    def get_C_batch(self,x,Q2):
+        """
+        x,Q2 arrays of the same size: one batched inversion per distinct Q2
+        """
+        x=np.asarray(x,dtype=float)
+        Q2=np.asarray(Q2,dtype=float)
+        C=np.zeros((11,x.size))
+        for q2 in np.unique(Q2):
+            i=np.nonzero(Q2==q2)[0]
+            C[:,i]=self.get_C(x[i],q2)
+        return C
 
     def get_mom(self,Q2): #used for calculating the tensor charge for lattice data
-        mom_arr=[]
-        mom_arr.append(0.)
-        for i in [1,2,3,4,5,6]:
-            #mom_arr.append(quad(lambda x: self.get_C(x,Q2)[i], 0., 1.)[0])
-            h1=np.vectorize(lambda x: self.get_C(x,Q2)[i])
-            mom_arr.append(fixed_quad(h1, 0, 1, n=25)[0])
-
-        return np.array(mom_arr)
+        """
+        first moments of C at Q2 (flavors in self.ford): the N=1 moments evolved
+        directly (cached per Q2 until the next setup/set_state). With the
+        deriv shape C is a derivative and the x-integral is done numerically
+        """
+        if Q2 not in self.mom:
+            if self.shape=='deriv':
+                mom=fixed_quad(lambda x: self.get_C(x,Q2),0,1,n=25)[0]
+            else:
+                if self.dglap1==None:
+                    #--KERNELS also builds the unpolarized kernels, singular at N=1
+                    with np.errstate(divide='ignore',invalid='ignore'):
+                        self.dglap1=DGLAP(self.mellin1,conf['alphaS'],KERNELS(self.mellin1,self.spl),'truncated','LO')
+                if self.BC1==None: self.BC1=self.gen_BC(self.moms1,self.dglap1)
+                evolved=self.get_evolved(Q2,self.get_Nf(Q2),self.BC1,self.dglap1)
+                mom=np.array([np.real(evolved[_][0]) for _ in self.ford])
+            self.mom[Q2]=mom
+        return np.copy(self.mom[Q2])
 
 
 if __name__ == '__main__':
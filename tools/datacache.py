@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+import sys
+import os
+import shutil
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+try:
+    import cPickle
+except:
+    import _pickle as cPickle
+
+class DATACACHE:
+    """
+    Columnar on-disk cache for the xlsx tables of the database. Each workbook
+    is stored under the sha1 of its content as one .npy file per numeric
+    column (loaded memory-mapped) plus a small pickle with the column names
+    and the non-numeric columns. Cuts and modify_table are applied by the
+    readers on top of the cached table, so one cache serves every input file.
+    """
+
+    def __init__(self,path=None):
+        if path==None: path='%s/database/.cache'%os.environ['JAM3D']
+        self.path=path
+
+    def get_key(self,fname):
+        h=hashlib.sha1()
+        h.update(pd.__version__.encode())
+        with open(fname,'rb') as f: h.update(f.read())
+        return h.hexdigest()
+
+    def save(self,key,tab):
+        tmp='%s/.%s-%d'%(self.path,key,os.getpid())
+        if os.path.exists(tmp): shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        names=list(tab.columns)
+        objects={}
+        for i in range(len(names)):
+            col=tab[names[i]].to_numpy()
+            if col.dtype.kind in 'biuf': np.save('%s/c%d.npy'%(tmp,i),col)
+            else: objects[i]=col
+        with open('%s/columns.pkl'%tmp,'wb') as f:
+            cPickle.dump({'names':names,'objects':objects},f,protocol=4)
+        #--atomic publish: concurrent builders of the same table race harmlessly
+        try: os.rename(tmp,'%s/%s'%(self.path,key))
+        except OSError: shutil.rmtree(tmp)
+
+    def load(self,key):
+        path='%s/%s'%(self.path,key)
+        if not os.path.exists('%s/columns.pkl'%path): return None
+        with open('%s/columns.pkl'%path,'rb') as f: meta=cPickle.load(f)
+        names,objects=meta['names'],meta['objects']
+        data={}
+        for i in range(len(names)):
+            if i in objects: data[names[i]]=objects[i]
+            else: data[names[i]]=np.load('%s/c%d.npy'%(path,i),mmap_mode='r')
+        return pd.DataFrame(data,columns=names)
+
+    def read_excel(self,fname):
+        """
+        drop-in replacement of pd.read_excel
+        """
+        key=self.get_key(fname)
+        tab=self.load(key)
+        if tab is None:
+            tab=pd.read_excel(fname)
+            if not os.path.exists(self.path): os.makedirs(self.path)
+            self.save(key,tab)
+        return tab
+
+    def prebuild(self,root,verb=True):
+        cnt=0
+        for path,dirs,files in os.walk(root):
+            if os.path.abspath(path).startswith(os.path.abspath(self.path)): continue
+            for f in sorted(files):
+                if not f.endswith('.xlsx') or f.startswith('~$'): continue
+                fname='%s/%s'%(path,f)
+                try:
+                    self.read_excel(fname)
+                    cnt+=1
+                except Exception as e:
+                    print('\nERR %s: %s'%(fname,e))
+                if verb:
+                    sys.stdout.write('\rcached %d tables'%cnt)
+                    sys.stdout.flush()
+        if verb: print()
+        return cnt
+
+    def clean(self):
+        if os.path.exists(self.path): shutil.rmtree(self.path)
+
+if __name__=='__main__':
+
+    ap=argparse.ArgumentParser(description='prebuild the columnar cache of the xlsx tables')
+    ap.add_argument('root',nargs='?',default=None,help='directory to scan (default: $JAM3D/database)')
+    ap.add_argument('-c','--cache',default=None,help='cache directory (default: $JAM3D/database/.cache)')
+    ap.add_argument('--clean',action='store_true',help='remove the cache before building')
+    args=ap.parse_args()
+
+    root=args.root
+    if root==None: root='%s/database'%os.environ['JAM3D']
+    cache=DATACACHE(args.cache)
+    if args.clean: cache.clean()
+    cache.prebuild(root)
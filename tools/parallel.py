@@ -4,19 +4,75 @@ import time
 import random
 import zmq
 import multiprocessing
+from multiprocessing import shared_memory,resource_tracker
 import numpy as np
+import pickle as _pickle
 try:
     import dill as pickle
 except:
-    try:
-        import cPickle
-    except:
-        import _pickle as cPickle
+    pickle=_pickle
+
+class SHMSTATE:
+    """
+    Versioned shared-memory segment used to broadcast the state from the
+    master to the workers. The state is pickled with protocol 5 so that numpy
+    arrays are stored out-of-band in the segment and the workers rebuild
+    them as views on the shared memory (no copy). The master sends only
+    a small meta tuple (name,generation,ndata,buffers) with each task.
+    """
+
+    def __init__(self):
+        self.shm=None
+        self.retired=[]
+        self.generation=0
+        self.meta=None
+
+    def allocate(self,size):
+        if self.shm!=None: self.retired.append(self.shm)
+        self.shm=shared_memory.SharedMemory(create=True,size=size)
+
+    def write(self,state):
+        buffers=[]
+        data=_pickle.dumps(state,protocol=5,buffer_callback=buffers.append)
+        raws=[_.raw() for _ in buffers]
+        offsets=[]
+        offset=len(data)
+        for raw in raws:
+            offset=(offset+63)//64*64
+            offsets.append((offset,raw.nbytes))
+            offset+=raw.nbytes
+        if self.shm==None or self.shm.size<offset: self.allocate(2*max(offset,1))
+        buf=self.shm.buf
+        buf[:len(data)]=data
+        for raw,(o,n) in zip(raws,offsets): buf[o:o+n]=raw
+        self.generation+=1
+        self.meta=(self.shm.name,self.generation,len(data),offsets)
+        return self.meta
+
+    def read(self,meta):
+        name,generation,ndata,offsets=meta
+        if self.shm==None or self.shm.name!=name:
+            if self.shm!=None: self.retired.append(self.shm)
+            self.shm=shared_memory.SharedMemory(name=name)
+            #--the master owns the segment: do not let the worker unlink it at exit
+            resource_tracker.unregister(self.shm._name,'shared_memory')
+        buf=self.shm.buf
+        self.generation=generation
+        return _pickle.loads(buf[:ndata],buffers=[buf[o:o+n] for o,n in offsets])
+
+    def close(self,unlink=False):
+        for shm in self.retired+[self.shm]:
+            if shm==None: continue
+            try: shm.close()
+            except BufferError: pass #--arrays still mapped
+            if unlink: shm.unlink()
+        self.shm=None
+        self.retired=[]
 
 class PARALLEL:
 
     def __init__(self):
-        pass
+        self.shmstate=None
 
     def setup_master(self):
 
@@ -50,6 +106,9 @@ class PARALLEL:
         context = zmq.Context()
         sock = context.socket(zmq.REQ)
         sock.connect("tcp://localhost:%d"%self.port) #--IP of master
+        self.idx=idx
+        #--kept alive until the process exits since the state arrays are views on it
+        self.shmstate=SHMSTATE()
 
         while True:
             self.send(sock,{ "msg": "available",'worker':idx})
@@ -57,8 +116,12 @@ class PARALLEL:
 
             if 'task' in work: 
                 #print "running taks %d " % (work['task'])
+                #--pick up a new shared state if the generation changed
+                if 'meta' in work and work['meta'][1]!=self.shmstate.generation:
+                    self.set_state(self.shmstate.read(work['meta']))
+                t=time.time()
                 result=self.task(work['task'])
-                self.send(sock,{ "msg": "result", "result": result})
+                self.send(sock,{ "msg": "result", "result": result,'worker':idx,'time':time.time()-t,'t0':t})
                 sock.recv()
 
             elif 'state' in work:
@@ -94,6 +157,14 @@ class PARALLEL:
         #print recv
         #print worker_states
 
+    def broadcast_state(self,state):
+        """
+        alternative to update_workers: the state is written once into shared
+        memory and the workers load it with their next task
+        """
+        if self.shmstate==None: self.shmstate=SHMSTATE()
+        self.shmstate.write(state)
+
     def send_tasks(self,requests):
 
         t=time.time()
@@ -101,6 +172,8 @@ class PARALLEL:
         received=0
         ntasks=len(requests)
         results=[]
+        busy=np.zeros(self.nworkers)
+        tasks=[]
 
         while True:
 
@@ -114,7 +187,9 @@ class PARALLEL:
 
                 if sent<ntasks:
                
-                    self.send(self.sock,{'task':requests[sent]})
+                    work={'task':requests[sent]}
+                    if self.shmstate!=None: work['meta']=self.shmstate.meta
+                    self.send(self.sock,work)
                     sent+=1
 
             elif recv['msg'] == "result":
@@ -122,6 +197,8 @@ class PARALLEL:
                 received+=1
                 result=recv['result']
                 results.append(result)
+                if 'worker' in recv: busy[recv['worker']]+=recv['time']
+                if 't0' in recv: tasks.append((recv['worker'],recv['t0'],recv['time']))
                 self.send(self.sock,{})
 
                 if received==ntasks: break
@@ -129,6 +206,10 @@ class PARALLEL:
         #print 'time elapsed:',time.time()-t
         #print "all the task completed"
 
+        #--per worker busy and idle time of this round, and (worker,start,duration) of each task
+        wall=time.time()-t
+        self.stats={'wall':wall,'busy':busy,'idle':wall-busy,'tasks':tasks}
+
         return results
 
     def stop_workers(self):
@@ -156,6 +237,9 @@ class PARALLEL:
         time.sleep(1)
         self.sock.close()
 
+        #--release the shared state
+        if self.shmstate!=None: self.shmstate.close(unlink=True)
+
 def example1():
     '''
     In this example we show how use the basic distribution 
@@ -317,6 +401,47 @@ def example3():
     #print time.time()-t
     parallel.stop_workers()
 
+def example4():
+    '''
+    same as example3 but the state (numpy arrays) is broadcast 
+    through shared memory with broadcast_state
+    '''
+
+    global params
+    params={'pdf':np.zeros(3)}
+
+    def set_state(state): 
+        global params
+        params=state
+
+    ntasks=100
+    requests=[{'x':_} for _ in np.linspace(0.1,0.9,ntasks)]
+
+    def task(data):
+        global params
+        N,a,b=params['pdf']
+        data['thy']=N*data['x']**a*(1-data['x'])**b
+        return data
+
+    nworkers=4
+
+    parallel=PARALLEL()
+    parallel.task=task
+    parallel.set_state=set_state
+
+    parallel.setup_master()
+    parallel.setup_workers(nworkers)
+
+    for _ in range(5):
+        N=np.random.uniform( 0.0,1.0,1)[0]
+        state={'pdf':np.array([N,-0.5,3.0]),'big':np.random.randn(100000)}
+        parallel.broadcast_state(state)
+        results=parallel.send_tasks(requests)
+        x=results[0]['x']
+        print(N, results[0]['thy']/(x**-0.5*(1-x)**3))
+
+    parallel.stop_workers()
+
 if __name__ == "__main__":
 
     #example1()
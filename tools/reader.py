@@ -5,6 +5,7 @@ import numpy as np
 import pandas as pd
 from tools.tools import isnumeric
 from tools.config import conf
+from tools.datacache import DATACACHE
 
 
 class _READER:
@@ -23,6 +24,12 @@ class _READER:
         if reaction not in conf['datasets']:
             return None
         XLSX = conf['datasets'][reaction]['xlsx']
+        #--conf['data cache']: True (default location) or the cache directory
+        if 'data cache' in conf and conf['data cache']:
+            if conf['data cache']==True: read_excel = DATACACHE().read_excel
+            else: read_excel = DATACACHE(conf['data cache']).read_excel
+        else:
+            read_excel = pd.read_excel
         TAB = {}
         for k in XLSX:
             sys.stdout.write('\r')
@@ -30,9 +37,9 @@ class _READER:
             sys.stdout.flush()
             fname = conf['datasets'][reaction]['xlsx'][k]
             if fname.startswith('.'):
-                tab = pd.read_excel(fname)
+                tab = read_excel(fname)
             else:
-                tab = pd.read_excel('%s/database/%s' %
+                tab = read_excel('%s/database/%s' %
                                     (os.environ['JAM3D'], fname))
             tab = self.modify_table(tab,k)
             if len(tab.index)==0: continue
@@ -371,22 +371,108 @@ class _RESIDUALS:
       self.setup_requests()
       self.original=copy.deepcopy(self.tabs)
       if 'bootstrap' in conf and conf['bootstrap']: self.resample()
+      self.setup_systematics()
+      self.compile_tabs()
+
+    #--string columns normalized once per data set: the distinct labels of
+    #--each column and per-row integer codes into them
+
+    string_columns={}
+
+    def compile_tabs(self):
+        self.labels={name:[] for name in self.string_columns}
+        self.codes={}
+        for k in self.tabs:
+            npts=len(self.tabs[k]['value'])
+            self.codes[k]={}
+            for name in self.string_columns:
+                if name not in self.tabs[k]: continue
+                labels,normalize=self.labels[name],self.string_columns[name]
+                codes=np.zeros(npts,dtype=int)
+                for i in range(npts):
+                    label=normalize(self.tabs[k][name][i])
+                    if label not in labels: labels.append(label)
+                    codes[i]=labels.index(label)
+                self.codes[k][name]=codes
+
+    def get_labels(self,k,name,irow):
+        return np.array(self.labels[name],dtype=object)[self.codes[k][name][irow]]
+
+    def setup_systematics(self):
+        """
+        correlated uncertainties (other than norm) resolved once per data set:
+        the column names and their values stacked with shape (ncorr,npts)
+        """
+        self.systematics={}
+        for k in self.tabs:
+            corr = [x for x in self.tabs[k] if '_c' in x and '%' not in x and 'norm' not in x]
+            npts=len(self.tabs[k]['value'])
+            C=np.array([self.tabs[k][c] for c in corr],dtype=float).reshape(len(corr),npts)
+            self.systematics[k]={'corr':corr,'C':C}
   
     #--residuals
   
-    def _get_residuals(self,k):
-
-        npts=len(self.tabs[k]['value'])
-        exp=self.tabs[k]['value']
+    def _get_thy(self,k):
 
         if  k in conf['datasets'][self.reaction]['norm']:
             norm=conf['datasets'][self.reaction]['norm'][k]['value']
         else:
             norm=1.0
 
-        thy=self.tabs[k]['thy']/norm
+        return self.tabs[k]['thy']/norm
+
+    def get_nuisance(self,K):
+        """
+        nuisance parameters of the correlated uncertainties for the data sets K.
+        A=1+beta.W.beta^T is symmetric positive definite: the systems of all data
+        sets with the same number of sources are solved at once by Cholesky.
+        Data sets whose system cannot be factorized get r=0.
+        """
+        groups={}
+        for k in K:
+            C=self.systematics[k]['C']
+            ncorr=C.shape[0]
+            if ncorr==0: continue
+            exp=self.tabs[k]['value']
+            thy=self._get_thy(k)
+            alpha=self.tabs[k]['alpha']
+            beta=C*(thy/(exp+1e-100))
+            w=1/alpha**2
+            A=np.eye(ncorr)+np.einsum('ki,li,i->kl',beta,beta,w)
+            B=np.einsum('ki,i,i->k',beta,exp-thy,w)
+            if ncorr not in groups: groups[ncorr]=([],[],[])
+            groups[ncorr][0].append(k)
+            groups[ncorr][1].append(A)
+            groups[ncorr][2].append(B)
+
+        R={}
+        for ncorr in groups:
+            ks,A,B=groups[ncorr]
+            A,B=np.array(A),np.array(B)
+            try:
+                r=self.cho_solve(A,B)
+            except np.linalg.LinAlgError:
+                r=np.zeros(B.shape)
+                for i in range(len(ks)):
+                    try: r[i]=self.cho_solve(A[i:i+1],B[i:i+1])[0]
+                    except np.linalg.LinAlgError: pass
+            for i in range(len(ks)): R[ks[i]]=r[i]
+        return R
+
+    def cho_solve(self,A,B):
+        L=np.linalg.cholesky(A)
+        y=np.linalg.solve(L,B[...,None])
+        return np.linalg.solve(np.swapaxes(L,-1,-2),y)[...,0]
+
+    def _get_residuals(self,k,r=None):
+        """
+        r: nuisance parameters if already known (see get_nuisance)
+        """
+
+        exp=self.tabs[k]['value']
+        thy=self._get_thy(k)
         alpha=self.tabs[k]['alpha']
-        corr = [x for x in self.tabs[k] if '_c' in x and '%' not in x and 'norm' not in x]
+        corr=self.systematics[k]['corr']
         N=np.ones(exp.size)
         ncorr=len(corr)
 
@@ -399,13 +485,8 @@ class _RESIDUALS:
 
         else:
 
-            beta=[self.tabs[k][c] * (thy/(exp+1e-100)) for c in corr]
-            A=np.diag(np.diag(np.ones((ncorr,ncorr)))) + np.einsum('ki,li,i->kl',beta,beta,1/alpha**2)
-            B=np.einsum('ki,i,i->k',beta,exp-thy,1/alpha**2)
-            try:
-                r=np.einsum('kl,l->k',np.linalg.inv(A),B)
-            except:
-                r=np.zeros(len(beta))
+            if r is None: r=self.get_nuisance([k])[k]
+            beta=self.systematics[k]['C']*(thy/(exp+1e-100))
             shift=np.einsum('k,ki->i',r,beta)
             for i in range(ncorr):
                 conf['rparams'][self.reaction][k][corr[i]]['value']=r[i]
@@ -441,8 +522,9 @@ class _RESIDUALS:
 
         if calc: self.get_theory()
 
+        R=self.get_nuisance(self.tabs)
         for k in self.tabs: 
-            res=np.append(res,self._get_residuals(k))
+            res=np.append(res,self._get_residuals(k,R.get(k)))
             rres=np.append(rres,self._get_rres(k))
             nres=np.append(nres,self._get_nres(k))
         return res,rres,nres
@@ -486,6 +568,24 @@ class _RESIDUALS:
         entry=(request['dataset'],request['irow'])
         request['thy']=self._get_theory(entry)
 
+    def get_dependencies(self,request):
+        """
+        parameters used by the request as a set of tokens: 'dist' for the
+        collinear parameters of conf['params'][dist] and 'dist:widths' for its
+        widths. None: all of them
+        """
+        return None
+
+    def get_sites(self):
+        """
+        x and z values where the collinear distributions are evaluated
+        (see MELLIN.set_sites); sites that are missing are inverted on the fly
+        """
+        return np.zeros(0)
+
+    def get_tmd_dependencies(self,dists):
+        return set(dists+[_+':widths' for _ in dists])
+
     def update_tabs_local(self):
 
         for i  in range(len(self.requests)):
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+import sys,os
+import time
+import json
+import numpy as np
+
+class TIMELINE:
+    """
+    wall time spans (name,category,thread) of a fit. The totals per
+    (category,name) and per thread are always kept; the individual spans
+    only up to maxevents. Times are time.time() so that the spans measured
+    by the workers on the same node share the clock of the master.
+
+    categories used by RESMAN/MAXLIKE:
+      state      : get_state and state distribution to the workers
+      dispatch   : send_tasks on the master (tasks out, results in)
+      task       : one task (chunk of requests) on a worker
+      theory     : one request on a worker (name = reaction:observable)
+      residuals  : theory tables update and residual assembly on the master
+      jacobian   : get_jacobian on the master
+      optimizer  : master time outside get_residuals/get_jacobian
+    """
+
+    def __init__(self,maxevents=1000000):
+        self.maxevents=maxevents
+        self.t0=time.time()
+        self.events=[]
+        self.totals={}
+        self.threads={}
+
+    def add(self,cat,name,t,dt,tid='master',args=None):
+        key=(cat,name)
+        if key not in self.totals: self.totals[key]=[0,0.0]
+        self.totals[key][0]+=1
+        self.totals[key][1]+=dt
+        if tid not in self.threads: self.threads[tid]={}
+        self.threads[tid][cat]=self.threads[tid].get(cat,0)+dt
+        if len(self.events)<self.maxevents: self.events.append((cat,name,t,dt,tid,args))
+
+    def span(self,cat,name,t,tid='master',args=None):
+        """
+        records the span from t to now and returns now
+        """
+        now=time.time()
+        self.add(cat,name,t,now-t,tid,args)
+        return now
+
+    def gen_report(self):
+        L=[]
+        wall=time.time()-self.t0
+        L.append('timeline: wall=%.3f[s]  spans=%d (stored %d)'%(wall,sum([_[0] for _ in self.totals.values()]),len(self.events)))
+        L.append('%10s %28s %9s %12s %12s %7s'%('category','name','count','total[s]','mean[ms]','%wall'))
+        for cat,name in sorted(self.totals):
+            n,total=self.totals[(cat,name)]
+            L.append('%10s %28s %9d %12.3f %12.3f %7.1f'%(cat,name,n,total,total/n*1e3,100*total/wall))
+        cats=sorted(set([cat for cat,name in self.totals]))
+        L.append('%10s '%'thread'+' '.join(['%12s'%_ for _ in cats]))
+        for tid in sorted(self.threads,key=str):
+            L.append('%10s '%tid+' '.join(['%12.3f'%self.threads[tid].get(_,0) for _ in cats]))
+        return L
+
+    def save(self,fname):
+        """
+        Chrome trace format (chrome://tracing, ui.perfetto.dev)
+        """
+        tids=sorted(set([_[4] for _ in self.events]),key=lambda _: (_!='master',str(_)))
+        tids={tids[i]:i for i in range(len(tids))}
+        trace=[]
+        for tid in tids:
+            trace.append({'name':'thread_name','ph':'M','pid':0,'tid':tids[tid],'args':{'name':str(tid)}})
+        for cat,name,t,dt,tid,args in self.events:
+            event={'name':name,'cat':cat,'ph':'X','pid':0,'tid':tids[tid]}
+            event['ts']=(t-self.t0)*1e6
+            event['dur']=dt*1e6
+            if args!=None: event['args']=args
+            trace.append(event)
+        tmp='%s.tmp'%fname
+        with open(tmp,'w') as f: json.dump({'traceEvents':trace,'displayTimeUnit':'ms'},f)
+        os.replace(tmp,fname)
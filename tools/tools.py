@@ -9,6 +9,8 @@ try:
 except:
     import _pickle as cPickle
 import zlib
+import struct
+import fcntl
 
 
 def checkdir(path):
@@ -21,12 +23,15 @@ def tex(x):
 
 def save(data,name):  
   compressed=zlib.compress(cPickle.dumps(data))
-  f=open(name,"wb")
+  #--write aside and rename: readers never see a partial file
+  tmp='%s.tmp-%d'%(name,os.getpid())
+  f=open(tmp,"wb")
   try:
       f.writelines(compressed)
   except:
       f.write(compressed)
   f.close()
+  os.replace(tmp,name)
 
 
 def load(name):
@@ -35,6 +40,63 @@ def load(name):
     return data
 
 
+def append(data,name):
+    """
+    append one record to an append-only file (see load_records). Concurrent
+    writers are serialized with a file lock
+    """
+    compressed=zlib.compress(cPickle.dumps(data))
+    with open(name,'ab') as f:
+        fcntl.flock(f,fcntl.LOCK_EX)
+        f.write(struct.pack('<Q',len(compressed))+compressed)
+        f.flush()
+        fcntl.flock(f,fcntl.LOCK_UN)
+
+
+def read_records(f):
+    """
+    records of an open file written by append and the offset after the last
+    complete one. A record cut by a crash, or one that fails to decompress
+    or unpickle, ends the list
+    """
+    records,offset=[],0
+    while 1:
+        head=f.read(8)
+        if len(head)<8: break
+        size=struct.unpack('<Q',head)[0]
+        body=f.read(size)
+        if len(body)<size: break
+        try: records.append(cPickle.loads(zlib.decompress(body)))
+        except Exception: break
+        offset=f.tell()
+    return records,offset
+
+
+def load_records(name):
+    """
+    records written by append and the offset after the last complete one
+    (see read_records)
+    """
+    if not os.path.exists(name): return [],0
+    with open(name,'rb') as f:
+        return read_records(f)
+
+
+def truncate_records(name):
+    """
+    drops whatever follows the last complete record, so that append
+    continues the file cleanly after a crash: returns the complete records
+    """
+    if not os.path.exists(name): return []
+    with open(name,'r+b') as f:
+        fcntl.flock(f,fcntl.LOCK_EX)
+        records,offset=read_records(f)
+        f.truncate(offset)
+        f.flush()
+        fcntl.flock(f,fcntl.LOCK_UN)
+    return records
+
+
 def isnumeric(value):
     try:
         int(value)